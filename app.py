@@ -1,30 +1,41 @@
 import os
+import io
+import base64
+import csv
+import time
+import queue
 import sqlite3
+import threading
 import datetime
 import json
-from flask import Flask, request, jsonify, send_from_directory, session, redirect
+import re
+from flask import Flask, Response, request, jsonify, send_from_directory, session, redirect, stream_with_context
+from db import get_db, get_pool, release_db
+import metrics
+import slow_queries
+import backup_excel
+import snapshots
+import locks
 
 # Initialize Flask App
 app = Flask(__name__, static_url_path='', static_folder='static')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev_secret_key_keep_it_safe')
 
-# Railway Persistent Storage Logic
-if os.environ.get('DB_PATH'):
-    DB_FILE = os.environ.get('DB_PATH')
-elif os.path.exists('/app/data'):
-    DB_FILE = '/app/data/canteen.db'
-else:
-    DB_FILE = 'canteen.db'
+# Meal prices for hostel accounts (monthly report and student summary costs)
+MEAL_PRICES = {'breakfast': 20, 'lunch': 40, 'dinner': 40}
 
-print(f"Using Database File: {DB_FILE}")
+# Pooled connections; returned to the pool at the end of every request
+app.teardown_appcontext(release_db)
 
-# --- Database Helper ---
-def get_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Per-route latency and SQL counters, served at /api/metrics
+metrics.init_app(app)
+
+# Scheduled online snapshots of the database, listed at /api/admin/snapshots
+snapshots.init_app(app, lambda: get_pool().db_file)
 
 def init_db():
+    # The file may have been removed or replaced: start from fresh connections
+    get_pool().close_all()
     try:
         conn = get_db()
         c = conn.cursor()
@@ -39,7 +50,8 @@ def init_db():
                      payment_status TEXT DEFAULT 'Unpaid',
                      payment_mode TEXT DEFAULT 'Cash',
                      amount_paid INTEGER DEFAULT 0,
-                     remaining_amount REAL DEFAULT 0
+                     remaining_amount REAL DEFAULT 0,
+                     row_version INTEGER DEFAULT 0
                      )''')
 
         # Migration: Add phone column if missing
@@ -77,6 +89,9 @@ def init_db():
                      breakfast INTEGER DEFAULT 0,
                      lunch INTEGER DEFAULT 0,
                      dinner INTEGER DEFAULT 0,
+                     breakfast_price REAL,
+                     lunch_price REAL,
+                     dinner_price REAL,
                      FOREIGN KEY(student_id) REFERENCES students(id))''')
 
         # Payments Table (Historical)
@@ -101,7 +116,8 @@ def init_db():
                      name TEXT NOT NULL,
                      dept TEXT,
                      phone TEXT,
-                     created_at TEXT
+                     created_at TEXT,
+                     row_version INTEGER DEFAULT 0
                      )''')
 
         # Staff Transactions (New Feature)
@@ -141,7 +157,12 @@ def init_db():
                      operator_id INTEGER,
                      amount REAL,
                      details TEXT,
-                     payment_mode TEXT
+                     payment_mode TEXT,
+                     user_type TEXT,
+                     student_id INTEGER,
+                     guest_name TEXT,
+                     meal_type TEXT,
+                     reversed INTEGER NOT NULL DEFAULT 0
                      )''')
 
                      # Student Transactions Table (For Payment History)
@@ -166,6 +187,17 @@ def init_db():
             if 'payment_mode' not in bill_cols:
                 print("Migrating: Adding payment_mode column to bills table...")
                 c.execute("ALTER TABLE bills ADD COLUMN payment_mode TEXT DEFAULT 'Cash'")
+
+            # Migration: Promote the details JSON to typed columns
+            detail_cols = [('user_type', 'TEXT'), ('student_id', 'INTEGER'), ('guest_name', 'TEXT'), ('meal_type', 'TEXT')]
+            for name, col_type in detail_cols:
+                if name not in bill_cols:
+                    print(f"Migrating: Adding {name} column to bills table...")
+                    c.execute(f"ALTER TABLE bills ADD COLUMN {name} {col_type}")
+            # Migration: Account bills voided by a transaction reversal stay, flagged
+            if 'reversed' not in bill_cols:
+                print("Migrating: Adding reversed column to bills table...")
+                c.execute("ALTER TABLE bills ADD COLUMN reversed INTEGER NOT NULL DEFAULT 0")
                 
             # Migration: Ensure 'type' in student_transactions
             c.execute("PRAGMA table_info(student_transactions)")
@@ -178,6 +210,147 @@ def init_db():
                 c.execute("ALTER TABLE student_transactions ADD COLUMN remarks TEXT")
                 
         except Exception as e: print(f"Migration Error (Bills/Trans): {e}")
+
+        # Migration: Meals keep the unit price each meal was billed at
+        try:
+            c.execute("PRAGMA table_info(meals)")
+            meal_cols = [info[1] for info in c.fetchall()]
+            for meal in MEAL_PRICES:
+                if f'{meal}_price' not in meal_cols:
+                    print(f"Migrating: Adding {meal}_price column to meals table...")
+                    c.execute(f"ALTER TABLE meals ADD COLUMN {meal}_price REAL")
+        except Exception as e: print(f"Migration Error (Meals): {e}")
+
+        # One-time data migrations, recorded once they complete: one that fails runs again on the next start
+        c.execute('''CREATE TABLE IF NOT EXISTS migrations (
+                     name TEXT PRIMARY KEY,
+                     applied_at TEXT NOT NULL
+                     )''')
+        try:
+            c.execute("SELECT 1 FROM migrations WHERE name = 'bill_detail_columns'")
+            if not c.fetchone():
+                backfill_bill_columns(c)
+                c.execute("INSERT INTO migrations (name, applied_at) VALUES ('bill_detail_columns', ?)",
+                          (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+                conn.commit()
+        except Exception as e: print(f"Migration Error (Bill details): {e}")
+        try:
+            c.execute("SELECT 1 FROM migrations WHERE name = 'meal_prices'")
+            if not c.fetchone():
+                backfill_meal_prices(c)
+                c.execute("INSERT INTO migrations (name, applied_at) VALUES ('meal_prices', ?)",
+                          (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+                conn.commit()
+        except Exception as e: print(f"Migration Error (Meal prices): {e}")
+
+        # Delta Sync: change versions for the operator roster
+        try:
+            for table in ('students', 'staff'):
+                c.execute(f"PRAGMA table_info({table})")
+                if 'row_version' not in [info[1] for info in c.fetchall()]:
+                    print(f"Migrating: Adding row_version column to {table}...")
+                    c.execute(f"ALTER TABLE {table} ADD COLUMN row_version INTEGER DEFAULT 0")
+        except Exception as e: print(f"Migration Error (Sync): {e}")
+
+        c.execute('''CREATE TABLE IF NOT EXISTS sync_state (
+                     id INTEGER PRIMARY KEY CHECK (id = 1),
+                     version INTEGER NOT NULL DEFAULT 0
+                     )''')
+        c.execute("INSERT OR IGNORE INTO sync_state (id, version) VALUES (1, 0)")
+
+        # Deleted rows, so delta clients can drop them from their lists
+        c.execute('''CREATE TABLE IF NOT EXISTS sync_tombstones (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     entity TEXT NOT NULL,
+                     entity_id INTEGER NOT NULL,
+                     version INTEGER NOT NULL
+                     )''')
+
+        # Indexes for the hot lookups (reports, balances, meal upserts, delta sync)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_meals_student_date ON meals(student_id, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_meals_date ON meals(date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_bills_date ON bills(date)")
+        # Superseded by idx_bills_student_direct; bill lookups by exact date use idx_bills_date
+        c.execute("DROP INDEX IF EXISTS idx_bills_student_date")
+        # Cash/UPI purchases of a student, in date order, for the paged report history
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_bills_student_direct ON bills(student_id, date)
+                     WHERE (payment_mode IS NULL OR payment_mode != 'Account')
+                       AND (user_type IS NULL OR user_type != 'staff')''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_student_tx_student_date ON student_transactions(student_id, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_student_tx_student_type_date ON student_transactions(student_id, type, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_staff_tx_staff_type ON staff_transactions(staff_id, type, amount)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_staff_tx_staff_date ON staff_transactions(staff_id, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_students_row_version ON students(row_version)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_tombstones_entity_version ON sync_tombstones(entity, version)")
+
+        # Free-list of student ids left behind by deletes (lowest one is reused first)
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='student_free_ids'")
+        free_ids_exists = c.fetchone() is not None
+        c.execute("CREATE TABLE IF NOT EXISTS student_free_ids (id INTEGER PRIMARY KEY)")
+        if not free_ids_exists:
+            print("Migrating: Recording existing gaps in student ids...")
+            c.execute('''WITH RECURSIVE seq(x) AS (
+                             SELECT 1 WHERE EXISTS (SELECT 1 FROM students)
+                             UNION ALL
+                             SELECT x + 1 FROM seq WHERE x < (SELECT MAX(id) FROM students)
+                         )
+                         INSERT INTO student_free_ids (id)
+                         SELECT x FROM seq WHERE NOT EXISTS (SELECT 1 FROM students WHERE id = seq.x)''')
+
+        # Daily Sales Rollup (live stats) of the bills not reversed, kept in step by create_bill and reversals
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='daily_stats'")
+        daily_stats_exists = c.fetchone() is not None
+        c.execute('''CREATE TABLE IF NOT EXISTS daily_stats (
+                     date TEXT NOT NULL,
+                     meal_type TEXT NOT NULL DEFAULT '',
+                     payment_mode TEXT NOT NULL DEFAULT '',
+                     user_type TEXT NOT NULL DEFAULT '',
+                     count INTEGER NOT NULL DEFAULT 0,
+                     revenue REAL NOT NULL DEFAULT 0,
+                     PRIMARY KEY (date, meal_type, payment_mode, user_type)
+                     )''')
+        if not daily_stats_exists:
+            print("Migrating: Building daily_stats from existing bills...")
+            rebuild_daily_stats(c)
+
+        # Bumped with every daily_stats change, so stats streams in any worker can tell something moved
+        c.execute('''CREATE TABLE IF NOT EXISTS stats_state (
+                     id INTEGER PRIMARY KEY CHECK (id = 1),
+                     version INTEGER NOT NULL DEFAULT 0
+                     )''')
+        c.execute("INSERT OR IGNORE INTO stats_state (id, version) VALUES (1, 0)")
+
+        # Monthly Meal Rollup (per student per month), kept in step with meals by triggers
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='monthly_meals'")
+        monthly_meals_exists = c.fetchone() is not None
+        c.execute('''CREATE TABLE IF NOT EXISTS monthly_meals (
+                     month TEXT NOT NULL,
+                     student_id INTEGER NOT NULL,
+                     days INTEGER NOT NULL DEFAULT 0,
+                     breakfast INTEGER NOT NULL DEFAULT 0,
+                     lunch INTEGER NOT NULL DEFAULT 0,
+                     dinner INTEGER NOT NULL DEFAULT 0,
+                     cost REAL NOT NULL DEFAULT 0,
+                     PRIMARY KEY (month, student_id)
+                     )''')
+        if not monthly_meals_exists:
+            print("Migrating: Building monthly_meals from existing meals...")
+            c.execute(f'''INSERT INTO monthly_meals (month, student_id, days, breakfast, lunch, dinner, cost)
+                          SELECT substr(date, 1, 7), student_id, COUNT(*), SUM(COALESCE(breakfast, 0)),
+                                 SUM(COALESCE(lunch, 0)), SUM(COALESCE(dinner, 0)), SUM({meal_cost_sql('')})
+                          FROM meals WHERE student_id IS NOT NULL
+                          GROUP BY 1, 2''')
+        create_meal_rollup_triggers(c)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_monthly_meals_student ON monthly_meals(student_id, month)")
+
+        # Idempotency keys sent with bills, so a retried request returns the original bill
+        c.execute('''CREATE TABLE IF NOT EXISTS bill_keys (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     key TEXT NOT NULL UNIQUE,
+                     bill_no TEXT NOT NULL,
+                     created_at REAL NOT NULL
+                     )''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_bill_keys_created ON bill_keys(created_at)")
         
         # Create Default Admin if not exists
         c.execute("SELECT id FROM operators WHERE username='admin'")
@@ -199,6 +372,269 @@ def init_db():
     except Exception as e:
         print(f"Init DB Error: {e}")
 
+def backfill_bill_columns(c, chunk_size=5000):
+    """Copy user_type/student_id/guest_name/meal_type out of bills.details.
+
+    Only bills with none of them set yet, so a rerun after a failure skips the done part.
+    """
+    last_id = 0
+    while True:
+        c.execute("""SELECT id, details FROM bills
+                     WHERE id > ? AND details IS NOT NULL
+                       AND user_type IS NULL AND student_id IS NULL AND guest_name IS NULL AND meal_type IS NULL
+                     ORDER BY id LIMIT ?""", (last_id, chunk_size))
+        rows = c.fetchall()
+        if not rows: break
+        updates = []
+        for row in rows:
+            try:
+                d = json.loads(row['details']) if row['details'] else {}
+            except ValueError:
+                continue
+            if not isinstance(d, dict):
+                continue  # e.g. a bare number or list: nothing to copy
+            updates.append((d.get('user_type'), to_id(d.get('student_id')), d.get('guest_name'), d.get('meal_type'), row['id']))
+        c.executemany("UPDATE bills SET user_type=?, student_id=?, guest_name=?, meal_type=? WHERE id=?", updates)
+        last_id = rows[-1]['id']
+    print(f"Migrated bill details up to bill id {last_id}")
+
+def to_id(value):
+    """Ids arrive as ints or numeric strings from the frontend; store them as INTEGER."""
+    if value is None or value == '': return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+# --- Daily Stats Rollup ---
+def rebuild_daily_stats(c):
+    """Recompute daily_stats from scratch: every bill that has not been reversed."""
+    c.execute("DELETE FROM daily_stats")
+    c.execute('''INSERT INTO daily_stats (date, meal_type, payment_mode, user_type, count, revenue)
+                 SELECT substr(date, 1, 10), COALESCE(meal_type, ''), COALESCE(payment_mode, ''),
+                        COALESCE(user_type, ''), COUNT(*), COALESCE(SUM(amount), 0)
+                 FROM bills WHERE date IS NOT NULL AND reversed = 0
+                 GROUP BY 1, 2, 3, 4''')
+
+def add_daily_stats(c, date_str, meal_type, payment_mode, user_type, count, revenue):
+    """Adjust one daily_stats cell; call in the same transaction as the bill change."""
+    c.execute('''INSERT INTO daily_stats (date, meal_type, payment_mode, user_type, count, revenue)
+                 VALUES (?, ?, ?, ?, ?, ?)
+                 ON CONFLICT(date, meal_type, payment_mode, user_type)
+                 DO UPDATE SET count = count + excluded.count, revenue = revenue + excluded.revenue''',
+              (date_str[:10], meal_type or '', payment_mode or '', user_type or '', count, revenue or 0))
+    c.execute("UPDATE stats_state SET version = version + 1 WHERE id = 1")
+
+def meal_stats(c, day):
+    """Meal counts and revenue for one day, from the daily_stats rollup."""
+    # One primary-key range, however many bills
+    c.execute("SELECT meal_type, SUM(count) AS cnt, SUM(revenue) AS revenue FROM daily_stats WHERE date = ? GROUP BY meal_type",
+              (day,))
+
+    counts = {'Breakfast': 0, 'Lunch': 0, 'Dinner': 0}
+    total_revenue = 0.0
+
+    for r in c.fetchall():
+        total_revenue += r['revenue'] or 0
+        # Frontend sends Title Case meal types
+        if r['meal_type'] in counts:
+            counts[r['meal_type']] = r['cnt']
+
+    return {
+        'Breakfast': counts['Breakfast'],
+        'Lunch': counts['Lunch'],
+        'Dinner': counts['Dinner'],
+        'revenue': total_revenue
+    }
+
+# --- Live Stats Stream ---
+# Each open page holds a request (and its worker thread) for up to
+# STATS_STREAM_MAX_SECONDS, which a sync gunicorn worker cannot spare, so the
+# stream is opt-in; asgi.py turns it on. When off, pages poll as before.
+STATS_STREAM = os.environ.get('STATS_STREAM', '0') == '1'
+STATS_POLL_SECONDS = float(os.environ.get('STATS_POLL_SECONDS', 1))  # how soon other workers' bills show up
+STATS_KEEPALIVE_SECONDS = 15
+STATS_STREAM_MAX_SECONDS = int(os.environ.get('STATS_STREAM_MAX_SECONDS', 300))  # EventSource reconnects after this
+
+class StatsBroadcaster:
+    """Per-process fan-out of today's meal stats to /api/stream/stats clients.
+
+    One background thread watches stats_state.version (bumped by every
+    daily_stats change in any worker) and the date, recomputes the stats
+    once per change and wakes every waiting stream with the same payload.
+    The thread only polls while at least one stream is connected.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.wake = threading.Event()
+        self.subscribers = 0
+        self.key = None  # (date, version) the payload was computed for
+        self.payload = None
+        self.seq = 0
+        self.thread = None
+
+    def notify(self):
+        """Recompute now instead of at the next poll (call after committing a bill change)."""
+        self.wake.set()
+
+    def subscribe(self):
+        with self.cond:
+            self.subscribers += 1
+            # Threads do not survive a fork, so a gunicorn worker starts its own
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='stats-broadcaster', daemon=True)
+                self.thread.start()
+        self.wake.set()
+
+    def unsubscribe(self):
+        with self.cond:
+            self.subscribers -= 1
+
+    def wait(self, seq, timeout):
+        """Block until a payload newer than seq exists (or timeout); returns (seq, payload)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != seq, timeout)
+            return self.seq, self.payload
+
+    def run(self):
+        while True:
+            self.wake.wait(STATS_POLL_SECONDS if self.subscribers else None)
+            self.wake.clear()
+            if not self.subscribers:
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Stats Stream Error: {e}")
+
+    def refresh(self):
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            today = datetime.date.today().isoformat()
+            c.execute("SELECT version FROM stats_state WHERE id = 1")
+            key = (today, c.fetchone()[0])
+            if key == self.key:
+                return
+            payload = json.dumps(meal_stats(c, today))
+        finally:
+            conn.close()
+        with self.cond:
+            self.key, self.payload = key, payload
+            self.seq += 1
+            self.cond.notify_all()
+
+stats_broadcaster = StatsBroadcaster()
+
+# --- Delta Sync Helpers ---
+# Every change to a students/staff row stamps it with the next value of a
+# single counter, so clients can ask for "everything after version N".
+def next_version(c):
+    c.execute("UPDATE sync_state SET version = version + 1 WHERE id = 1")
+    c.execute("SELECT version FROM sync_state WHERE id = 1")
+    return c.fetchone()[0]
+
+def current_version(c):
+    c.execute("SELECT version FROM sync_state WHERE id = 1")
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def touch_row(c, table, row_id):
+    """Mark a students/staff row as changed (call inside the write transaction)."""
+    c.execute(f"UPDATE {table} SET row_version=? WHERE id=?", (next_version(c), row_id))
+
+def record_tombstone(c, table, row_id):
+    c.execute("INSERT INTO sync_tombstones (entity, entity_id, version) VALUES (?, ?, ?)",
+              (table, row_id, next_version(c)))
+
+def deleted_since(c, table, since):
+    c.execute("SELECT DISTINCT entity_id FROM sync_tombstones WHERE entity=? AND version > ?", (table, since))
+    return [row[0] for row in c.fetchall()]
+
+def parse_since():
+    """`since` query param as an int, or None when the client wants a plain list."""
+    since = request.args.get('since')
+    if since is None: return None
+    try:
+        return max(int(since), 0)
+    except ValueError:
+        return 0
+
+# --- Date Range Helpers ---
+# Dates are stored as 'YYYY-MM-DD' (meals) or 'YYYY-MM-DD HH:MM:SS' (bills,
+# ledgers). Half-open [start, end) string ranges match both and, unlike
+# LIKE 'YYYY-MM-DD%', can be answered from the date indexes.
+def day_range(day):
+    start = datetime.date.fromisoformat(day)
+    return start.isoformat(), (start + datetime.timedelta(days=1)).isoformat()
+
+def month_range(year, month):
+    start = datetime.date(int(year), int(month), 1)
+    end = datetime.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+# --- Monthly Meal Rollup ---
+# Every meals insert/update/delete adjusts its (month, student) row through
+# triggers, whichever handler touched meals. Each meal is costed at the unit
+# price stored on its row when it was billed (MEAL_PRICES at the time), so a
+# price change never reprices a meal already recorded, and reversing one
+# takes off exactly what it added.
+def meal_cost_sql(row):
+    """SQL for one meals row's cost; row is 'NEW.', 'OLD.' or '' (plain column names)."""
+    return ' + '.join(f"COALESCE({row}{meal}, 0) * COALESCE({row}{meal}_price, 0)" for meal in MEAL_PRICES)
+
+def backfill_meal_prices(c):
+    """Give meals recorded before prices were stored the MEAL_PRICES the rollup already costed them at."""
+    # Stale triggers must not re-add these meals to the rollup; init_db recreates them after
+    for name in ('meals_rollup_insert', 'meals_rollup_update', 'meals_rollup_delete'):
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    sets = ', '.join(f"{meal}_price = CASE WHEN {meal} THEN ? END" for meal in MEAL_PRICES)
+    where = ' AND '.join(f"{meal}_price IS NULL" for meal in MEAL_PRICES)
+    c.execute(f"UPDATE meals SET {sets} WHERE {where}", list(MEAL_PRICES.values()))
+    if c.rowcount:
+        print(f"Migrating: Priced {c.rowcount} existing meals rows")
+
+def meal_rollup_upsert(row, sign):
+    return f'''INSERT INTO monthly_meals (month, student_id, days, breakfast, lunch, dinner, cost)
+               SELECT substr({row}date, 1, 7), {row}student_id, {sign}1, {sign}COALESCE({row}breakfast, 0),
+                      {sign}COALESCE({row}lunch, 0), {sign}COALESCE({row}dinner, 0), {sign}({meal_cost_sql(row)})
+               WHERE {row}student_id IS NOT NULL
+               ON CONFLICT(month, student_id) DO UPDATE SET
+                   days = days + excluded.days, breakfast = breakfast + excluded.breakfast,
+                   lunch = lunch + excluded.lunch, dinner = dinner + excluded.dinner,
+                   cost = cost + excluded.cost;'''
+
+def create_meal_rollup_triggers(c):
+    # Recreated on every start, so databases with the older constant-price triggers get these
+    for name in ('meals_rollup_insert', 'meals_rollup_update', 'meals_rollup_delete'):
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    c.execute(f"CREATE TRIGGER meals_rollup_insert AFTER INSERT ON meals BEGIN {meal_rollup_upsert('NEW.', '')} END")
+    c.execute(f'''CREATE TRIGGER meals_rollup_update AFTER UPDATE OF student_id, date, breakfast, lunch, dinner,
+                      breakfast_price, lunch_price, dinner_price ON meals BEGIN
+                      {meal_rollup_upsert('OLD.', '-')} {meal_rollup_upsert('NEW.', '')} END''')
+    c.execute(f"CREATE TRIGGER meals_rollup_delete AFTER DELETE ON meals BEGIN {meal_rollup_upsert('OLD.', '-')} END")
+
+def meal_report_parts(start, end):
+    """Split the inclusive date range [start, end] into whole months and partial edge ranges.
+
+    Returns (first_month, last_month, edges): whole months as 'YYYY-MM'
+    bounds (None if there are none) and a list of half-open (from, to)
+    date ranges for the edge days that must be read from meals.
+    """
+    first = start if start.day == 1 else (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    after_end = end + datetime.timedelta(days=1)
+    last_end = after_end.replace(day=1)  # first day after the last whole month
+    if first >= last_end:
+        return None, None, [(start.isoformat(), after_end.isoformat())]
+    last = (last_end - datetime.timedelta(days=1)).replace(day=1)
+    edges = []
+    if start < first:
+        edges.append((start.isoformat(), first.isoformat()))
+    if last_end < after_end:
+        edges.append((last_end.isoformat(), after_end.isoformat()))
+    return first.strftime('%Y-%m'), last.strftime('%Y-%m'), edges
+
 # --- Routes ---
 
 @app.route('/')
@@ -250,52 +686,123 @@ def logout():
     return jsonify({'status': 'success'})
 
 # --- API: Students ---
+# Student ids are kept dense: deleted ids go to student_free_ids and are
+# handed out again (lowest first) before new ids past MAX(id).
+def begin_immediate(conn):
+    """Take the write lock now, so concurrent workers serialize on allocation."""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+def allocate_student_ids(c, count=1):
+    """Reserve `count` ids; call inside begin_immediate() and insert before committing."""
+    ids = []
+    while len(ids) < count:
+        c.execute("SELECT id FROM student_free_ids ORDER BY id LIMIT ?", (count - len(ids),))
+        free = [row[0] for row in c.fetchall()]
+        if not free: break
+        c.executemany("DELETE FROM student_free_ids WHERE id=?", [(i,) for i in free])
+        # Entries taken again (a restored or hand-edited database) are dropped, not reused
+        c.execute(f"SELECT id FROM students WHERE id IN ({', '.join('?' * len(free))})", free)
+        taken = {row[0] for row in c.fetchall()}
+        ids += [i for i in free if i not in taken]
+    if len(ids) < count:
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM students")
+        start = max([c.fetchone()[0]] + ids) + 1
+        ids.extend(range(start, start + count - len(ids)))
+    return ids
+
+def create_students(c, records):
+    """Insert a batch of student dicts with ids from one allocation pass; returns the ids."""
+    ids = allocate_student_ids(c, len(records))
+    version = next_version(c)
+    c.executemany("""INSERT INTO students (id, name, regd_no, dept, phone, payment_status, payment_mode,
+                                           amount_paid, remaining_amount, row_version)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                  [(new_id, data['name'], data.get('regd_no',''), data.get('dept',''), data.get('phone',''),
+                    data.get('payment_status','Unpaid'), data.get('payment_mode','Cash'),
+                    data.get('amount_paid', 0), data.get('remaining_amount', 0), version)
+                   for new_id, data in zip(ids, records)])
+    return ids
+
+def query_roster(c, today, since=0):
+    """Students with today's breakfast/lunch/dinner flags, in one query.
+
+    The meals sub-select is aggregated per student so a duplicate meal row
+    for the same day can never duplicate a student in the roster. With
+    `since`, only students changed after that sync version are returned.
+    """
+    c.execute('''
+        SELECT s.*,
+               COALESCE(m.breakfast, 0) AS breakfast_count,
+               COALESCE(m.lunch, 0) AS lunch_count,
+               COALESCE(m.dinner, 0) AS dinner_count
+        FROM students s
+        LEFT JOIN (
+            SELECT student_id,
+                   MAX(breakfast) AS breakfast,
+                   MAX(lunch) AS lunch,
+                   MAX(dinner) AS dinner
+            FROM meals
+            WHERE date = ?
+            GROUP BY student_id
+        ) m ON m.student_id = s.id
+        WHERE s.row_version > ?
+        ORDER BY s.id
+    ''', (today, since if since else -1))
+    students = []
+    for row in c.fetchall():
+        s_data = dict(row)
+        # Ensure safe defaults if column is null
+        s_data['remaining_amount'] = s_data.get('remaining_amount') or 0
+        students.append(s_data)
+    return students
+
 @app.route('/api/students', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def manage_students():
     conn = get_db()
     c = conn.cursor()
     
     if request.method == 'GET':
-        c.execute("SELECT * FROM students")
-        rows = c.fetchall()
         # Get meal counts for today
         today = datetime.date.today().isoformat()
-        students = []
-        for row in rows:
-            s_data = dict(row)
-            c.execute("SELECT breakfast, lunch, dinner FROM meals WHERE student_id=? AND date=?", (s_data['id'], today))
-            meal_row = c.fetchone()
-            s_data['breakfast_count'] = meal_row['breakfast'] if meal_row else 0
-            s_data['lunch_count'] = meal_row['lunch'] if meal_row else 0
-            s_data['dinner_count'] = meal_row['dinner'] if meal_row else 0
-            # Ensure safe defaults if column is null
-            s_data['remaining_amount'] = s_data.get('remaining_amount') or 0
-            students.append(s_data)
+        since = parse_since()
+        if since is None:
+            students = query_roster(c, today)
+            conn.close()
+            return jsonify(students)
+
+        # Delta mode: rows changed after `since` plus ids deleted since then.
+        # The version is read first, so a concurrent change is re-sent next time rather than lost.
+        version = current_version(c)
+        students = query_roster(c, today, since)
+        deleted = deleted_since(c, 'students', since) if since else []
         conn.close()
-        return jsonify(students)
+        return jsonify({'version': version, 'date': today, 'full': not since,
+                        'students': students, 'deleted': deleted})
 
     if request.method == 'POST':
         data = request.json
+        records = data if isinstance(data, list) else [data]
+        if not all(isinstance(r, dict) for r in records):
+            conn.close()
+            return jsonify({'error': 'Each student must be a JSON object'}), 400
         try:
-            # Custom Sequential ID Logic (Reuse gaps)
-            c.execute("SELECT id FROM students ORDER BY id ASC")
-            existing_ids = [row['id'] for row in c.fetchall()]
-            
-            new_id = 1
-            for current_id in existing_ids:
-                if current_id == new_id:
-                    new_id += 1
-                else:
-                    break
-            
-            # Insert with explicit ID
-            c.execute("INSERT INTO students (id, name, regd_no, dept, phone, payment_status, payment_mode, amount_paid, remaining_amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                      (new_id, data['name'], data.get('regd_no',''), data.get('dept',''), data.get('phone',''), 
-                       data.get('payment_status','Unpaid'), data.get('payment_mode','Cash'), data.get('amount_paid', 0), data.get('remaining_amount', 0)))
+            # Custom Sequential ID Logic (Reuse gaps), under the write lock
+            begin_immediate(conn)
+            if isinstance(data, list):
+                # Bulk create: one allocation pass and one executemany for the batch
+                ids = create_students(c, data)
+                conn.commit()
+                return jsonify({'status': 'success', 'ids': ids})
+            new_id = create_students(c, [data])[0]
             conn.commit()
             return jsonify({'status': 'success', 'id': new_id})
-        except sqlite3.IntegrityError:
-            return jsonify({'error': 'Regd number already exists'}), 409
+        except KeyError as e:
+            return jsonify({'error': f'Missing field: {e.args[0]}'}), 400
+        except sqlite3.IntegrityError as e:
+            if 'students.regd_no' in str(e):
+                return jsonify({'error': 'Regd number already exists'}), 409
+            return jsonify({'error': f'Could not create student: {e}'}), 400
         finally:
             conn.close()
 
@@ -304,6 +811,7 @@ def manage_students():
         c.execute("UPDATE students SET name=?, regd_no=?, dept=?, phone=?, payment_status=?, payment_mode=?, amount_paid=?, remaining_amount=? WHERE id=?",
                   (data['name'], data.get('regd_no'), data.get('dept'), data.get('phone'), 
                    data.get('payment_status'), data.get('payment_mode'), data.get('amount_paid'), data.get('remaining_amount'), data['id']))
+        touch_row(c, 'students', data['id'])
         conn.commit()
         conn.close()
         return jsonify({'status': 'success'})
@@ -311,6 +819,9 @@ def manage_students():
     if request.method == 'DELETE':
         std_id = request.args.get('id')
         c.execute("DELETE FROM students WHERE id=?", (std_id,))
+        if c.rowcount:
+            c.execute("INSERT OR IGNORE INTO student_free_ids (id) VALUES (?)", (std_id,))
+            record_tombstone(c, 'students', std_id)
         c.execute("DELETE FROM meals WHERE student_id=?", (std_id,))
         c.execute("DELETE FROM payments WHERE student_id=?", (std_id,))
         c.execute("DELETE FROM student_transactions WHERE student_id=?", (std_id,))
@@ -318,6 +829,182 @@ def manage_students():
         conn.close()
         return jsonify({'status': 'success'})
 
+# --- API: Bulk Import ---
+def import_student_rows(conn, rows, mode='upsert', chunk_size=1000, progress=None):
+    """Write normalized student rows (from import_students.read_student_rows) in chunks.
+
+    Rows are deduped on regd_no (first one wins). Existing students are
+    updated when mode is 'upsert', in the columns the file has only, and
+    left alone when it is 'insert'; nothing is ever wiped. Each chunk is
+    one transaction: it is sorted into new and existing students under the
+    write lock and written with INSERT ... ON CONFLICT(regd_no), so a
+    student added by another request meanwhile never fails the import.
+    """
+    c = conn.cursor()
+    seen = set()
+    stats = {'added': 0, 'updated': 0, 'skipped': 0, 'duplicates': 0}
+
+    def flush(chunk):
+        if not chunk: return
+        begin_immediate(conn)
+        c.execute(f"SELECT regd_no FROM students WHERE regd_no IN ({', '.join('?' * len(chunk))})",
+                  [r['regd_no'] for r in chunk])
+        existing = {row[0] for row in c.fetchall()}
+        new_rows = [r for r in chunk if r['regd_no'] not in existing]
+        changed_rows = [r for r in chunk if r['regd_no'] in existing] if mode == 'upsert' else []
+        ids = allocate_student_ids(c, len(new_rows)) if new_rows else []
+        version = next_version(c)
+        statements = {}
+        for new_id, r in zip(ids + [None] * len(changed_rows), new_rows + changed_rows):
+            fields = tuple(f for f in ('name', 'dept', 'phone') if f in r)
+            statements.setdefault(fields, []).append(
+                (new_id, r['name'], r['regd_no'], r.get('dept') or 'General', r.get('phone', ''), version))
+        for fields, params in statements.items():
+            if mode == 'upsert':
+                action = 'UPDATE SET ' + ', '.join(f"{f} = excluded.{f}" for f in fields + ('row_version',))
+            else:
+                action = 'NOTHING'
+            c.executemany(f"""INSERT INTO students (id, name, regd_no, dept, phone, payment_status, payment_mode,
+                                                    amount_paid, remaining_amount, row_version)
+                              VALUES (?, ?, ?, ?, ?, 'Unpaid', 'Cash', 0, 0, ?)
+                              ON CONFLICT(regd_no) DO {action}""", params)
+        conn.commit()
+        stats['added'] += len(new_rows)
+        stats['updated'] += len(changed_rows)
+        stats['skipped'] += len(chunk) - len(new_rows) - len(changed_rows)
+        if progress: progress(stats)
+
+    chunk = []
+    for row in rows:
+        if row['regd_no'] in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(row['regd_no'])
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    return stats
+
+# --- Import Jobs ---
+# An upload is saved under IMPORT_DIR and imported by a background thread;
+# the status file it keeps up to date is what any worker returns to the
+# polling client. One import runs at a time (lock file, as for backups).
+IMPORT_DIR = os.environ.get('IMPORT_DIR', 'imports')
+
+def import_lock_path():
+    return os.path.join(IMPORT_DIR, 'import.lock')
+
+def import_status_path(job_id):
+    return os.path.join(IMPORT_DIR, f"{job_id}.json")
+
+def save_import_status(job):
+    partial = import_status_path(job['id']) + '.part'
+    with open(partial, 'w') as f:
+        json.dump(job, f)
+    os.replace(partial, import_status_path(job['id']))
+
+def import_job_status(job_id):
+    """Status dict of an import job, or None if unknown."""
+    if not re.fullmatch(r'import_\d{8}_\d{6}_[0-9a-f]{8}', job_id or ''):
+        return None
+    # Checked before reading: the job saves its final status, then lets go of the lock
+    holder = locks.lock_holder(import_lock_path()) or {}
+    try:
+        with open(import_status_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job['status'] == 'running' and holder.get('job') != job_id:
+        job['status'] = 'error'
+        job['error'] = 'Import process exited before finishing'
+    return job
+
+def run_import_job(job, path, filename, lock):
+    from import_students import read_student_rows
+
+    def progress(stats):
+        job.update(stats)
+        job['rows_done'] = sum(stats.values())
+        save_import_status(job)
+
+    conn = get_pool().acquire()
+    try:
+        with open(path, 'rb') as f:
+            progress(import_student_rows(conn, read_student_rows(f, filename), job['mode'], progress=progress))
+        job['status'] = 'done'
+        print(f"Import {job['id']} done: {job['added']} added, {job['updated']} updated")
+    except Exception as e:
+        print(f"Import Error: {e}")
+        job['status'] = 'error'
+        job['error'] = str(e)
+    finally:
+        conn.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    job['finished_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+    try:
+        save_import_status(job)
+    finally:
+        locks.release_lock(lock)
+
+@app.route('/api/students/import', methods=['POST'])
+def import_students_route():
+    """Start importing an uploaded name list; poll the returned job's status URL."""
+    upload = request.files.get('file')
+    mode = request.form.get('mode', 'upsert')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    if mode not in ('upsert', 'insert'):
+        return jsonify({'error': 'Invalid mode'}), 400
+    ext = os.path.splitext(upload.filename)[1].lower()
+    if ext not in ('.xlsx', '.xlsm', '.csv'):
+        return jsonify({'error': f"Unsupported file type: {ext or upload.filename}"}), 400
+
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    now = datetime.datetime.now()
+    job_id = now.strftime("import_%Y%m%d_%H%M%S_") + os.urandom(4).hex()
+    lock = locks.acquire_lock(import_lock_path(), job=job_id)
+    if lock is None:
+        holder = locks.lock_holder(import_lock_path()) or {}
+        return jsonify({'error': 'An import is already running', 'job': import_job_status(holder.get('job'))}), 409
+    try:
+        path = os.path.join(IMPORT_DIR, job_id + ext)
+        upload.save(path)
+        job = {
+            'id': job_id,
+            'status': 'running',
+            'file': upload.filename,
+            'mode': mode,
+            'pid': os.getpid(),
+            'started_at': now.isoformat(timespec='seconds'),
+            'finished_at': None,
+            'rows_done': 0,
+            'added': 0,
+            'updated': 0,
+            'skipped': 0,
+            'duplicates': 0,
+            'error': None,
+        }
+        save_import_status(job)
+        threading.Thread(target=run_import_job, args=(job, path, upload.filename, lock),
+                         name='student-import', daemon=True).start()
+    except Exception as e:
+        locks.release_lock(lock)
+        print(f"Import Error: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'status': 'started', 'job': job}), 202
+
+@app.route('/api/students/import/<job_id>')
+def import_students_status(job_id):
+    job = import_job_status(job_id)
+    if not job:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(job)
+
 @app.route('/api/students/reset', methods=['POST'])
 def reset_student_history():
     data = request.json
@@ -332,6 +1019,7 @@ def reset_student_history():
         c.execute("DELETE FROM student_transactions WHERE student_id=?", (s_id,))
         # Reset Balance
         c.execute("UPDATE students SET remaining_amount=0, amount_paid=0, payment_status='Unpaid' WHERE id=?", (s_id,))
+        touch_row(c, 'students', s_id)
         conn.commit()
         return jsonify({'status': 'success', 'message': 'History cleared'})
     except Exception as e:
@@ -377,6 +1065,7 @@ def pay_student_fees():
         date_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         c.execute("INSERT INTO student_transactions (student_id, amount, date, mode, remarks) VALUES (?, ?, ?, ?, ?)",
                   (s_id, amount, date_str, mode, remarks))
+        touch_row(c, 'students', s_id)
                   
         conn.commit()
         return jsonify({'status': 'success', 'new_remaining': new_remaining, 'new_status': new_status})
@@ -418,14 +1107,15 @@ def manage_operators():
         return jsonify({'status': 'success'})
 
 # --- API: Billing ---
-@app.route('/api/bill', methods=['POST'])
-def create_bill():
-    data = request.json
-    conn = get_db()
-    c = conn.cursor()
-    
-    bill_no = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
-    date_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def apply_bill(c, data, now=None):
+    """Record one sale: the bill, live stats, meal flags and Account debits.
+
+    Runs inside the caller's transaction; the caller commits. Returns the
+    new bill_no.
+    """
+    now = now or datetime.datetime.now()
+    bill_no = now.strftime("%Y%m%d%H%M%S%f")
+    date_str = now.strftime("%Y-%m-%d %H:%M:%S")
     
     # Save bill
     details = json.dumps({
@@ -435,48 +1125,235 @@ def create_bill():
         'meal_type': data.get('meal_type')
     })
     
-    try:
-        c.execute("INSERT INTO bills (bill_no, date, operator_id, amount, details, payment_mode) VALUES (?, ?, ?, ?, ?, ?)",
-                  (bill_no, date_str, data.get('operator_id'), data.get('amount'), details, data.get('payment_mode')))
+    c.execute("""INSERT INTO bills (bill_no, date, operator_id, amount, details, payment_mode,
+                                    user_type, student_id, guest_name, meal_type)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+              (bill_no, date_str, data.get('operator_id'), data.get('amount'), details, data.get('payment_mode'),
+               data.get('user_type'), to_id(data.get('student_id')), data.get('guest_name'), data.get('meal_type')))
+    add_daily_stats(c, date_str, data.get('meal_type'), data.get('payment_mode'), data.get('user_type'), 1, data.get('amount'))
+    
+    # If student, record meal
+    if data.get('user_type') == 'hostel' and data.get('student_id'):
+        s_id = data.get('student_id')
+        today = datetime.date.today().isoformat()
+        meal_type = data.get('meal_type').lower() # breakfast, lunch, dinner
         
-        # If student, record meal
-        if data.get('user_type') == 'hostel' and data.get('student_id'):
-            s_id = data.get('student_id')
-            today = datetime.date.today().isoformat()
-            meal_type = data.get('meal_type').lower() # breakfast, lunch, dinner
+        # Check if valid meal type column
+        if meal_type in ['breakfast', 'lunch', 'dinner']:
+             # Upsert meal
+            c.execute("SELECT id FROM meals WHERE student_id=? AND date=?", (s_id, today))
+            row = c.fetchone()
+            if row:
+                c.execute(f"UPDATE meals SET {meal_type}=1, {meal_type}_price=? WHERE id=?",
+                          (MEAL_PRICES[meal_type], row[0]))
+            else:
+                vals = {'breakfast':0, 'lunch':0, 'dinner':0}
+                vals[meal_type] = 1
+                c.execute(f"INSERT INTO meals (student_id, date, breakfast, lunch, dinner, {meal_type}_price) VALUES (?, ?, ?, ?, ?, ?)",
+                          (s_id, today, vals['breakfast'], vals['lunch'], vals['dinner'], MEAL_PRICES[meal_type]))
+
+        # Handle 'Account' Payment (Credit/Debt)
+        if data.get('payment_mode') == 'Account':
+            # Increase remaining_amount (Debt)
+            c.execute("UPDATE students SET remaining_amount = remaining_amount + ? WHERE id=?", 
+                      (data.get('amount'), s_id))
             
-            # Check if valid meal type column
-            if meal_type in ['breakfast', 'lunch', 'dinner']:
-                 # Upsert meal
-                c.execute("SELECT id FROM meals WHERE student_id=? AND date=?", (s_id, today))
-                row = c.fetchone()
-                if row:
-                    c.execute(f"UPDATE meals SET {meal_type}=1 WHERE id=?", (row[0],))
-                else:
-                    vals = {'breakfast':0, 'lunch':0, 'dinner':0}
-                    vals[meal_type] = 1
-                    c.execute("INSERT INTO meals (student_id, date, breakfast, lunch, dinner) VALUES (?, ?, ?, ?, ?)",
-                              (s_id, today, vals['breakfast'], vals['lunch'], vals['dinner']))
-
-            # Handle 'Account' Payment (Credit/Debt)
-            if data.get('payment_mode') == 'Account':
-                # Increase remaining_amount (Debt)
-                c.execute("UPDATE students SET remaining_amount = remaining_amount + ? WHERE id=?", 
-                          (data.get('amount'), s_id))
-                
-                # Log Transaction
-                c.execute("INSERT INTO student_transactions (student_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, ?, ?)",
-                          (s_id, data.get('amount'), date_str, 'Account', 'Food', f"Meal: {data.get('meal_type')}"))
-
-        # If Staff, record transaction if Account
-        elif data.get('user_type') == 'staff' and data.get('student_id'):
-            # Frontend sends staff_id as student_id field
-            st_id = data.get('student_id')
-            if data.get('payment_mode') == 'Account':
-                 c.execute("INSERT INTO staff_transactions (staff_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, ?, ?)",
-                          (st_id, data.get('amount'), date_str, 'Account', 'Food', f"Meal: {data.get('meal_type')}"))
+            # Log Transaction
+            c.execute("INSERT INTO student_transactions (student_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, ?, ?)",
+                      (s_id, data.get('amount'), date_str, 'Account', 'Food', f"Meal: {data.get('meal_type')}"))
+
+        # Meal flags and/or balance changed: push the row to delta clients
+        touch_row(c, 'students', s_id)
+
+    # If Staff, record transaction if Account
+    elif data.get('user_type') == 'staff' and data.get('student_id'):
+        # Frontend sends staff_id as student_id field
+        st_id = data.get('student_id')
+        if data.get('payment_mode') == 'Account':
+             c.execute("INSERT INTO staff_transactions (staff_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, ?, ?)",
+                      (st_id, data.get('amount'), date_str, 'Account', 'Food', f"Meal: {data.get('meal_type')}"))
+             touch_row(c, 'staff', st_id)
+
+    return bill_no
+
+def validate_bill(data):
+    """Error message for a malformed batch item, or None."""
+    if not isinstance(data, dict):
+        return 'Bill must be an object'
+    if data.get('user_type') not in ('hostel', 'staff', 'normal'):
+        return 'Invalid user_type'
+    if data.get('user_type') in ('hostel', 'staff') and to_id(data.get('student_id')) is None:
+        return 'Missing or invalid student_id'
+    if not isinstance(data.get('meal_type'), str) or not data.get('meal_type'):
+        return 'Missing meal_type'
+    if not data.get('payment_mode'):
+        return 'Missing payment_mode'
+    try:
+        if float(data.get('amount')) < 0:
+            return 'Invalid amount'
+    except (TypeError, ValueError):
+        return 'Invalid amount'
+    return None
+
+# --- Idempotency Keys ---
+# A client may send an Idempotency-Key header (or an idempotency_key field)
+# with a bill; a retry carrying the same key gets the original bill_no back
+# instead of a second bill. Keys expire after IDEMPOTENCY_TTL_SECONDS and at
+# most IDEMPOTENCY_MAX_KEYS are kept, so bill_keys stays small and every
+# lookup or prune is a single index probe.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 20000))
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
+def idempotency_key(data, header=None):
+    """The bill's key (header wins over the field), or None; raises ValueError if unusable."""
+    key = header if header is not None else (data.get('idempotency_key') if isinstance(data, dict) else None)
+    if key is None or key == '':
+        return None
+    if not isinstance(key, str) or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(f"Idempotency key must be a string of at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+    return key
+
+def find_keyed_bill(c, key):
+    """bill_no recorded under an unexpired key, or None."""
+    c.execute("SELECT bill_no FROM bill_keys WHERE key=? AND created_at >= ?",
+              (key, time.time() - IDEMPOTENCY_TTL_SECONDS))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def remember_bill_key(c, key, bill_no):
+    """Record key -> bill_no in the bill's transaction and drop expired / excess keys."""
+    now = time.time()
+    c.execute("INSERT OR REPLACE INTO bill_keys (key, bill_no, created_at) VALUES (?, ?, ?)", (key, bill_no, now))
+    c.execute("DELETE FROM bill_keys WHERE created_at < ?", (now - IDEMPOTENCY_TTL_SECONDS,))
+    c.execute("DELETE FROM bill_keys WHERE id <= ?", (c.lastrowid - IDEMPOTENCY_MAX_KEYS,))
+
+def apply_keyed_bill(c, data, key, now=None):
+    """apply_bill() in its own savepoint, honouring the idempotency key.
+
+    Returns (bill_no, replayed). On error only this bill is rolled back and
+    the exception is re-raised; the caller's transaction carries on.
+    """
+    bill_no = find_keyed_bill(c, key) if key else None
+    if bill_no:
+        return bill_no, True
+    c.execute("SAVEPOINT bill_item")
+    try:
+        bill_no = apply_bill(c, data, now)
+        if key:
+            remember_bill_key(c, key, bill_no)
+        c.execute("RELEASE bill_item")
+    except Exception:
+        c.execute("ROLLBACK TO bill_item")
+        c.execute("RELEASE bill_item")
+        raise
+    return bill_no, False
+
+# --- Group Commit (opt-in) ---
+# BILL_GROUP_COMMIT=1 hands /api/bill writes to one writer thread per worker,
+# which applies whatever has queued up (at most GROUP_COMMIT_MAX_BILLS, waiting
+# at most GROUP_COMMIT_WAIT_MS for stragglers) in one transaction and one
+# commit. Each request returns only after the commit holding its bill is done.
+# Batching needs concurrent requests in the same process, i.e. gunicorn
+# --threads; across workers it cuts write-lock handoffs by the batch size.
+BILL_GROUP_COMMIT = os.environ.get('BILL_GROUP_COMMIT', '0') == '1'
+GROUP_COMMIT_MAX_BILLS = int(os.environ.get('GROUP_COMMIT_MAX_BILLS', 32))
+GROUP_COMMIT_WAIT_MS = float(os.environ.get('GROUP_COMMIT_WAIT_MS', 2))
+
+class BillWriter:
+    """Per-process group committer for /api/bill."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, data, key):
+        """Queue one bill and wait for its commit; returns (bill_no, replayed) or raises."""
+        with self.lock:
+            # Threads do not survive a fork, so a gunicorn worker starts its own
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='bill-writer', daemon=True)
+                self.thread.start()
+        job = {'data': data, 'key': key, 'done': threading.Event(), 'result': None, 'error': None}
+        self.queue.put(job)
+        job['done'].wait()
+        if job['error'] is not None:
+            raise job['error']
+        return job['result']
+
+    def run(self):
+        while True:
+            jobs = [self.queue.get()]
+            deadline = time.perf_counter() + GROUP_COMMIT_WAIT_MS / 1000
+            while len(jobs) < GROUP_COMMIT_MAX_BILLS:
+                try:
+                    jobs.append(self.queue.get(timeout=max(0, deadline - time.perf_counter())))
+                except queue.Empty:
+                    break
+            self.commit(jobs)
+
+    def commit(self, jobs):
+        applied = 0
+        conn = get_db()
+        try:
+            c = conn.cursor()
+            begin_immediate(conn)
+            now = datetime.datetime.now()
+            for i, job in enumerate(jobs):
+                try:
+                    # Distinct bill numbers within the group: one microsecond apart
+                    job['result'] = apply_keyed_bill(c, job['data'], job['key'], now + datetime.timedelta(microseconds=i))
+                    applied += not job['result'][1]
+                except Exception as e:
+                    job['error'] = e
+            conn.commit()
+        except Exception as e:
+            print(f"Group Commit Error: {e}")
+            for job in jobs:
+                job['error'] = e
+            applied = 0
+        finally:
+            conn.close()
+            for job in jobs:
+                job['done'].set()
+        if applied:
+            stats_broadcaster.notify()
+
+bill_writer = BillWriter()
 
+@app.route('/api/bill', methods=['POST'])
+def create_bill():
+    data = request.json
+    try:
+        key = idempotency_key(data, request.headers.get('Idempotency-Key'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if BILL_GROUP_COMMIT:
+        try:
+            bill_no, replayed = bill_writer.submit(data, key)
+        except Exception as e:
+            print(e)
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+        if replayed:
+            return jsonify({'status': 'success', 'bill_no': bill_no, 'replayed': True})
+        return jsonify({'status': 'success', 'bill_no': bill_no})
+    conn = get_db()
+    c = conn.cursor()
+    
+    try:
+        if key:
+            # Hold the write lock across lookup and insert, so concurrent retries cannot both bill
+            begin_immediate(conn)
+            bill_no = find_keyed_bill(c, key)
+            if bill_no:
+                conn.rollback()
+                return jsonify({'status': 'success', 'bill_no': bill_no, 'replayed': True})
+        bill_no = apply_bill(c, data)
+        if key:
+            remember_bill_key(c, key, bill_no)
         conn.commit()
+        stats_broadcaster.notify()
         return jsonify({'status': 'success', 'bill_no': bill_no})
     except Exception as e:
         print(e)
@@ -484,6 +1361,64 @@ def create_bill():
     finally:
         conn.close()
 
+MAX_BATCH_BILLS = 500
+
+@app.route('/api/bill/batch', methods=['POST'])
+def create_bill_batch():
+    """Apply a queue of bills in one transaction (one commit for the lot).
+
+    Each item runs in its own savepoint, so a bad item is reported and
+    skipped without losing the others. Results come back in request order.
+    Items may carry an idempotency_key; an already-billed key is reported
+    as replayed with its original bill_no.
+    """
+    bills = request.json
+    if isinstance(bills, dict):
+        bills = bills.get('bills')
+    if not isinstance(bills, list) or not bills:
+        return jsonify({'status': 'error', 'message': 'Expected a non-empty list of bills'}), 400
+    if len(bills) > MAX_BATCH_BILLS:
+        return jsonify({'status': 'error', 'message': f"At most {MAX_BATCH_BILLS} bills per batch"}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+    results = []
+    applied = 0
+    try:
+        begin_immediate(conn)
+        now = datetime.datetime.now()
+        for i, data in enumerate(bills):
+            error = validate_bill(data)
+            if not error:
+                try:
+                    key = idempotency_key(data)
+                except ValueError as e:
+                    error = str(e)
+            if error:
+                results.append({'index': i, 'status': 'error', 'message': error})
+                continue
+            try:
+                # Distinct bill numbers within the batch: one microsecond apart
+                bill_no, replayed = apply_keyed_bill(c, data, key, now + datetime.timedelta(microseconds=i))
+            except Exception as e:
+                results.append({'index': i, 'status': 'error', 'message': str(e)})
+                continue
+            if replayed:
+                results.append({'index': i, 'status': 'success', 'bill_no': bill_no, 'replayed': True})
+            else:
+                results.append({'index': i, 'status': 'success', 'bill_no': bill_no})
+                applied += 1
+        conn.commit()
+        if applied:
+            stats_broadcaster.notify()
+        failed = sum(1 for r in results if r['status'] == 'error')
+        return jsonify({'status': 'success', 'applied': applied, 'failed': failed, 'results': results})
+    except Exception as e:
+        print(f"Batch Bill Error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    finally:
+        conn.close()
+
 @app.route('/bill-view/<bill_no>')
 def view_bill(bill_no):
     conn = get_db()
@@ -494,7 +1429,7 @@ def view_bill(bill_no):
     
     if not row: return "Bill not found", 404
     
-    details = json.loads(row['details'])
+    details = {k: row[k] for k in ('user_type', 'student_id', 'guest_name', 'meal_type')}
     
     # Date Format DD-MM-YYYY
     try:
@@ -528,7 +1463,7 @@ def view_bill(bill_no):
                 Bill No: {bill_no}
             </div>
             <hr>
-            <div class="line"><span>Item:</span> <span>{details.get('meal_type', 'Meal')}</span></div>
+            <div class="line"><span>Item:</span> <span>{details.get('meal_type') or 'Meal'}</span></div>
             <div class="line"><span>Type:</span> <span>{details.get('user_type')}</span></div>
             {f'<div class="line"><span>Name:</span> <span>{details.get("guest_name", "N/A")}</span></div>' if details.get('guest_name') else ''}
             {f'<div class="line"><span>Student ID:</span> <span>{details.get("student_id")}</span></div>' if details.get('student_id') else ''}
@@ -549,185 +1484,228 @@ def get_meal_report():
     conn = get_db()
     c = conn.cursor()
     today = datetime.date.today().isoformat()
-    
-    # Fetch all bills for today to aggregate stats manually (covers all user types)
-    c.execute("SELECT details, amount FROM bills WHERE date LIKE ?", (today + '%',))
-    daily_bills = c.fetchall()
-    
-    counts = {'Breakfast': 0, 'Lunch': 0, 'Dinner': 0}
-    total_revenue = 0.0
-    
-    for b in daily_bills:
-        # Revenue
-        total_revenue += b['amount'] if b['amount'] else 0
-        
-        # Meal Count
-        try:
-            if b['details']:
-                d = json.loads(b['details'])
-                m_type = d.get('meal_type')
-                # Handle Case Sensitivity or exact match (Frontend sends Title Case)
-                if m_type in counts:
-                    counts[m_type] += 1
-        except Exception as e:
-            print(f"Stats Parse Error: {e}")
-            
+    stats = meal_stats(c, today)
     conn.close()
-    
-    return jsonify({
-        'Breakfast': counts['Breakfast'],
-        'Lunch': counts['Lunch'],
-        'Dinner': counts['Dinner'],
-        'revenue': total_revenue
-    })
+    return jsonify(stats)
+
+@app.route('/api/metrics')
+def get_metrics():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/slow-queries', methods=['GET', 'DELETE'])
+def slow_query_log():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admin login required'}), 403
+    if not slow_queries.ENABLED:
+        return jsonify({'error': 'Slow query log is off; start the server with SLOW_QUERY_MS=<threshold>'}), 404
+    if request.method == 'DELETE':
+        slow_queries.reset()
+        return jsonify({'status': 'success'})
+    return jsonify(slow_queries.report())
+
+@app.route('/api/stream/stats')
+def stream_stats():
+    """Server-Sent Events: today's meal stats, pushed whenever they change."""
+    if not STATS_STREAM:
+        # 204 tells EventSource to stop reconnecting; the page keeps polling
+        return Response(status=204)
+    def generate():
+        stats_broadcaster.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            seq = 0
+            started = time.monotonic()
+            while time.monotonic() - started < STATS_STREAM_MAX_SECONDS:
+                new_seq, payload = stats_broadcaster.wait(seq, STATS_KEEPALIVE_SECONDS)
+                if new_seq != seq:
+                    seq = new_seq
+                    yield f"data: {payload}\n\n"
+                else:
+                    # Comment line: keeps proxies from timing out, and finds disconnected clients
+                    yield ": keepalive\n\n"
+        finally:
+            stats_broadcaster.unsubscribe()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Student Report Paging ---
+# History lists are paged by keyset: the cursor is the sort key of the last
+# row sent, so every page is an index range scan of `limit` rows however
+# long the student's history is.
+REPORT_PAGE_SIZE = 50
+MAX_REPORT_PAGE_SIZE = 500
+
+def encode_cursor(*key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(text, types):
+    """Sort key from a page cursor; raises ValueError if it is not one of ours."""
+    key = json.loads(base64.urlsafe_b64decode(text + '=' * (-len(text) % 4)))
+    if not isinstance(key, list) or len(key) != len(types) or not all(isinstance(v, t) for v, t in zip(key, types)):
+        raise ValueError('Invalid cursor')
+    return key
+
+def history_after(src, cursor):
+    """Keyset condition for one source of the merged history (sorted by date, id, src descending)."""
+    if cursor is None:
+        return '', []
+    c_date, c_id, c_src = cursor
+    # On an exact (date, id) tie the lower src comes next
+    op = '<=' if src < c_src else '<'
+    return f" AND date <= ? AND (date < ? OR id {op} ?)", [c_date, c_date, c_id]
+
+def student_history_page(c, student_id, start_date, end_date, limit, cursor=None):
+    """One page of a student's money history, newest first; returns (rows, next_cursor).
+
+    Cash/UPI meals only live in bills; Account food and payments are in
+    student_transactions. Both come off their (student_id, date)
+    indexes already in order, so SQL merges them without a sort.
+    """
+    sources = [
+        # Staff bills carry the staff id in student_id, so they are excluded
+        (0, """SELECT 0 AS src, id, date, meal_type AS item, amount, payment_mode AS mode, NULL AS type FROM bills
+               WHERE student_id = ?
+                 AND (payment_mode IS NULL OR payment_mode != 'Account')
+                 AND (user_type IS NULL OR user_type != 'staff')"""),
+        (1, """SELECT 1 AS src, id, date, remarks AS item, amount, mode, type FROM student_transactions
+               WHERE student_id = ?"""),
+    ]
+    parts = []
+    params = []
+    for src, query in sources:
+        params.append(student_id)
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            # For timestamps, we want to include the whole end day
+            query += " AND date <= ?"
+            params.append(end_date + " 23:59:59")
+        after, after_params = history_after(src, cursor)
+        parts.append(query + after)
+        params += after_params
+    c.execute(' UNION ALL '.join(parts) + " ORDER BY date DESC, id DESC, src DESC LIMIT ?", params + [limit + 1])
+    rows = c.fetchall()
+
+    transactions = []
+    for r in rows[:limit]:
+        if r['src'] == 0:
+            transactions.append({
+                'type': 'Food (Direct)',
+                'date': r['date'],
+                'item': r['item'] or 'N/A',
+                'amount': r['amount'],
+                'mode': r['mode'],
+                'color': 'black' # Doesn't affect debt
+            })
+        else:
+            transactions.append({
+                'id': r['id'],
+                'type': r['type'],
+                'date': r['date'],
+                'item': r['item'] or 'Fee Payment',
+                'amount': r['amount'],
+                'mode': r['mode'],
+                'color': 'green' if r['type'] == 'Payment' else 'red'
+            })
+    last = rows[limit - 1] if len(rows) > limit else None
+    return transactions, encode_cursor(last['date'], last['id'], last['src']) if last else None
+
+def student_meals_page(c, student_id, start_date, end_date, limit, cursor=None):
+    """One page of a student's meal days, newest first; returns (rows, next_cursor)."""
+    query = "SELECT id, date, breakfast, lunch, dinner FROM meals WHERE student_id=?"
+    params = [student_id]
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+    if cursor:
+        query += " AND date <= ? AND (date < ? OR id < ?)"
+        params += [cursor[0], cursor[0], cursor[1]]
+    c.execute(query + " ORDER BY date DESC, id DESC LIMIT ?", params + [limit + 1])
+    rows = c.fetchall()
+    meals = [{k: r[k] for k in ('date', 'breakfast', 'lunch', 'dinner')} for r in rows[:limit]]
+    last = rows[limit - 1] if len(rows) > limit else None
+    return meals, encode_cursor(last['date'], last['id']) if last else None
+
+def student_meal_summary(c, student_id, start, end):
+    """Meal counts and cost for [start, end] from the monthly rollup plus the edge days."""
+    first_month, last_month, edges = meal_report_parts(start, end)
+    parts = []
+    params = []
+    if first_month:
+        parts.append("""SELECT breakfast, lunch, dinner, cost FROM monthly_meals
+                        WHERE student_id = ? AND month >= ? AND month <= ?""")
+        params += [student_id, first_month, last_month]
+    for edge_start, edge_end in edges:
+        parts.append(f"""SELECT COALESCE(breakfast, 0) AS breakfast, COALESCE(lunch, 0) AS lunch, COALESCE(dinner, 0) AS dinner,
+                                {meal_cost_sql('')} AS cost
+                         FROM meals WHERE student_id = ? AND date >= ? AND date < ?""")
+        params += [student_id, edge_start, edge_end]
+    c.execute(f"""SELECT COALESCE(SUM(breakfast), 0), COALESCE(SUM(lunch), 0), COALESCE(SUM(dinner), 0),
+                         COALESCE(SUM(cost), 0)
+                  FROM ({' UNION ALL '.join(parts)})""", params)
+    row = c.fetchone()
+    summary = {'breakfast': row[0], 'lunch': row[1], 'dinner': row[2], 'total_cost': row[3]}
+    return summary
 
 @app.route('/api/reports/student/<int:student_id>')
 def get_student_report(student_id):
-    conn = get_db()
-    c = conn.cursor()
-    
+    """Student details, meal summary and the first page of each history list.
+
+    ?limit sets the page size. ?cursor=<next_cursor> returns only the next
+    page of transactions, ?meals_cursor=<meals_next_cursor> only the next
+    page of meals.
+    """
     # Filter Params
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    
-    # 1. Student Details
-    c.execute("SELECT * FROM students WHERE id=?", (student_id,))
-    student = c.fetchone()
-    if not student:
+    try:
+        limit = int(request.args.get('limit', REPORT_PAGE_SIZE))
+        if not 1 <= limit <= MAX_REPORT_PAGE_SIZE:
+            raise ValueError
+        start = datetime.date.fromisoformat(start_date) if start_date else datetime.date(1970, 1, 1)
+        end = datetime.date.fromisoformat(end_date) if end_date else datetime.date.max - datetime.timedelta(days=1)
+        cursor = decode_cursor(request.args['cursor'], (str, int, int)) if request.args.get('cursor') else None
+        meals_cursor = decode_cursor(request.args['meals_cursor'], (str, int)) if request.args.get('meals_cursor') else None
+    except ValueError:
+        return jsonify({'error': f"Invalid date, cursor or limit (1-{MAX_REPORT_PAGE_SIZE})"}), 400
+
+    conn = get_db()
+    c = conn.cursor()
+    try:
+        # Later pages: just the list asked for
+        if cursor:
+            transactions, next_cursor = student_history_page(c, student_id, start_date, end_date, limit, cursor)
+            return jsonify({'transactions': transactions, 'next_cursor': next_cursor})
+        if meals_cursor:
+            meals, meals_next_cursor = student_meals_page(c, student_id, start_date, end_date, limit, meals_cursor)
+            return jsonify({'meals': meals, 'meals_next_cursor': meals_next_cursor})
+
+        # 1. Student Details
+        c.execute("SELECT * FROM students WHERE id=?", (student_id,))
+        student = c.fetchone()
+        if not student:
+            return jsonify({'error': 'Student not found'}), 404
+
+        meals, meals_next_cursor = student_meals_page(c, student_id, start_date, end_date, limit)
+        transactions, next_cursor = student_history_page(c, student_id, start_date, end_date, limit)
+        summary = student_meal_summary(c, student_id, start, end)
+    finally:
         conn.close()
-        return jsonify({'error': 'Student not found'}), 404
-        
-    student_data = dict(student)
-    
-    # Build Query Conditions
-    meal_query = "SELECT date, breakfast, lunch, dinner FROM meals WHERE student_id=?"
-    meal_params = [student_id]
-    
-    trans_query = "SELECT * FROM student_transactions WHERE student_id=?"
-    trans_params = [student_id]
-    
-    if start_date:
-        meal_query += " AND date >= ?"
-        meal_params.append(start_date)
-        trans_query += " AND date >= ?"
-        trans_params.append(start_date)
-        
-    if end_date:
-        meal_query += " AND date <= ?"
-        meal_params.append(end_date)
-        # For timestamps, we want to include the whole end day
-        trans_query += " AND date <= ?"
-        trans_params.append(end_date + " 23:59:59")
-        
-    meal_query += " ORDER BY date DESC"
-    trans_query += " ORDER BY date DESC"
-    
-    # 2. Meal History
-    c.execute(meal_query, tuple(meal_params))
-    meals = [dict(row) for row in c.fetchall()]
-    
-    # 3. Transaction History
-    # Note: We are now primarily using student_transactions table which should ideally contain all Food (bills) and Payments.
-    # However, legacy or current implementation might splits them.
-    # In 'create_bill' (app.py:446), we INSERT into student_transactions for Account bills.
-    # So we should rely on student_transactions for REPORTING to be consistent.
-    # The previous logic tried to fetch FROM bills. Let's try to stick to student_transactions if possible.
-    # But wait, 'bills' table has the 'details' JSON. student_transactions has 'remarks' and 'type'.
-    # For now, let's stick to the previous hybrid approach BUT apply filters? 
-    # Actually, the previous code fetched ALL bills and filtered in Python. That's bad for perf but okay for small app.
-    # If we filter in Python, we can just continue that pattern for bills.
-    
-    # Optimized approach: Use student_transactions for everything if it has the data.
-    # Checks: create_bill inserts into student_transactions for 'Account' mode.
-    # What if they paid Cash/UPI for a single meal?
-    # If a hostel student pays Cash for a meal, does it go to student_transactions?
-    # create_bill:421 checks if student.
-    # create_bill:440 checks if 'Account'. If so, updates debt and inserts transaction.
-    # If Cash/UPI, it just inserts into 'bills' and updates 'meals' count. It does NOT insert into student_transactions?
-    # If so, they are separate.
-    # But for a "Hostel Student Report" (Due/Paid/History), we usually care about their Account/Debt history.
-    # Cash meals don't affect debt. But they ARE part of "History" of what they ate?
-    # The prompt says "amount due , paid , history".
-    # Usually "History" implies the financial ledger.
-    # If I eat and pay cash immediately, it's not on the ledger.
-    # However, the previous implementation merged matches from 'bills'.
-    # Let's keep supporting that to be safe.
-    
-    transactions = []
-    
-    # A. Fetch from Bills (Cash/UPI immediate purchases)
-    # Optimization: Only fetch bills if date range is small? No, fetch all for now, as before.
-    # But we can add SQL filter on date if params exist.
-    bill_q = "SELECT * FROM bills"
-    bill_p = []
-    if start_date:
-        bill_q += " WHERE date >= ?"
-        bill_p.append(start_date)
-    if end_date:
-        # If where clause exists append with AND, else WHERE
-        conn_word = " AND" if "WHERE" in bill_q else " WHERE"
-        bill_q += f"{conn_word} date <= ?"
-        bill_p.append(end_date + " 23:59:59")
-        
-    bill_q += " ORDER BY date DESC"
-    
-    c.execute(bill_q, tuple(bill_p))
-    all_bills = c.fetchall()
-    
-    for b in all_bills:
-        # Skip Account bills (handled in student_transactions)
-        if b['payment_mode'] == 'Account': continue
-        
-        try:
-            d = json.loads(b['details'])
-            if str(d.get('student_id')) == str(student_id):
-                transactions.append({
-                    'type': 'Food (Direct)',
-                    'date': b['date'],
-                    'item': d.get('meal_type', 'N/A'),
-                    'amount': b['amount'],
-                    'mode': b['payment_mode'],
-                    'color': 'black' # Doesn't affect debt
-                })
-        except: pass
-
-    # B. Fetch from Student Transactions (Account Food + Payments)
-    c.execute(trans_query, tuple(trans_params))
-    payments = [dict(row) for row in c.fetchall()]
-    
-    for p in payments:
-        transactions.append({
-            'id': p['id'],
-            'type': p.get('type', 'Payment'),
-            'date': p['date'],
-            'item': p.get('remarks') or 'Fee Payment',
-            'amount': p['amount'],
-            'mode': p['mode'],
-            'color': 'green' if p.get('type') == 'Payment' else 'red'
-        })
-        
-    # Sort combined
-    transactions.sort(key=lambda x: x['date'], reverse=True)
-    
-    conn.close()
-    
-    # Calculate Summary Stats
-    summary = {
-        'breakfast': sum(1 for m in meals if m['breakfast']),
-        'lunch': sum(1 for m in meals if m['lunch']),
-        'dinner': sum(1 for m in meals if m['dinner']),
-    }
-    # Cost: B=20, L=40, D=40
-    summary['total_cost'] = (summary['breakfast'] * 20) + (summary['lunch'] * 40) + (summary['dinner'] * 40)
-    
+
     return jsonify({
-        'student': student_data,
+        'student': dict(student),
         'meals': meals,
+        'meals_next_cursor': meals_next_cursor,
         'transactions': transactions,
+        'next_cursor': next_cursor,
         'summary': summary
     })
 
-@app.route('/api/transactions', methods=['DELETE'])
 # Helper for deletion logic (shared)
 def delete_transaction_logic(c, t_id):
     # 1. Fetch Transaction
@@ -775,6 +1753,18 @@ def delete_transaction_logic(c, t_id):
                           (s_id, meal_date))
             except Exception as e:
                 print(f"Error parsing date for meal reversal: {e}")
+
+            # The Account bill is voided: flag it (it stays for the audit trail) and take
+            # it out of the live stats, which only count bills not reversed
+            c.execute('''SELECT id, date, meal_type, payment_mode, user_type, amount FROM bills
+                         WHERE student_id = ? AND date = ? AND payment_mode = 'Account' AND reversed = 0
+                           AND lower(meal_type) = ?
+                         ORDER BY id LIMIT 1''', (s_id, date_str, meal_type_found))
+            bill = c.fetchone()
+            if bill:
+                c.execute("UPDATE bills SET reversed = 1 WHERE id = ?", (bill['id'],))
+                add_daily_stats(c, bill['date'], bill['meal_type'], bill['payment_mode'], bill['user_type'],
+                                -1, -(bill['amount'] or 0))
             
     else:
         new_remaining = curr_remaining + amount
@@ -789,6 +1779,7 @@ def delete_transaction_logic(c, t_id):
         
     c.execute("UPDATE students SET remaining_amount=?, amount_paid=?, payment_status=? WHERE id=?", 
               (new_remaining, new_paid, new_status, s_id))
+    touch_row(c, 'students', s_id)
     
     # 4. Delete Transaction
     c.execute("DELETE FROM student_transactions WHERE id=?", (t_id,))
@@ -805,6 +1796,7 @@ def delete_transaction():
         success, msg = delete_transaction_logic(c, t_id)
         if success:
             conn.commit()
+            stats_broadcaster.notify()
             return jsonify({'status': 'success', 'message': msg})
         else:
             return jsonify({'error': msg}), 404
@@ -827,6 +1819,11 @@ def delete_meal():
     if meal_type not in ['breakfast', 'lunch', 'dinner']:
         return jsonify({'error': 'Invalid meal type'}), 400
 
+    try:
+        day_start, day_end = day_range(date)
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+
     conn = get_db()
     conn.execute("PRAGMA foreign_keys = 1")
     c = conn.cursor()
@@ -834,17 +1831,16 @@ def delete_meal():
     try:
         # 1. Try to find corresponding transaction
         # Search for Food txn on this date with matching remark
-        # Date match must be generous (starts with YYYY-MM-DD)
-        date_pattern = f"{date}%"
+        # Date match must be generous (any time on YYYY-MM-DD)
         # Remark should contain meal type (Title case usually)
         remark_pattern = f"%{meal_type}%" 
         
         # We also need to check 'Food' type
-        query = "SELECT id FROM student_transactions WHERE student_id=? AND type='Food' AND date LIKE ? AND remarks LIKE ?"
+        query = "SELECT id FROM student_transactions WHERE student_id=? AND type='Food' AND date >= ? AND date < ? AND remarks LIKE ?"
         
         # We need to be careful with case sensitivity in LIKE? SQLite LIKE is case-insensitive for ASCII chars by default.
         # But 'remarks' might be "Meal: Lunch" or just "Lunch".
-        c.execute(query, (s_id, date_pattern, remark_pattern))
+        c.execute(query, (s_id, day_start, day_end, remark_pattern))
         row = c.fetchone()
         
         if row:
@@ -859,8 +1855,10 @@ def delete_meal():
             # No transaction found (Stuck meal case). Just clear the meal record.
             print(f"Delete Meal: No transaction found. Force clearing meal.")
             c.execute(f"UPDATE meals SET {meal_type}=0 WHERE student_id=? AND date=?", (s_id, date))
+            touch_row(c, 'students', s_id)
             
         conn.commit()
+        stats_broadcaster.notify()
         return jsonify({'status': 'success'})
         
     except Exception as e:
@@ -871,54 +1869,76 @@ def delete_meal():
 
 @app.route('/api/export')
 def export_data():
-    conn = get_db()
-    c = conn.cursor()
-    
     export_type = request.args.get('type', 'all')
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    operator_id = request.args.get('operator_id')
+    payment_mode = request.args.get('payment_mode')
     
-    if export_type == 'daily':
-        today = datetime.date.today().isoformat()
-        c.execute("SELECT * FROM bills WHERE date LIKE ? ORDER BY date DESC", (today + '%',))
-    else:
-        c.execute("SELECT * FROM bills ORDER BY date DESC")
-        
-    rows = c.fetchall()
+    # Filters are pushed into SQL; dates are whole days (YYYY-MM-DD)
+    conditions, params = [], []
+    try:
+        if export_type == 'daily':
+            start_date = end_date = datetime.date.today().isoformat()
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(day_range(start_date)[0])
+        if end_date:
+            conditions.append("date < ?")
+            params.append(day_range(end_date)[1])
+    except ValueError:
+        return jsonify({'error': 'Invalid date'}), 400
+    if operator_id:
+        conditions.append("operator_id = ?")
+        params.append(operator_id)
+    if payment_mode:
+        conditions.append("payment_mode = ?")
+        params.append(payment_mode)
     
-    # BOM for Excel compatibility with UTF-8
-    # Added separate Date and Time columns
-    output = "\ufeffBill No,Date,Time,Name,Student ID,Meal Type,Amount,Mode,User Type\n"
+    query = "SELECT bill_no, date, guest_name, student_id, meal_type, amount, payment_mode, user_type FROM bills"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY date DESC"
     
-    for row in rows:
+    def generate():
+        # Rows are fetched and written in chunks, so memory stays flat however many bills match
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        # BOM for Excel compatibility with UTF-8
+        buf.write('\ufeff')
+        writer.writerow(['Bill No', 'Date', 'Time', 'Name', 'Student ID', 'Meal Type', 'Amount', 'Mode', 'User Type'])
+        
+        conn = get_db()
         try:
-            d = json.loads(row['details'])
-            name = d.get('guest_name', 'N/A')
-            sid = d.get('student_id', '-')
-            meal = d.get('meal_type', '-')
-            utype = d.get('user_type', '-')
-            
-            # Sanitize CSV fields
-            name = str(name).replace(',', ' ')
-            meal = str(meal).replace(',', ' ')
-            
-            # Split Date and Time (Assumes format YYYY-MM-DD HH:MM:SS)
-            full_date = row['date']
-            try:
-                date_part, time_part = full_date.split(' ')
-            except:
-                date_part, time_part = full_date, ''
-
-            # Format Bill No as text for Excel (prepend tab)
-            bill_no = f"\t{row['bill_no']}"
-            
-            output += f"{bill_no},{date_part},{time_part},{name},{sid},{meal},{row['amount']},{row['payment_mode']},{utype}\n"
-        except Exception as e:
-            output += f"\t{row['bill_no']},{row['date']},,Error Parsing Details,-,-,{row['amount']},{row['payment_mode']},Error\n"
-    
-    conn.close()
+            c = conn.cursor()
+            c.execute(query, tuple(params))
+            while True:
+                rows = c.fetchmany(1000)
+                if not rows: break
+                for row in rows:
+                    # Split Date and Time (Assumes format YYYY-MM-DD HH:MM:SS)
+                    date_part, _, time_part = (row['date'] or '').partition(' ')
+                    writer.writerow([
+                        f"\t{row['bill_no']}",  # Format Bill No as text for Excel (prepend tab)
+                        date_part,
+                        time_part,
+                        row['guest_name'] or 'N/A',
+                        row['student_id'] if row['student_id'] is not None else '-',
+                        row['meal_type'] or '-',
+                        row['amount'],
+                        row['payment_mode'],
+                        row['user_type'] or '-'
+                    ])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+        finally:
+            conn.close()
+        if buf.tell():
+            yield buf.getvalue()
     
-    from flask import Response
     return Response(
-        output,
+        stream_with_context(generate()),
         mimetype="text/csv",
         headers={"Content-disposition": f"attachment; filename=daily_report_{datetime.date.today()}.csv"}
     )
@@ -926,14 +1946,49 @@ def export_data():
 # --- API: Backup ---
 @app.route('/api/backup/excel', methods=['POST'])
 def backup_excel_route():
+    """Start a full Excel backup in the background; poll its status URL."""
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Admin login required'}), 403
     try:
-        from backup_excel import backup_excel
-        filename = backup_excel()
-        return jsonify({'status': 'success', 'message': f'Backup created: {filename}'})
+        job = backup_excel.start_backup(get_pool().db_file)
+        return jsonify({'status': 'started', 'job': job}), 202
+    except backup_excel.BackupRunning as e:
+        return jsonify({'status': 'error', 'message': str(e), 'job': e.job}), 409
     except Exception as e:
         print(f"Backup Error: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/api/backup/excel/<job_id>')
+def backup_excel_status(job_id):
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Admin login required'}), 403
+    job = backup_excel.job_status(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Backup not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/backup/excel/<job_id>/download')
+def backup_excel_download(job_id):
+    if session.get('role') != 'admin':
+        return jsonify({'status': 'error', 'message': 'Admin login required'}), 403
+    job = backup_excel.job_status(job_id)
+    if not job or job['status'] != 'done':
+        return jsonify({'status': 'error', 'message': 'Backup not ready'}), 404
+    return send_from_directory(os.path.abspath(backup_excel.BACKUP_DIR), job['file'], as_attachment=True)
+
+@app.route('/api/admin/snapshots', methods=['GET', 'POST'])
+def database_snapshots():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admin login required'}), 403
+    db_file = get_pool().db_file
+    status = snapshots.snapshot_status(db_file)
+    if request.method == 'POST':
+        if status['running'] is not None:
+            return jsonify({'status': 'error', 'message': 'A snapshot is already being taken', 'running': status['running']}), 409
+        snapshots.run_in_background(db_file)
+        return jsonify({'status': 'started'}), 202
+    return jsonify(status)
+
 @app.route('/api/reports/monthly', methods=['GET'])
 def monthly_report():
     month = request.args.get('month')
@@ -941,38 +1996,41 @@ def monthly_report():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    # Query construction
-    query = '''
-        SELECT s.name, s.regd_no, 
-               SUM(m.breakfast) as b_count, 
-               SUM(m.lunch) as l_count, 
-               SUM(m.dinner) as d_count
-        FROM meals m
-        JOIN students s ON m.student_id = s.id
-    '''
+    try:
+        if start_date and end_date:
+            start = datetime.date.fromisoformat(start_date)
+            end = datetime.date.fromisoformat(end_date)
+        elif month and year:
+            start = datetime.date(int(year), int(month), 1)
+            end = datetime.date.fromisoformat(month_range(year, month)[1]) - datetime.timedelta(days=1)
+        else:
+            return jsonify({'error': 'Month/Year OR Date Range required'}), 400
+    except ValueError:
+        return jsonify({'error': 'Invalid month/year or date range'}), 400
+
+    # Whole months come straight from the rollup; only partial edge days are aggregated from meals
+    first_month, last_month, edges = meal_report_parts(start, end)
+    parts = []
     params = []
-    
-    if start_date and end_date:
-        query += " WHERE m.date >= ? AND m.date <= ?"
-        # Start date should be 00:00:00 and end date 23:59:59 effectively
-        # But our DB stores 'YYYY-MM-DD' for meals table usually?
-        # Let's check schema. Meals table 'date' is usually just YYYY-MM-DD from 'create_bill' logic?
-        # In student_transactions it is datetime. In meals it is date.
-        # Let's check verify_fix.py: INSERT INTO meals ... VALUES ... today (isoformat)
-        # So meals.date is YYYY-MM-DD.
-        params = [start_date, end_date]
-        
-    elif month and year:
-        # Construct date pattern for LIKE query 'YYYY-MM-%'
-        month_str = str(month).zfill(2)
-        date_pattern = f"{year}-{month_str}-%"
-        query += " WHERE m.date LIKE ?"
-        params = [date_pattern]
-        
-    else:
-        return jsonify({'error': 'Month/Year OR Date Range required'}), 400
-        
-    query += " GROUP BY m.student_id ORDER BY s.name"
+    if first_month:
+        parts.append("""SELECT student_id, days, breakfast, lunch, dinner, cost FROM monthly_meals
+                        WHERE month >= ? AND month <= ?""")
+        params += [first_month, last_month]
+    for edge_start, edge_end in edges:
+        parts.append(f"""SELECT student_id, 1 AS days, COALESCE(breakfast, 0) AS breakfast, COALESCE(lunch, 0) AS lunch,
+                                COALESCE(dinner, 0) AS dinner, {meal_cost_sql('')} AS cost
+                         FROM meals WHERE date >= ? AND date < ? AND student_id IS NOT NULL""")
+        params += [edge_start, edge_end]
+
+    query = f"""
+        SELECT s.name, s.regd_no,
+               SUM(r.breakfast) AS b_count, SUM(r.lunch) AS l_count, SUM(r.dinner) AS d_count, SUM(r.cost) AS cost
+        FROM ({' UNION ALL '.join(parts)}) r
+        JOIN students s ON r.student_id = s.id
+        GROUP BY r.student_id
+        HAVING SUM(r.days) > 0
+        ORDER BY s.name
+    """
     
     try:
         conn = get_db()
@@ -983,19 +2041,13 @@ def monthly_report():
         
         report = []
         for r in rows:
-            # Calculate cost (B=20, L=40, D=40) - Hardcoded pricing
-            b = r['b_count'] or 0
-            l = r['l_count'] or 0
-            d = r['d_count'] or 0
-            total = (b * 20) + (l * 40) + (d * 40)
-            
             report.append({
                 'name': r['name'],
                 'regd_no': r['regd_no'],
-                'breakfast': b,
-                'lunch': l,
-                'dinner': d,
-                'total_cost': total
+                'breakfast': r['b_count'] or 0,
+                'lunch': r['l_count'] or 0,
+                'dinner': r['d_count'] or 0,
+                'total_cost': r['cost'] or 0
             })
             
         return jsonify(report)
@@ -1033,6 +2085,7 @@ def student_payment():
         
         if c.rowcount == 0:
              return jsonify({'error': 'Student not found'}), 404
+        touch_row(c, 'students', student_id)
         
         # 2. Log Transaction
         c.execute("INSERT INTO student_transactions (student_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, 'Payment', ?)",
@@ -1052,28 +2105,26 @@ def manage_staff():
     c = conn.cursor()
     try:
         if request.method == 'GET':
-            c.execute("SELECT * FROM staff ORDER BY name")
-            rows = [dict(row) for row in c.fetchall()]
-            
-            # Enrich with balance info (similar to students)
-            # Staff balance logic: Total Food Cost (Transactions 'Food') - Total Paid (Transactions 'Payment' implied? Or just Ledger?)
-            # Actually, let's keep it simpler for now:
-            # We need to query staff_transactions to calculate balance.
-            # Balance = SUM(Amount where type='Food') - SUM(Amount where type='Payment')
-            # Warning: Optimization - Querying inside loop is slow. But for <100 staff it's fine.
-            
-            enriched = []
-            for s in rows:
-                c.execute("SELECT SUM(amount) FROM staff_transactions WHERE staff_id=? AND type='Food'", (s['id'],))
-                food_cost = c.fetchone()[0] or 0
-                
-                c.execute("SELECT SUM(amount) FROM staff_transactions WHERE staff_id=? AND type='Payment'", (s['id'],))
-                paid = c.fetchone()[0] or 0
+            since = parse_since()
+            version = current_version(c)
+            # Balance = SUM(Amount where type='Food') - SUM(Amount where type='Payment'),
+            # computed in the same statement from idx_staff_tx_staff_type (index-only probes per staff)
+            c.execute('''
+                SELECT s.*,
+                       COALESCE((SELECT SUM(amount) FROM staff_transactions
+                                 WHERE staff_id = s.id AND type = 'Food'), 0)
+                     - COALESCE((SELECT SUM(amount) FROM staff_transactions
+                                 WHERE staff_id = s.id AND type = 'Payment'), 0) AS balance
+                FROM staff s
+                WHERE s.row_version > ?
+                ORDER BY s.name
+            ''', (since if since else -1,))
+            enriched = [dict(row) for row in c.fetchall()]
                 
-                s['balance'] = food_cost - paid
-                enriched.append(s)
-                
-            return jsonify(enriched)
+            if since is None:
+                return jsonify(enriched)
+            deleted = deleted_since(c, 'staff', since) if since else []
+            return jsonify({'version': version, 'full': not since, 'staff': enriched, 'deleted': deleted})
 
         if request.method == 'POST':
             data = request.json
@@ -1082,6 +2133,7 @@ def manage_staff():
             phone = data.get('phone', '')
             c.execute("INSERT INTO staff (name, dept, phone, created_at) VALUES (?, ?, ?, ?)",
                       (name, dept, phone, datetime.datetime.now().strftime("%Y-%m-%d")))
+            touch_row(c, 'staff', c.lastrowid)
             conn.commit()
             return jsonify({'status': 'success'})
 
@@ -1089,12 +2141,15 @@ def manage_staff():
             data = request.json
             c.execute("UPDATE staff SET name=?, dept=?, phone=? WHERE id=?",
                       (data['name'], data.get('dept'), data.get('phone'), data['id']))
+            touch_row(c, 'staff', data['id'])
             conn.commit()
             return jsonify({'status': 'success'})
 
         if request.method == 'DELETE':
             sid = request.args.get('id')
             c.execute("DELETE FROM staff WHERE id=?", (sid,))
+            if c.rowcount:
+                record_tombstone(c, 'staff', sid)
             c.execute("DELETE FROM staff_transactions WHERE staff_id=?", (sid,))
             conn.commit()
             return jsonify({'status': 'success'})
@@ -1136,11 +2191,12 @@ def get_staff_report(staff_id):
         
     # Calculate Balance
     # Balance = Food - Paid
-    c.execute("SELECT SUM(amount) FROM staff_transactions WHERE staff_id=? AND type='Food'", (staff_id,))
-    food_total = c.fetchone()[0] or 0
-    
-    c.execute("SELECT SUM(amount) FROM staff_transactions WHERE staff_id=? AND type='Payment'", (staff_id,))
-    paid_total = c.fetchone()[0] or 0
+    c.execute("""SELECT SUM(CASE WHEN type='Food' THEN amount END) AS food,
+                        SUM(CASE WHEN type='Payment' THEN amount END) AS paid
+                 FROM staff_transactions WHERE staff_id=?""", (staff_id,))
+    totals = c.fetchone()
+    food_total = totals['food'] or 0
+    paid_total = totals['paid'] or 0
     
     staff_data['balance'] = food_total - paid_total
     staff_data['total_food'] = food_total
@@ -0,0 +1,469 @@
+import os
+import sys
+import io
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+# --- CONFIGURATION MUST BE BEFORE IMPORT ---
+# archive/ holds an old copy of app.py: make sure the live one is imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TEST_DIR = tempfile.mkdtemp(prefix='canteen_tests_')
+TEST_DB = os.path.join(TEST_DIR, 'test_canteen.db')
+os.environ['FLASK_ENV'] = 'testing'
+os.environ['DB_PATH'] = TEST_DB
+os.environ['SNAPSHOT_INTERVAL_HOURS'] = '0'
+os.environ['IMPORT_DIR'] = os.path.join(TEST_DIR, 'imports')
+os.environ['METRICS_DIR'] = os.path.join(TEST_DIR, 'metrics')
+
+import app as app_module
+from app import app, init_db, rebuild_daily_stats, import_student_rows
+
+class CoreFeatureTests(unittest.TestCase):
+    """Delta sync, idempotent billing, report paging and the meal rollup."""
+
+    def setUp(self):
+        """Fresh database for every test"""
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+        self.app = app.test_client()
+        with app.app_context():
+            init_db()
+
+    def db(self):
+        conn = sqlite3.connect(TEST_DB)
+        self.addCleanup(conn.close)
+        return conn
+
+    def add_student(self, name, regd_no):
+        res = self.app.post('/api/students', json={'name': name, 'regd_no': regd_no, 'dept': 'CSE'})
+        self.assertEqual(res.status_code, 200, res.json)
+        return res.json['id']
+
+    def bill(self, student_id, meal_type, key=None):
+        headers = {'Idempotency-Key': key} if key else {}
+        res = self.app.post('/api/bill', headers=headers, json={
+            'user_type': 'hostel', 'student_id': str(student_id), 'meal_type': meal_type,
+            'amount': 40, 'payment_mode': 'Account', 'operator_id': 2})
+        self.assertEqual(res.status_code, 200, res.json)
+        return res.json
+
+    # --- Delta Sync ---
+    def test_delta_sync_deleted_then_recreated_id(self):
+        """An id deleted and reused after `since` comes back as deleted *and* as the new row"""
+        a = self.add_student('Asha', 'R1')
+        b = self.add_student('Bala', 'R2')
+        full = self.app.get('/api/students?since=0').json
+        roster = {s['id']: s for s in full['students']}
+        self.assertEqual(set(roster), {a, b})
+
+        self.assertEqual(self.app.delete(f'/api/students?id={b}').status_code, 200)
+        c = self.add_student('Chitra', 'R3')
+        self.assertEqual(c, b)  # lowest free id is reused
+
+        delta = self.app.get(f"/api/students?since={full['version']}").json
+        self.assertFalse(delta['full'])
+        self.assertIn(b, delta['deleted'])
+        self.assertEqual([s['name'] for s in delta['students'] if s['id'] == c], ['Chitra'])
+
+        # Client order (static/js/app.js applyRosterDelta): drop deleted ids, then apply rows
+        for sid in delta['deleted']:
+            roster.pop(sid, None)
+        for s in delta['students']:
+            roster[s['id']] = s
+        self.assertEqual({sid: s['name'] for sid, s in roster.items()}, {a: 'Asha', c: 'Chitra'})
+
+        # Nothing changed since: an empty delta
+        again = self.app.get(f"/api/students?since={delta['version']}").json
+        self.assertEqual((again['students'], again['deleted']), ([], []))
+
+    # --- Student Ids ---
+    def create_racing(self, threads=8):
+        """Half single, half bulk (3 each) creates, started together; returns the status codes and the ids."""
+        barrier = threading.Barrier(threads)
+        results = []
+
+        def create(n):
+            client = app.test_client()
+            barrier.wait()
+            if n % 2:
+                res = client.post('/api/students', json=[{'name': f"B{n}-{k}", 'regd_no': f"B{n}-{k}-{time.time()}",
+                                                          'dept': 'CSE'} for k in range(3)])
+                results.append((res.status_code, res.json.get('ids') or []))
+            else:
+                res = client.post('/api/students', json={'name': f"T{n}", 'regd_no': f"T{n}-{time.time()}", 'dept': 'CSE'})
+                results.append((res.status_code, [res.json.get('id')]))
+
+        workers = [threading.Thread(target=create, args=(n,)) for n in range(threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return [code for code, _ in results], [i for _, batch in results for i in batch]
+
+    def test_concurrent_id_allocation_reuses_free_ids_once(self):
+        """Single and bulk creates racing in threads get unique ids, lowest free ones first"""
+        ids = [self.add_student(f"S{i}", f"R{i}") for i in range(1, 11)]
+        self.assertEqual(ids, list(range(1, 11)))
+        for sid in (3, 5, 7):
+            self.assertEqual(self.app.delete(f'/api/students?id={sid}').status_code, 200)
+        conn = self.db()
+        conn.execute("INSERT INTO student_free_ids (id) VALUES (8)")  # stale: id 8 is still taken
+        conn.commit()
+
+        allocate = app_module.allocate_student_ids
+
+        def slow_allocate(c, count=1):
+            ids = allocate(c, count)
+            time.sleep(0.02)  # widen the window between reserving ids and inserting them
+            return ids
+        patcher = mock.patch.object(app_module, 'allocate_student_ids', slow_allocate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # Free ids first, then new ones past the highest
+        codes, new_ids = self.create_racing()
+        self.assertEqual(codes, [200] * 8)
+        self.assertEqual(sorted(new_ids), [3, 5, 7] + list(range(11, 24)))
+        self.assertEqual(conn.execute("SELECT name FROM students WHERE id = 8").fetchone(), ('S8',))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM student_free_ids").fetchone(), (0,))
+
+        # Free list empty: every id comes from MAX(id)
+        codes, new_ids = self.create_racing()
+        self.assertEqual(codes, [200] * 8)
+        self.assertEqual(sorted(new_ids), list(range(24, 40)))
+
+        # Deleting an id that does not exist leaves no tombstone behind
+        before = conn.execute("SELECT COUNT(*) FROM sync_tombstones").fetchone()
+        self.assertEqual(self.app.delete('/api/students?id=999').status_code, 200)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM sync_tombstones").fetchone(), before)
+
+    # --- Idempotent Billing ---
+    def test_bill_replay_with_same_idempotency_key(self):
+        """A retried bill with the same key returns the first bill and records nothing new"""
+        sid = self.add_student('Dev', 'R4')
+        first = self.bill(sid, 'Lunch', key='counter1-0001')
+        replay = self.bill(sid, 'Lunch', key='counter1-0001')
+        self.assertEqual(replay['bill_no'], first['bill_no'])
+
+        conn = self.db()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM student_transactions WHERE student_id=?",
+                                      (sid,)).fetchone()[0], 1)
+        self.assertEqual(self.app.get('/api/reports/meals').json['Lunch'], 1)
+
+        other = self.bill(sid, 'Dinner', key='counter1-0002')
+        self.assertNotEqual(other['bill_no'], first['bill_no'])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0], 2)
+
+    def test_batch_with_failing_items_keeps_the_rest(self):
+        """A batch commits its good items; failed ones leave nothing behind, each reported in order"""
+        sid = self.add_student('Jaya', 'R10')
+        # A ledger write that fails after the item's bill, stats, meal and balance are already written
+        conn = self.db()
+        conn.execute("""CREATE TRIGGER fail_ledger BEFORE INSERT ON student_transactions WHEN NEW.amount = 13
+                        BEGIN SELECT RAISE(ABORT, 'ledger unavailable'); END""")
+        conn.commit()
+        good = {'user_type': 'hostel', 'student_id': str(sid), 'meal_type': 'Lunch', 'amount': 40,
+                'payment_mode': 'Account', 'operator_id': 2, 'idempotency_key': 'counter2-0001'}
+        res = self.app.post('/api/bill/batch', json=[
+            good,
+            {'user_type': 'alien', 'meal_type': 'Lunch', 'amount': 40},              # rejected up front
+            {'user_type': 'hostel', 'student_id': str(sid), 'meal_type': 'Breakfast', 'amount': 13,
+             'payment_mode': 'Account', 'operator_id': 2},                            # fails half-way through
+            {'user_type': 'normal', 'guest_name': 'Walk-in', 'meal_type': 'Dinner', 'amount': 50,
+             'payment_mode': 'Cash', 'operator_id': 2},
+            dict(good),                                                                # same key again
+        ])
+        self.assertEqual(res.status_code, 200, res.json)
+        body = res.json
+        self.assertEqual([(r['index'], r['status']) for r in body['results']],
+                         [(0, 'success'), (1, 'error'), (2, 'error'), (3, 'success'), (4, 'success')])
+        self.assertEqual((body['applied'], body['failed']), (2, 2))
+        self.assertIn('ledger unavailable', body['results'][2]['message'])
+        self.assertTrue(body['results'][4]['replayed'])
+        self.assertEqual(body['results'][4]['bill_no'], body['results'][0]['bill_no'])
+
+        self.assertEqual(sorted(row[0] for row in conn.execute("SELECT bill_no FROM bills")),
+                         sorted([body['results'][0]['bill_no'], body['results'][3]['bill_no']]))
+        self.assertEqual(conn.execute("SELECT remaining_amount FROM students WHERE id = ?", (sid,)).fetchone(), (40,))
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM student_transactions").fetchone(), (1,))
+        self.assertEqual(conn.execute("SELECT SUM(count), SUM(revenue) FROM daily_stats").fetchone(), (2, 90))
+        self.assertEqual(conn.execute("SELECT breakfast, lunch, dinner FROM meals WHERE student_id = ?",
+                                      (sid,)).fetchall(), [(0, 1, 0)])
+
+    # --- Report Paging ---
+    def seed_history(self, sid):
+        """Cash bills and ledger rows sharing timestamps and ids; returns items newest first."""
+        conn = self.db()
+        rows = []  # (date, id, src, item)
+        for i in range(1, 13):
+            date = f"2026-0{1 + i % 3}-1{i % 4} 12:00:00"
+            conn.execute("""INSERT INTO bills (id, bill_no, date, amount, payment_mode, user_type, student_id, meal_type)
+                            VALUES (?, ?, ?, 30, 'Cash', 'hostel', ?, ?)""", (i, f"B{i}", date, sid, f"bill{i}"))
+            rows.append((date, i, 0, f"bill{i}"))
+            # Same id as a bill on every third row, same date on every other
+            tx_id = i if i % 3 == 0 else 100 + i
+            tx_date = date if i % 2 == 0 else f"2026-0{1 + i % 3}-2{i % 4} 09:00:00"
+            conn.execute("""INSERT INTO student_transactions (id, student_id, amount, date, mode, type, remarks)
+                            VALUES (?, ?, 40, ?, 'Account', 'Food', ?)""", (tx_id, sid, tx_date, f"tx{i}"))
+            rows.append((tx_date, tx_id, 1, f"tx{i}"))
+        # Neither belongs in the student's history: an Account bill and a staff bill
+        conn.execute("""INSERT INTO bills (bill_no, date, amount, payment_mode, user_type, student_id, meal_type)
+                        VALUES ('A1', '2026-02-11 12:00:00', 40, 'Account', 'hostel', ?, 'acct')""", (sid,))
+        conn.execute("""INSERT INTO bills (bill_no, date, amount, payment_mode, user_type, student_id, meal_type)
+                        VALUES ('S1', '2026-02-11 12:00:00', 40, 'Cash', 'staff', ?, 'staff')""", (sid,))
+        for day in range(1, 11):
+            conn.execute("INSERT INTO meals (student_id, date, breakfast, lunch, dinner) VALUES (?, ?, 1, ?, 0)",
+                         (sid, f"2026-02-{day:02d}", day % 2))
+        conn.commit()
+        return rows
+
+    def walk(self, url, list_key, cursor_param, cursor_key, limit):
+        res = self.app.get(f"{url}?limit={limit}")
+        self.assertEqual(res.status_code, 200, res.json)
+        page = res.json
+        items = list(page[list_key])
+        pages = 1
+        while page[cursor_key]:
+            self.assertLessEqual(len(page[list_key]), limit)
+            page = self.app.get(url, query_string={'limit': limit, cursor_param: page[cursor_key]}).json
+            items += page[list_key]
+            pages += 1
+        return items, pages
+
+    def test_cursor_paging_has_no_duplicates_or_gaps(self):
+        """Paging the merged bills/ledger history and the meals returns every row exactly once, in order"""
+        sid = self.add_student('Esha', 'R5')
+        rows = self.seed_history(sid)
+        expected = [item for *_, item in sorted(rows, reverse=True)]
+        url = f'/api/reports/student/{sid}'
+
+        for limit in (1, 3, 5, len(expected), 500):
+            items, pages = self.walk(url, 'transactions', 'cursor', 'next_cursor', limit)
+            self.assertEqual([t['item'] for t in items], expected, f"limit={limit}")
+            self.assertEqual(pages, max(1, -(-len(expected) // limit)))
+
+            meals, _ = self.walk(url, 'meals', 'meals_cursor', 'meals_next_cursor', limit)
+            self.assertEqual([m['date'] for m in meals], [f"2026-02-{d:02d}" for d in range(10, 0, -1)])
+
+        # Date filters apply to every page
+        res = self.app.get(url, query_string={'limit': 2, 'start_date': '2026-02-01', 'end_date': '2026-02-28'}).json
+        items = res['transactions']
+        cursor = res['next_cursor']
+        while cursor:
+            page = self.app.get(url, query_string={'limit': 2, 'start_date': '2026-02-01',
+                                                   'end_date': '2026-02-28', 'cursor': cursor}).json
+            items += page['transactions']
+            cursor = page['next_cursor']
+        self.assertEqual([t['item'] for t in items],
+                         [item for date, _, _, item in sorted(rows, reverse=True) if date.startswith('2026-02')])
+
+        self.assertEqual(res['summary']['breakfast'], 10)
+        self.assertEqual(res['summary']['lunch'], 5)
+
+    def test_bad_cursor_and_limit_rejected(self):
+        sid = self.add_student('Farah', 'R6')
+        url = f'/api/reports/student/{sid}'
+        self.assertEqual(self.app.get(url, query_string={'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.app.get(url, query_string={'meals_cursor': 'WyJ4Il0'}).status_code, 400)
+        self.assertEqual(self.app.get(url, query_string={'limit': 0}).status_code, 400)
+        self.assertEqual(self.app.get(url, query_string={'limit': 501}).status_code, 400)
+
+    # --- Meal Rollup ---
+    def assertRollupMatchesMeals(self):
+        conn = self.db()
+        raw = conn.execute(f"""SELECT substr(date, 1, 7), student_id, COUNT(*), SUM(COALESCE(breakfast, 0)),
+                                      SUM(COALESCE(lunch, 0)), SUM(COALESCE(dinner, 0)), SUM({app_module.meal_cost_sql('')})
+                               FROM meals WHERE student_id IS NOT NULL GROUP BY 1, 2""").fetchall()
+        rollup = conn.execute("""SELECT month, student_id, days, breakfast, lunch, dinner, cost FROM monthly_meals
+                                 WHERE days != 0 OR breakfast != 0 OR lunch != 0 OR dinner != 0""").fetchall()
+        self.assertEqual(sorted(rollup), sorted(raw))
+
+    def test_monthly_meals_follow_insert_update_delete(self):
+        """monthly_meals equals a GROUP BY over meals after every kind of change"""
+        a = self.add_student('Gita', 'R7')
+        b = self.add_student('Hari', 'R8')
+
+        # Insert: through billing and directly
+        self.bill(a, 'Breakfast')
+        self.bill(a, 'Lunch')
+        self.bill(b, 'Dinner')
+        conn = self.db()
+        conn.executemany("INSERT INTO meals (student_id, date, breakfast, lunch, dinner) VALUES (?, ?, ?, ?, ?)",
+                         [(a, '2026-01-31', 1, 1, 1), (a, '2026-02-01', 0, 1, None), (b, '2026-01-15', 1, 0, 0)])
+        conn.commit()
+        self.assertRollupMatchesMeals()
+
+        # Update: flags, a date moved across a month, a row moved to another student
+        conn.execute("UPDATE meals SET dinner = 1 WHERE student_id = ? AND date = '2026-02-01'", (a,))
+        conn.execute("UPDATE meals SET date = '2026-02-28' WHERE student_id = ? AND date = '2026-01-31'", (a,))
+        conn.execute("UPDATE meals SET student_id = ? WHERE student_id = ? AND date = '2026-01-15'", (a, b))
+        conn.commit()
+        self.assertRollupMatchesMeals()
+
+        # Delete: one meal through the API, then every meal of a student
+        today = conn.execute("SELECT date FROM meals WHERE student_id = ? ORDER BY date DESC LIMIT 1", (b,)).fetchone()[0]
+        res = self.app.delete(f'/api/meals?student_id={b}&date={today}&type=dinner')
+        self.assertEqual(res.status_code, 200, res.json)
+        self.assertRollupMatchesMeals()
+        conn.execute("DELETE FROM meals WHERE student_id = ?", (a,))
+        conn.commit()
+        self.assertRollupMatchesMeals()
+
+    def test_price_change_keeps_recorded_meal_costs(self):
+        """Meals cost what they were billed at, before and after MEAL_PRICES changes"""
+        a = self.add_student('Jaya', 'R10')
+        self.bill(a, 'Breakfast')
+        with mock.patch.dict(app_module.MEAL_PRICES, {'breakfast': 25, 'lunch': 45}):
+            with app.app_context():
+                init_db()  # a restart with the new prices
+            self.bill(a, 'Lunch')
+            conn = self.db()
+            self.assertEqual(conn.execute("SELECT cost FROM monthly_meals WHERE student_id = ?", (a,)).fetchone()[0], 65)
+
+            # Reversing the breakfast takes off the 20 it was billed at, not today's 25
+            today = conn.execute("SELECT date FROM meals WHERE student_id = ?", (a,)).fetchone()[0]
+            self.assertEqual(self.app.delete(f'/api/meals?student_id={a}&date={today}&type=breakfast').status_code, 200)
+            self.assertEqual(conn.execute("SELECT cost FROM monthly_meals WHERE student_id = ?", (a,)).fetchone()[0], 45)
+            self.assertRollupMatchesMeals()
+        summary = self.app.get(f'/api/reports/student/{a}').json['summary']
+        self.assertEqual((summary['lunch'], summary['total_cost']), (1, 45))
+
+    def test_meals_recorded_before_prices_were_stored(self):
+        """Existing meals are priced once at the current prices, matching the costs already rolled up"""
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+        conn = sqlite3.connect(TEST_DB)
+        conn.execute("""CREATE TABLE meals (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, date TEXT NOT NULL,
+                                            breakfast INTEGER DEFAULT 0, lunch INTEGER DEFAULT 0, dinner INTEGER DEFAULT 0)""")
+        conn.execute("INSERT INTO meals (student_id, date, breakfast, lunch, dinner) VALUES (1, '2026-01-05', 1, 0, 1)")
+        conn.commit()
+        conn.close()
+        with app.app_context():
+            init_db()
+            init_db()
+
+        conn = self.db()
+        self.assertEqual(conn.execute("SELECT breakfast_price, lunch_price, dinner_price FROM meals").fetchone(), (20, None, 40))
+        self.assertEqual(conn.execute("SELECT cost FROM monthly_meals").fetchone()[0], 60)
+        self.assertRollupMatchesMeals()
+
+    # --- Bill Columns Migration ---
+    def test_bill_details_backfill_reruns_until_complete(self):
+        """Old bills get their typed columns from details, even if the first backfill fails"""
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(TEST_DB + suffix):
+                os.remove(TEST_DB + suffix)
+        conn = sqlite3.connect(TEST_DB)
+        conn.execute("""CREATE TABLE bills (id INTEGER PRIMARY KEY AUTOINCREMENT, bill_no TEXT UNIQUE, date TEXT,
+                                            operator_id INTEGER, amount REAL, details TEXT, payment_mode TEXT)""")
+        conn.executemany("INSERT INTO bills (bill_no, date, amount, details, payment_mode) VALUES (?, ?, 40, ?, 'Cash')", [
+            ('B1', '2026-01-01 08:00:00', '{"user_type": "hostel", "student_id": "7", "meal_type": "Breakfast"}'),
+            ('B2', '2026-01-01 08:01:00', '5'),          # valid JSON, not an object
+            ('B3', '2026-01-01 08:02:00', '{broken'),
+            ('B4', '2026-01-01 08:03:00', '{"user_type": "normal", "guest_name": "Walk-in", "meal_type": "Lunch"}'),
+        ])
+        conn.commit()
+        conn.close()
+
+        with app.app_context():
+            with mock.patch.object(app_module, 'backfill_bill_columns', side_effect=RuntimeError('disk full')):
+                init_db()
+            conn = self.db()
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM bills WHERE user_type IS NOT NULL").fetchone()[0], 0)
+            init_db()  # next start: columns exist now, but the backfill was never recorded as done
+
+        rows = conn.execute("SELECT bill_no, user_type, student_id, guest_name, meal_type FROM bills ORDER BY id").fetchall()
+        self.assertEqual(rows, [('B1', 'hostel', 7, None, 'Breakfast'), ('B2', None, None, None, None),
+                                ('B3', None, None, None, None), ('B4', 'normal', None, 'Walk-in', 'Lunch')])
+        self.assertIn(('bill_detail_columns',), conn.execute("SELECT name FROM migrations").fetchall())
+
+    # --- Student Import ---
+    def run_import(self, filename, content):
+        res = self.app.post('/api/students/import', data={'file': (io.BytesIO(content), filename)},
+                            content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 202, res.json)
+        for _ in range(100):
+            job = self.app.get(f"/api/students/import/{res.json['job']['id']}").json
+            if job['status'] != 'running':
+                return job
+            time.sleep(0.05)
+        self.fail('import did not finish')
+
+    def test_import_same_list_twice(self):
+        """A second import updates the columns it has, and placeholders and conflicts never fail it"""
+        job = self.run_import('list.csv', b"Name,Regd No,Dept,Phone\nAsha,R1,CSE,111\nBala,,EEE,222\nAsha K,R1,CSE,333\n")
+        self.assertEqual((job['status'], job['added'], job['duplicates']), ('done', 2, 1))
+
+        # No phone column this time: stored phones stay
+        job = self.run_import('list2.csv', b"Name,Regd No,Dept\nAsha R,R1,ME\nChitra,R3,CSE\n")
+        self.assertEqual((job['status'], job['added'], job['updated']), ('done', 1, 1))
+        job = self.run_import('list.csv', b"Name,Regd No,Dept,Phone\nBala,,EEE,222\n")
+        self.assertEqual((job['status'], job['added'], job['updated']), ('done', 0, 1))
+        conn = self.db()
+        rows = conn.execute("SELECT name, dept, phone FROM students ORDER BY id").fetchall()
+        self.assertEqual(rows, [('Asha R', 'ME', '111'), ('Bala', 'EEE', '222'), ('Chitra', 'CSE', '')])
+
+        # A student added by another request between reading and writing the chunk
+        def rows_with_race():
+            yield {'name': 'Dev', 'regd_no': 'R4', 'dept': 'CSE'}
+            other = sqlite3.connect(TEST_DB)
+            other.execute("INSERT INTO students (id, name, regd_no, dept) VALUES (99, 'Dev (desk)', 'R5', 'CSE')")
+            other.commit()
+            other.close()
+            yield {'name': 'Esha', 'regd_no': 'R5', 'dept': 'EEE'}
+        with app.app_context():
+            import_conn = sqlite3.connect(TEST_DB)
+            self.addCleanup(import_conn.close)
+            stats = import_student_rows(import_conn, rows_with_race())
+        self.assertEqual((stats['added'], stats['updated']), (1, 1))
+        self.assertEqual(conn.execute("SELECT id, name, dept FROM students WHERE regd_no = 'R5'").fetchone(), (99, 'Esha', 'EEE'))
+
+        # A file that cannot be read ends the job as error, with the reason
+        job = self.run_import('broken.xlsx', b"not a workbook")
+        self.assertEqual(job['status'], 'error')
+        self.assertTrue(job['error'])
+        res = self.app.post('/api/students/import', data={'file': (io.BytesIO(b"x"), 'list.pdf')},
+                            content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 400)
+
+    # --- Daily Stats ---
+    def test_reversal_keeps_daily_stats_equal_to_rebuild(self):
+        """Reversing a meal leaves daily_stats exactly as a fresh backfill from bills would build it"""
+        a = self.add_student('Indu', 'R9')
+        self.bill(a, 'Breakfast')
+        self.bill(a, 'Lunch')
+        self.bill(a, 'Dinner')
+        res = self.app.post('/api/bill', json={'user_type': 'normal', 'guest_name': 'Walk-in', 'meal_type': 'Lunch',
+                                                'amount': 50, 'payment_mode': 'Cash', 'operator_id': 2})
+        self.assertEqual(res.status_code, 200, res.json)
+
+        # Reversed twice over: the transaction itself, and a meal through its transaction
+        conn = self.db()
+        lunch_tx = conn.execute("SELECT id FROM student_transactions WHERE remarks = 'Meal: Lunch'").fetchone()[0]
+        self.assertEqual(self.app.delete(f'/api/transactions?id={lunch_tx}').status_code, 200)
+        today = conn.execute("SELECT date FROM meals WHERE student_id = ?", (a,)).fetchone()[0]
+        self.assertEqual(self.app.delete(f'/api/meals?student_id={a}&date={today}&type=dinner').status_code, 200)
+
+        # The bills stay, flagged
+        self.assertEqual(conn.execute("SELECT meal_type, reversed FROM bills WHERE student_id = ? ORDER BY id",
+                                      (a,)).fetchall(), [('Breakfast', 0), ('Lunch', 1), ('Dinner', 1)])
+        live = conn.execute("""SELECT date, meal_type, payment_mode, user_type, count, revenue FROM daily_stats
+                               WHERE count != 0 OR revenue != 0 ORDER BY 1, 2, 3, 4""").fetchall()
+        self.assertEqual(sorted((meal, count) for _, meal, _, _, count, _ in live), [('Breakfast', 1), ('Lunch', 1)])
+
+        rebuild_daily_stats(conn.cursor())
+        rebuilt = conn.execute("""SELECT date, meal_type, payment_mode, user_type, count, revenue FROM daily_stats
+                                  ORDER BY 1, 2, 3, 4""").fetchall()
+        conn.rollback()
+        self.assertEqual(live, rebuilt)
+
+if __name__ == '__main__':
+    unittest.main()
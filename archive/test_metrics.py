@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# --- CONFIGURATION MUST BE BEFORE IMPORT ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TEST_DIR = tempfile.mkdtemp(prefix='canteen_metrics_tests_')
+os.environ.setdefault('FLASK_ENV', 'testing')
+os.environ.setdefault('DB_PATH', os.path.join(TEST_DIR, 'metrics.db'))
+os.environ.setdefault('SNAPSHOT_INTERVAL_HOURS', '0')
+os.environ.setdefault('METRICS_DIR', os.path.join(TEST_DIR, 'metrics'))
+
+import metrics
+from app import app, init_db
+
+def requests_total(text, route):
+    """Sum of canteen_http_requests_total over every series for route"""
+    pattern = r'canteen_http_requests_total\{route="' + re.escape(route) + r'",[^}]*\} (\d+)'
+    return sum(int(n) for n in re.findall(pattern, text))
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'needs fork to run a second worker')
+class WorkerMetricsTests(unittest.TestCase):
+    """/api/metrics adds up every worker process, including ones that have exited."""
+
+    def setUp(self):
+        with app.app_context():
+            init_db()
+        self.app = app.test_client()
+
+    def scrape(self):
+        res = self.app.get('/api/metrics')
+        self.assertEqual(res.status_code, 200)
+        return res.get_data(as_text=True)
+
+    def run_worker(self, requests):
+        """Serve `requests` GETs of /api/operators in a forked worker, which then exits"""
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                client = app.test_client()
+                for _ in range(requests):
+                    client.get('/api/operators').close()  # counted when the response closes
+                metrics.flush()
+                code = 0
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+    def test_scrape_counts_other_and_exited_workers(self):
+        before = requests_total(self.scrape(), '/api/operators')
+        self.app.get('/api/operators').close()
+        self.run_worker(3)
+        self.assertEqual(requests_total(self.scrape(), '/api/operators'), before + 4)
+
+        # The exited worker's file is folded away, and its requests still count, once
+        names = os.listdir(metrics.METRICS_DIR)
+        self.assertIn(metrics.RETIRED_NAME, names)
+        self.assertEqual(len([n for n in names if n.endswith('.json')]), 2, names)
+        self.run_worker(2)
+        self.assertEqual(requests_total(self.scrape(), '/api/operators'), before + 6)
+        self.assertEqual(requests_total(self.scrape(), '/api/operators'), before + 6)
+        self.assertNotIn('worker=', self.scrape())
+
+    def test_interrupted_fold_counts_workers_once(self):
+        self.run_worker(2)
+        before = requests_total(self.scrape(), '/api/operators')
+        self.run_worker(5)
+        # Fold, but leave the exited worker's file behind, as if killed before removing it
+        guard = metrics.acquire_lock(os.path.join(metrics.METRICS_DIR, metrics.FOLD_LOCK_NAME))
+        with mock.patch.object(metrics.os, 'remove') as remove:
+            metrics.fold_exited()
+        metrics.release_lock(guard)
+        self.assertTrue(remove.called)
+        self.assertEqual(requests_total(self.scrape(), '/api/operators'), before + 5)
+        self.assertEqual(requests_total(self.scrape(), '/api/operators'), before + 5)
+
+if __name__ == '__main__':
+    unittest.main()
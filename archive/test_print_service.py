@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+from unittest import mock
+
+# --- CONFIGURATION MUST BE BEFORE IMPORT ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+SPOOL_DB = os.path.join(tempfile.mkdtemp(prefix='canteen_print_tests_'), 'print_spool.db')
+os.environ['PRINT_SPOOL_PATH'] = SPOOL_DB
+os.environ['PRINTER_MODE'] = 'dummy'
+
+import print_service
+from escpos.printer import Dummy
+
+RECEIPT = {'bill_no': 'BILL000123', 'date': '2026-03-04 12:30:00',
+           'customer': {'name': 'Asha', 'id': 'R1', 'type': 'normal'},
+           'items': [{'name': 'Lunch', 'price': 40}], 'total': 40}
+
+class FlakyPrinter(Dummy):
+    """Dummy printer that fails its first `failures` writes, like a printer that is unplugged."""
+    printed = []
+    failures = 0
+
+    def _raw(self, msg):
+        if FlakyPrinter.failures > 0:
+            FlakyPrinter.failures -= 1
+            raise OSError('USB device not found')
+        FlakyPrinter.printed.append(msg)
+
+class PrintServiceTests(unittest.TestCase):
+    """Spooling, duplicate bills and retries, printed to an escpos Dummy."""
+
+    def setUp(self):
+        """Empty spool and a fresh printer for every test; the worker thread stays off"""
+        print_service.spool.purge()
+        FlakyPrinter.printed = []
+        FlakyPrinter.failures = 0
+        for patcher in (mock.patch.object(print_service, 'printer', print_service.PrinterConnection(FlakyPrinter, 'TEST')),
+                        mock.patch.object(print_service, 'ensure_worker', lambda: None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.app = print_service.app.test_client()
+
+    def run_due_jobs(self):
+        """What print_worker does, without the thread"""
+        while True:
+            job = print_service.spool.claim_due()
+            if job is None:
+                return
+            print_service.process_job(job)
+
+    def test_print_spools_and_prints_job(self):
+        res = self.app.post('/print', json=RECEIPT)
+        self.assertEqual(res.status_code, 202, res.json)
+        job_id = res.json['job_id']
+        job = print_service.spool.get(job_id)
+        self.assertEqual((job['status'], job['bill_no']), ('queued', 'BILL000123'))
+        self.assertEqual(FlakyPrinter.printed, [])
+
+        self.run_due_jobs()
+        self.assertEqual(self.app.get(f'/jobs/{job_id}').json['status'], 'done')
+        self.assertEqual(FlakyPrinter.printed, [print_service.render_ticket(RECEIPT)])
+        self.assertIn(b'Bill: 000123', FlakyPrinter.printed[0])
+
+    def test_same_bill_is_spooled_once(self):
+        first = self.app.post('/print', json=RECEIPT)
+        again = self.app.post('/print', json=dict(RECEIPT, total=99))
+        self.assertEqual(again.status_code, 200, again.json)
+        self.assertEqual(again.json['status'], 'duplicate')
+        self.assertEqual(again.json['job_id'], first.json['job_id'])
+        self.assertEqual(len(print_service.spool.list()), 1)
+
+        self.run_due_jobs()
+        self.app.post('/print', json=RECEIPT)
+        self.run_due_jobs()
+        self.assertEqual(len(FlakyPrinter.printed), 1)
+
+    def test_failed_print_is_retried_until_printed(self):
+        FlakyPrinter.failures = 4  # each attempt tries twice (reconnects once)
+        job_id = self.app.post('/print', json=RECEIPT).json['job_id']
+
+        self.run_due_jobs()
+        job = print_service.spool.get(job_id)
+        self.assertEqual((job['status'], job['attempts']), ('queued', 1))
+        self.assertIn('USB device not found', job['last_error'])
+        self.assertGreater(job['next_attempt'], time.time())
+        self.run_due_jobs()  # still backing off: not tried again yet
+        self.assertEqual(print_service.spool.get(job_id)['attempts'], 1)
+
+        # Long after any attempt limit: still queued, at the capped delay
+        print_service.spool.run("UPDATE print_jobs SET attempts = 500, next_attempt = 0 WHERE id = ?", (job_id,))
+        self.run_due_jobs()
+        job = print_service.spool.get(job_id)
+        self.assertEqual((job['status'], job['attempts']), ('queued', 501))
+        self.assertLessEqual(job['next_attempt'], time.time() + print_service.RETRY_MAX_SECONDS)
+        self.assertEqual(FlakyPrinter.printed, [])
+
+        # Printer back
+        print_service.spool.run("UPDATE print_jobs SET next_attempt = 0 WHERE id = ?", (job_id,))
+        self.run_due_jobs()
+        job = print_service.spool.get(job_id)
+        self.assertEqual((job['status'], job['last_error']), ('done', None))
+        self.assertEqual(len(FlakyPrinter.printed), 1)
+
+    def test_unprintable_payload_ends_as_error(self):
+        res = self.app.post('/print', json=dict(RECEIPT, items=[{'name': 'Tea', 'price': 'n/a'}]))
+        self.assertEqual(res.status_code, 400)
+        # Spooled by an older service before /print validated payloads
+        job, _ = print_service.spool.submit(dict(RECEIPT, bill_no='OLD1', items=[{'price': 'n/a'}]))
+        self.run_due_jobs()
+        job = print_service.spool.get(job['id'])
+        self.assertEqual(job['status'], 'error')
+        self.assertTrue(job['last_error'].startswith('Bad receipt'))
+        self.assertEqual(FlakyPrinter.printed, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# --- CONFIGURATION MUST BE BEFORE IMPORT ---
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+os.environ.setdefault('FLASK_ENV', 'testing')
+os.environ.setdefault('SNAPSHOT_INTERVAL_HOURS', '0')
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.mkdtemp(prefix='canteen_metrics_'), 'metrics'))
+
+import db
+import check_query_plans
+
+class QueryPlanTests(unittest.TestCase):
+    """No statement app.py issues full-scans a large table (see bench/check_query_plans.py)."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Drive every route once against a fresh database and keep what it ran"""
+        cls.tmpdir = tempfile.mkdtemp(prefix='canteen_plans_')
+        cls.db_file = os.path.join(cls.tmpdir, 'plans.db')
+        cls.statements = check_query_plans.collect_statements(cls.db_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir, ignore_errors=True)
+
+    def test_routes_were_exercised(self):
+        self.assertGreater(len(self.statements), 50)
+        for table in ('meals', 'bills', 'student_transactions'):
+            self.assertTrue(any(table in sql for sql in self.statements), table)
+
+    def test_no_full_scan_of_large_tables(self):
+        conn = db.open_connection(self.db_file)
+        self.addCleanup(conn.close)
+        for sql in self.statements:
+            with self.subTest(sql=' '.join(sql.split())):
+                plan, bad = check_query_plans.check_statement(conn, sql)
+                self.assertEqual(bad, [], '\n'.join(plan))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+"""ASGI entry point: serve the Flask app from an asyncio server.
+
+    uvicorn asgi:app --workers 2 --port 8000
+
+The event loop only parses HTTP; every Flask request runs on a bounded
+thread pool picked by its path ("lane"), so the SQLite work never blocks
+the loop and a burst of slow reports cannot take the threads billing
+needs:
+
+  default  - billing, roster, live stats and everything else (ASGI_THREADS)
+  report   - exports, backups and per-student/staff/monthly
+             reports (ASGI_REPORT_THREADS); extra ones queue here
+  stream   - long-lived Server-Sent Events streams (ASGI_STREAM_THREADS);
+             STATS_STREAM defaults to on when served this way
+
+Lanes are per worker process, like the connection pool.
+"""
+import io
+import os
+import sys
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Event streams get their own lane here, so they cannot starve other requests
+os.environ.setdefault('STATS_STREAM', '1')
+
+from app import app as flask_app, init_db
+
+THREADS = int(os.environ.get('ASGI_THREADS', 8))
+REPORT_THREADS = int(os.environ.get('ASGI_REPORT_THREADS', 2))
+STREAM_THREADS = int(os.environ.get('ASGI_STREAM_THREADS', 32))  # one per connected operator screen
+
+REPORT_PATHS = ('/api/export', '/api/backup/', '/api/reports/student/',
+                '/api/reports/staff/', '/api/reports/monthly')
+STREAM_PATHS = ('/api/stream/',)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def lane(path):
+    if path.startswith(STREAM_PATHS):
+        return 'stream'
+    if path.startswith(REPORT_PATHS):
+        return 'report'
+    return 'default'
+
+def executor(name):
+    with _executors_lock:
+        pool = _executors.get(name)
+        if pool is None:
+            size = {'default': THREADS, 'report': REPORT_THREADS, 'stream': STREAM_THREADS}[name]
+            pool = _executors[name] = ThreadPoolExecutor(size, thread_name_prefix=f"asgi-{name}")
+        return pool
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope (body already read into a file)."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+def run_wsgi(environ, send, loop, disconnected):
+    """Run one Flask request on a pool thread, handing the response to the loop chunk by chunk."""
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and sent_start:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response[:] = [status, headers]
+
+    def emit(message):
+        # Waits for the loop to take it: a slow client slows this thread, not the server
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def emit_start():
+        status, headers = response
+        emit({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers],
+        })
+
+    sent_start = False
+    result = flask_app(environ, start_response)
+    try:
+        if response:
+            # Headers go out before the first chunk, so event streams connect at once
+            emit_start()
+            sent_start = True
+        for chunk in result:
+            if disconnected.is_set():
+                return
+            if not sent_start:
+                emit_start()
+                sent_start = True
+            if chunk:
+                emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not sent_start:
+            emit_start()
+        emit({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        # Runs Flask's teardown and the metrics recorder
+        if hasattr(result, 'close'):
+            result.close()
+
+async def watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            with _executors_lock:
+                for pool in _executors.values():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                _executors.clear()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return  # no websockets here
+
+    # Bodies are small JSON / CSV uploads: read them whole before dispatch
+    body = io.BytesIO()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+
+    loop = asyncio.get_running_loop()
+    disconnected = threading.Event()
+    watcher = loop.create_task(watch_disconnect(receive, disconnected))
+    try:
+        await loop.run_in_executor(executor(lane(scope['path'])), run_wsgi,
+                                   build_environ(scope, body), send, loop, disconnected)
+    finally:
+        watcher.cancel()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    init_db()
+    port = int(os.environ.get('PORT', 8000))
+    print(f"Starting ASGI Server on port {port}...")
+    uvicorn.run('asgi:app', host='0.0.0.0', port=port, workers=int(os.environ.get('WEB_CONCURRENCY', 1)))
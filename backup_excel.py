@@ -1,71 +1,203 @@
+import os
+import re
+import json
 import sqlite3
+import datetime
+import threading
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font
-import os
-import datetime
+from openpyxl.utils import get_column_letter
+from locks import acquire_lock, release_lock, lock_holder
+
+# --- Excel Backup ---
+# Every table an admin may need back, one sheet each, streamed with
+# openpyxl's write-only mode so memory stays flat however many bills there
+# are. Runs as a background job; its status file (next to the workbook) is
+# what any worker reads when the UI polls, and a lock file in BACKUP_DIR
+# keeps it to one backup at a time across all workers.
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+PROGRESS_EVERY = 5000   # rows between status file updates
+MAX_COLUMN_WIDTH = 60
+
+# (table, sheet title); columns come from the table itself, so migrations are picked up
+TABLES = [
+    ('students', 'Students'),
+    ('staff', 'Staff'),
+    ('bills', 'Bills'),
+    ('meals', 'Meals'),
+    ('student_transactions', 'Student Transactions'),
+    ('staff_transactions', 'Staff Transactions'),
+]
+
+LOCK_NAME = 'backup.lock'
 
-DB_FILE = 'canteen.db'
-EXCEL_FILE = 'hostel_students.xlsx'
+# Control characters Excel refuses in cell text
+ILLEGAL_CHARS = re.compile(r'[\000-\010\013\014\016-\037]')
 
-def update_excel_sheet():
-    if not os.path.exists(DB_FILE):
-        print("Database not found.")
-        return False
+class BackupRunning(Exception):
+    def __init__(self, job):
+        super().__init__(f"Backup {job['id']} is already running")
+        self.job = job
 
+def column_widths(c, table, columns):
+    """Widest value per column (header included), from one aggregate pass in SQLite."""
+    # Write-only sheets emit <cols> before the first row, so widths must be known up front
+    c.execute("SELECT COUNT(*), " + ', '.join(f'MAX(LENGTH("{col}"))' for col in columns) + f" FROM {table}")
+    row = c.fetchone()
+    widths = [min(max(len(col), n or 0) + 2, MAX_COLUMN_WIDTH) for col, n in zip(columns, row[1:])]
+    return row[0], widths
+
+def write_backup(db_file, path, progress=None):
+    """Stream every table in TABLES into a workbook at path; returns {table: rows}.
+
+    All tables are read in one transaction, so the sheets are a consistent
+    snapshot even while bills keep coming in. progress(table, rows_done,
+    rows_total) is called every PROGRESS_EVERY rows and after each table.
+    """
+    conn = sqlite3.connect(db_file)
     try:
-        conn = sqlite3.connect(DB_FILE)
-        conn.row_factory = sqlite3.Row
         c = conn.cursor()
-        
-        c.execute("SELECT * FROM students ORDER BY id ASC")
-        rows = c.fetchall()
-        
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Hostel Students"
-        
-        # Headers
-        headers = ['ID', 'Name', 'Regd No', 'Dept', 'Payment Status', 'Payment Mode', 'Amount Paid']
-        ws.append(headers)
-        
-        # Style Headers
-        for cell in ws[1]:
-            cell.font = Font(bold=True)
-            
-        # Data
-        for row in rows:
-            ws.append([
-                row['id'],
-                row['name'],
-                row['regd_no'],
-                row['dept'],
-                row['payment_status'],
-                row['payment_mode'],
-                row['amount_paid']
-            ])
-            
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Adjust column widths
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter # Get the column name
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column].width = adjusted_width
-
-        wb.save(EXCEL_FILE)
+        c.execute("BEGIN")
+        counts = {}
+        sizes = {}
+        for table, _ in TABLES:
+            c.execute(f"SELECT * FROM {table} LIMIT 0")
+            columns = [d[0] for d in c.description]
+            sizes[table] = (columns,) + column_widths(c, table, columns)
+        total = sum(n for _, n, _ in sizes.values())
+
+        wb = openpyxl.Workbook(write_only=True)
+        bold = Font(bold=True)
+        done = 0
+        for table, title in TABLES:
+            columns, n_rows, widths = sizes[table]
+            ws = wb.create_sheet(title)
+            for i, width in enumerate(widths, start=1):
+                ws.column_dimensions[get_column_letter(i)].width = width
+            ws.freeze_panes = 'A2'
+            header = []
+            for col in columns:
+                cell = WriteOnlyCell(ws, value=col.replace('_', ' ').title())
+                cell.font = bold
+                header.append(cell)
+            ws.append(header)
+
+            written = 0
+            c.execute(f"SELECT * FROM {table} ORDER BY rowid")
+            for row in c:
+                ws.append([ILLEGAL_CHARS.sub('', v) if isinstance(v, str) else v for v in row])
+                written += 1
+                if progress and written % PROGRESS_EVERY == 0:
+                    progress(table, done + written, total)
+            counts[table] = written
+            done += written
+            if progress:
+                progress(table, done, total)
+        conn.rollback()
+    finally:
         conn.close()
-        print(f"Excel updated successfully at {timestamp}")
-        return True
+
+    # Written under a temporary name, so a half-written file never looks like a backup
+    partial = path + '.part'
+    wb.save(partial)
+    os.replace(partial, path)
+    return counts
+
+# --- Background Jobs ---
+def status_path(job_id):
+    return os.path.join(BACKUP_DIR, f"{job_id}.json")
+
+def save_status(job):
+    partial = status_path(job['id']) + '.part'
+    with open(partial, 'w') as f:
+        json.dump(job, f)
+    os.replace(partial, status_path(job['id']))
+
+def job_status(job_id):
+    """Status dict of a backup job, or None if unknown."""
+    if not re.fullmatch(r'canteen_backup_\d{8}_\d{6}', job_id or ''):
+        return None
+    # Checked before reading: the job saves its final status, then lets go of the lock
+    holder = lock_holder(lock_path()) or {}
+    try:
+        with open(status_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if job['status'] == 'running' and holder.get('job') != job_id:
+        job['status'] = 'error'
+        job['error'] = 'Backup process exited before finishing'
+    return job
+
+def lock_path():
+    return os.path.join(BACKUP_DIR, LOCK_NAME)
+
+def running_job():
+    """The backup currently running in any worker, or None."""
+    holder = lock_holder(lock_path())
+    if holder is None:
+        return None
+    # Status file not written yet: the holder is still starting up
+    return job_status(holder.get('job')) or {'id': holder.get('job'), 'status': 'running', 'pid': holder.get('pid')}
+
+def start_backup(db_file):
+    """Start a backup in a background thread; returns its status dict.
+
+    Raises BackupRunning if one is already in progress in any worker.
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    now = datetime.datetime.now()
+    job_id = now.strftime("canteen_backup_%Y%m%d_%H%M%S")
+    lock = acquire_lock(lock_path(), job=job_id)
+    if lock is None:
+        raise BackupRunning(running_job() or {'id': None})
+    try:
+        if os.path.exists(status_path(job_id)):
+            # Another backup started and finished within this second
+            raise BackupRunning(job_status(job_id))
+        job = {
+            'id': job_id,
+            'status': 'running',
+            'file': job_id + '.xlsx',
+            'pid': os.getpid(),
+            'started_at': now.isoformat(timespec='seconds'),
+            'finished_at': None,
+            'table': None,
+            'rows_done': 0,
+            'rows_total': None,
+            'rows': None,
+            'error': None,
+        }
+        save_status(job)
+        threading.Thread(target=run_job, args=(job, db_file, lock), name='excel-backup', daemon=True).start()
+    except BaseException:
+        release_lock(lock)
+        raise
+    return job
+
+def run_job(job, db_file, lock):
+    def progress(table, rows_done, rows_total):
+        job.update(table=table, rows_done=rows_done, rows_total=rows_total)
+        save_status(job)
+
+    try:
+        job['rows'] = write_backup(db_file, os.path.join(BACKUP_DIR, job['file']), progress)
+        job['status'] = 'done'
+        print(f"Excel backup written: {job['file']}")
     except Exception as e:
-        print(f"Error updating Excel: {e}")
-        return False
+        print(f"Error writing Excel backup: {e}")
+        job['status'] = 'error'
+        job['error'] = str(e)
+    job['finished_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+    try:
+        save_status(job)
+    finally:
+        release_lock(lock)
 
 if __name__ == "__main__":
-    update_excel_sheet()
+    from db import DB_FILE
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, datetime.datetime.now().strftime("canteen_backup_%Y%m%d_%H%M%S.xlsx"))
+    print(write_backup(DB_FILE, path))
+    print(f"Excel backup written: {path}")
@@ -0,0 +1,144 @@
+"""Billing latency while slow reports run: gunicorn (WSGI) vs uvicorn (asgi.py).
+
+Serves a copy of a generated dataset (bench/generate_dataset.py) both ways
+with the same number of worker processes and, for each, measures POST
+/api/bill latency from a few billing counters twice:
+
+  quiet   - billing only
+  loaded  - billing while --reporters clients loop over full CSV exports
+            and per-student reports
+
+With sync gunicorn workers a report holds its worker until it is done, so
+bills queue behind exports; under asgi.py reports run on their own small
+thread pool and billing keeps its threads.
+
+Usage: python bench/bench_async_mixed.py --db DATASET [--workers 2] [--reporters 4] [--duration 20]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+from bench_create_bill import REPO_DIR, free_port, start_gunicorn
+from generate_dataset import init_schema
+from load_test import dataset_info, percentile
+
+
+def start_uvicorn(app_dir, db_file, workers, extra_env):
+    port = free_port()
+    env = dict(os.environ, DB_PATH=db_file, **extra_env)
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+                             '--port', str(port), '--log-level', 'warning'],
+                            cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(base + '/api/reports/meals', timeout=1)
+            return proc, base
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('uvicorn did not start')
+
+
+def run_phase(base, dataset, counters, reporters, duration, think):
+    """Bill from `counters` clients (and load from `reporters`) for `duration` seconds."""
+    bill_latencies = []
+    report_latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def counter(i):
+        rng = random.Random(i)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            payload = {'user_type': 'hostel', 'student_id': str(rng.randint(1, dataset['students'])),
+                       'meal_type': rng.choice(['Breakfast', 'Lunch', 'Dinner']), 'amount': 40,
+                       'payment_mode': 'Account', 'operator_id': 2}
+            start = time.perf_counter()
+            res = session.post(base + '/api/bill', json=payload)
+            elapsed = time.perf_counter() - start
+            with lock:
+                bill_latencies.append(elapsed)
+                errors[0] += res.status_code != 200
+            time.sleep(think)
+
+    def reporter(i):
+        rng = random.Random(1000 + i)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            if rng.random() < 0.5:
+                url = base + '/api/export'
+            else:
+                url = f"{base}/api/reports/student/{rng.randint(1, dataset['students'])}"
+            start = time.perf_counter()
+            with session.get(url, stream=True) as res:
+                for _ in res.iter_content(65536):
+                    pass
+            with lock:
+                report_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=counter, args=(i,)) for i in range(counters)]
+    threads += [threading.Thread(target=reporter, args=(i,)) for i in range(reporters)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    bill_latencies.sort()
+    return {
+        'bills': len(bill_latencies),
+        'errors': errors[0],
+        'p50_ms': percentile(bill_latencies, 50) * 1000,
+        'p95_ms': percentile(bill_latencies, 95) * 1000,
+        'p99_ms': percentile(bill_latencies, 99) * 1000,
+        'max_ms': bill_latencies[-1] * 1000,
+        'reports': len(report_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='dataset from bench/generate_dataset.py (copied, never modified)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--counters', type=int, default=4, help='billing clients')
+    parser.add_argument('--reporters', type=int, default=4, help='export / report clients in the loaded phase')
+    parser.add_argument('--think-ms', type=float, default=50, help='pause between one counter\'s bills')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args()
+
+    servers = {'wsgi': start_gunicorn, 'asgi': start_uvicorn}
+    print(f"{args.workers} workers, {args.counters} billing counters, {args.reporters} report clients, "
+          f"{args.duration:.0f}s per phase")
+    print(f"{'mode':>5} {'phase':>7} | {'bills':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'reports':>7}")
+    for mode in args.modes.split(','):
+        for phase, reporters in (('quiet', 0), ('loaded', args.reporters)):
+            tmpdir = tempfile.mkdtemp(prefix='canteen_mixed_')
+            db_file = os.path.join(tmpdir, 'mixed.db')
+            try:
+                shutil.copy(args.db, db_file)
+                init_schema(db_file, REPO_DIR)
+                dataset = dataset_info(db_file)
+                proc, base = servers[mode](REPO_DIR, db_file, args.workers, {})
+                try:
+                    r = run_phase(base, dataset, args.counters, reporters, args.duration, args.think_ms / 1000)
+                finally:
+                    proc.terminate()
+                    proc.wait()
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            print(f"{mode:>5} {phase:>7} | {r['bills']:>6} {r['errors']:>4} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+                  f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f} {r['reports']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Excel backup: in-memory workbook + width re-walk vs write-only streaming.
+
+Copies a generated dataset (bench/generate_dataset.py), trims every backed
+up table to --limit rows, then writes the backup both ways in a fresh
+subprocess each, reporting wall time and peak RSS:
+
+  legacy    - the old update_excel_sheet approach applied to every table:
+              a normal workbook, then a second walk over all cells for widths
+  streaming - backup_excel.write_backup (write-only, widths from SQL)
+
+Usage: python bench/bench_backup_excel.py --db DATASET [--limit 100000,200000]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import resource
+import tempfile
+import subprocess
+
+from bench_create_bill import REPO_DIR
+
+sys.path.insert(0, REPO_DIR)
+
+
+def legacy_backup(db_file, path):
+    import openpyxl
+    from openpyxl.styles import Font
+    from backup_excel import TABLES
+
+    conn = sqlite3.connect(db_file)
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for table, title in TABLES:
+        c = conn.execute(f"SELECT * FROM {table}")
+        ws = wb.create_sheet(title)
+        ws.append([d[0] for d in c.description])
+        for cell in ws[1]:
+            cell.font = Font(bold=True)
+        for row in c.fetchall():
+            ws.append(list(row))
+        for col in ws.columns:
+            max_length = 0
+            for cell in col:
+                if len(str(cell.value)) > max_length:
+                    max_length = len(str(cell.value))
+            ws.column_dimensions[col[0].column_letter].width = max_length + 2
+    wb.save(path)
+    conn.close()
+
+
+def run_one(mode, db_file, path):
+    from backup_excel import write_backup
+
+    start = time.perf_counter()
+    if mode == 'legacy':
+        legacy_backup(db_file, path)
+    else:
+        write_backup(db_file, path)
+    print(json.dumps({'seconds': time.perf_counter() - start,
+                      'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def trim(src, dst, limit):
+    from backup_excel import TABLES
+
+    shutil.copy(src, dst)
+    conn = sqlite3.connect(dst)
+    rows = 0
+    for table, _ in TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE rowid NOT IN (SELECT rowid FROM {table} ORDER BY rowid LIMIT ?)", (limit,))
+        rows += conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='dataset from bench/generate_dataset.py (copied, never modified)')
+    parser.add_argument('--limit', default='50000,200000', help='rows per table, comma list')
+    parser.add_argument('--modes', default='legacy,streaming')
+    parser.add_argument('--run', nargs=3, metavar=('MODE', 'DB', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(*args.run)
+        return
+    if not args.db:
+        parser.error('--db is required (create one with bench/generate_dataset.py)')
+
+    print(f"{'rows':>8} {'mode':>10} | {'seconds':>8} {'rows/s':>8} {'peak RSS MB':>11} {'file MB':>8}")
+    for limit in [int(n) for n in args.limit.split(',')]:
+        tmpdir = tempfile.mkdtemp(prefix='canteen_xlsx_')
+        try:
+            db_file = os.path.join(tmpdir, 'backup.db')
+            rows = trim(args.db, db_file, limit)
+            for mode in args.modes.split(','):
+                path = os.path.join(tmpdir, f"{mode}.xlsx")
+                out = subprocess.run([sys.executable, __file__, '--run', mode, db_file, path],
+                                     capture_output=True, text=True, check=True).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                print(f"{rows:>8} {mode:>10} | {r['seconds']:>8.1f} {rows / r['seconds']:>8.0f} {r['rss_mb']:>11.0f} "
+                      f"{os.path.getsize(path) / 1e6:>8.1f}")
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
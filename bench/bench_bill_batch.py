@@ -0,0 +1,100 @@
+"""Single-bill vs batch billing under gunicorn.
+
+Replays the same rush-hour queue of bills two ways against a fresh
+database per run:
+
+  single  - one POST /api/bill per bill (one transaction, one commit each)
+  batch   - POST /api/bill/batch with --batch-size bills per request
+
+Each counter (client thread) serves its own queue back to back. Both paths
+are run with DB_SYNCHRONOUS=NORMAL (the default: WAL commits are not
+fsynced, checkpoints are) and FULL (every commit fsyncs the WAL), so the
+commits/bill column is also the fsyncs/bill figure under FULL.
+
+Usage: python bench/bench_bill_batch.py [--bills 3000] [--batch-size 10] [--counters 4]
+"""
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+import requests
+
+from bench_create_bill import REPO_DIR, prepare_db, start_gunicorn, bill_payload
+
+
+def replay(base, queues, batch_size):
+    """Send every counter's queue; returns (wall seconds, request latencies, errors, commits)."""
+    latencies = []
+    errors = []
+    commits = [0]
+    lock = threading.Lock()
+
+    def counter(queue):
+        session = requests.Session()
+        for i in range(0, len(queue), batch_size or 1):
+            chunk = queue[i:i + (batch_size or 1)]
+            start = time.perf_counter()
+            if batch_size:
+                res = session.post(base + '/api/bill/batch', json=chunk)
+                failed = res.json().get('failed', len(chunk)) if res.status_code == 200 else len(chunk)
+            else:
+                res = session.post(base + '/api/bill', json=chunk[0])
+                failed = int(res.status_code != 200)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors.extend([1] * failed)
+                commits[0] += 1
+
+    threads = [threading.Thread(target=counter, args=(q,)) for q in queues]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, sorted(latencies), len(errors), commits[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=3000)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--counters', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--synchronous', default='NORMAL,FULL')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    bills = [bill_payload(rng, args.students) for _ in range(args.bills)]
+    queues = [bills[i::args.counters] for i in range(args.counters)]
+
+    print(f"{args.bills} bills, {args.counters} counters, {args.workers} workers, batch size {args.batch_size}")
+    print(f"{'sync':>6} {'path':>6} | {'bills/s':>8} {'commits/bill':>12} {'ms/bill':>8} "
+          f"{'p50 req ms':>10} {'p95 req ms':>10} {'errors':>6}")
+    for sync in args.synchronous.split(','):
+        for path, batch_size in (('single', 0), ('batch', args.batch_size)):
+            tmpdir = tempfile.mkdtemp(prefix='canteen_bench_')
+            db_file = os.path.join(tmpdir, 'bills.db')
+            prepare_db(REPO_DIR, db_file, args.students)
+            proc, base = start_gunicorn(REPO_DIR, db_file, args.workers, {'DB_SYNCHRONOUS': sync})
+            try:
+                wall, latencies, errors, commits = replay(base, queues, batch_size)
+            finally:
+                proc.terminate()
+                proc.wait()
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            # ms/bill: server time per bill, i.e. request latency spread over the bills it carried
+            per_bill = sum(latencies) / args.bills * 1000
+            print(f"{sync:>6} {path:>6} | {args.bills / wall:>8.0f} {commits / args.bills:>12.2f} {per_bill:>8.2f} "
+                  f"{p50:>10.1f} {p95:>10.1f} {errors:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Throughput benchmark for POST /api/bill under gunicorn.
+
+Starts gunicorn with 1..N workers against a fresh temporary database and
+fires bills from concurrent client threads. Each worker count is run once
+per mode:
+
+  unpooled  - pooling disabled (DB_POOL_SIZE=0, a new connection per request)
+  default   - the connection pool; every bill commits on its own
+  group     - BILL_GROUP_COMMIT=1; each worker's writer thread commits the
+              bills queued by its request threads together
+
+Group commit only batches requests served concurrently by one process, so
+compare it against default with the same --threads (gunicorn gthread):
+
+    python bench/bench_create_bill.py --workers 1,4,8 --modes default,group --threads 4
+
+To compare against an older checkout (e.g. the connect-per-request app
+before the pool existed), point --app-dir at a `git worktree` of it:
+
+    git worktree add /tmp/canteen-base <rev>
+    python bench/bench_create_bill.py --app-dir /tmp/canteen-base --modes default
+
+Usage: python bench/bench_create_bill.py [--workers 1,4] [--requests 2000] [--threads 1]
+"""
+import os
+import sys
+import time
+import json
+import socket
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'unpooled': {'DB_POOL_SIZE': '0'},
+    'default': {},
+    'group': {'BILL_GROUP_COMMIT': '1'},
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def prepare_db(app_dir, db_file, n_students):
+    env = dict(os.environ, DB_PATH=db_file)
+    subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=app_dir, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(db_file)
+    conn.executemany("INSERT INTO students (id, name, regd_no, dept) VALUES (?, ?, ?, ?)",
+                     ((i, f"Student {i}", f"REG{i:06d}", 'CSE') for i in range(1, n_students + 1)))
+    conn.executemany("INSERT INTO staff (id, name, dept) VALUES (?, ?, ?)",
+                     ((i, f"Staff {i}", 'Office') for i in range(1, 21)))
+    conn.commit()
+    conn.close()
+
+
+def start_gunicorn(app_dir, db_file, workers, extra_env, threads=1):
+    port = free_port()
+    env = dict(os.environ, DB_PATH=db_file, **extra_env)
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+                             '--keep-alive', '30', '-b', f"127.0.0.1:{port}", '--log-level', 'warning', 'app:app'],
+                            cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(base + '/api/reports/meals', timeout=1)
+            return proc, base
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def bill_payload(rng, n_students):
+    kind = rng.random()
+    meal = rng.choice(['Breakfast', 'Lunch', 'Dinner'])
+    if kind < 0.7:
+        return {'user_type': 'hostel', 'student_id': str(rng.randint(1, n_students)), 'meal_type': meal,
+                'amount': 40, 'payment_mode': rng.choice(['Account', 'Account', 'Cash']), 'operator_id': 1}
+    if kind < 0.8:
+        return {'user_type': 'staff', 'student_id': str(rng.randint(1, 20)), 'meal_type': meal,
+                'amount': 40, 'payment_mode': 'Account', 'operator_id': 1}
+    return {'user_type': 'normal', 'guest_name': 'Guest', 'meal_type': meal,
+            'amount': 50, 'payment_mode': 'Cash', 'operator_id': 1}
+
+
+def fire(base, n_requests, concurrency, n_students):
+    local = threading.local()
+    latencies = []
+    errors = []
+
+    def one(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        payload = bill_payload(random.Random(i), n_students)
+        start = time.perf_counter()
+        res = local.session.post(base + '/api/bill', json=payload)
+        latencies.append(time.perf_counter() - start)
+        if res.status_code != 200:
+            errors.append(res.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'bills_per_sec': n_requests / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,4')
+    parser.add_argument('--modes', default='unpooled,default', help=f"comma list of {', '.join(MODES)}")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=1, help='request threads per worker (gunicorn --threads)')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--app-dir', default=REPO_DIR)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{args.requests} bills, {args.concurrency} clients, {args.threads} thread(s) per worker")
+    print(f"{'mode':>9} {'workers':>7} | {'bills/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'errors':>6}")
+    for mode in args.modes.split(','):
+        for workers in [int(w) for w in args.workers.split(',')]:
+            tmpdir = tempfile.mkdtemp(prefix='canteen_bench_')
+            db_file = os.path.join(tmpdir, 'bills.db')
+            prepare_db(args.app_dir, db_file, args.students)
+            proc, base = start_gunicorn(args.app_dir, db_file, workers, MODES[mode], args.threads)
+            try:
+                stats = fire(base, args.requests, args.concurrency, args.students)
+            finally:
+                proc.terminate()
+                proc.wait()
+                shutil.rmtree(tmpdir, ignore_errors=True)
+            print(f"{mode:>9} {workers:>7} | {stats['bills_per_sec']:>8.0f} {stats['p50_ms']:>7.1f} "
+                  f"{stats['p95_ms']:>7.1f} {stats['errors']:>6}")
+            results.append(dict(stats, mode=mode, workers=workers, threads=args.threads))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
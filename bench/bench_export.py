@@ -0,0 +1,124 @@
+"""Benchmark for GET /api/export over a large bills table.
+
+Seeds a temporary database with synthetic bills (1M by default), then runs
+each export implementation in its own subprocess and reports wall time,
+bytes produced and the process's peak RSS (mmap is disabled for the run so
+that database pages mapped into memory do not count towards RSS):
+
+  legacy     - the old fetchall + `output += ...` string build
+  streaming  - the current /api/export generator, consumed chunk by chunk
+
+Usage: python bench/bench_export.py [--rows 1000000]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import datetime
+import resource
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+
+def seed(db_file, n_rows):
+    env = dict(os.environ, DB_PATH=db_file)
+    subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=REPO_DIR, env=env,
+                   check=True, stdout=subprocess.DEVNULL)
+    conn = sqlite3.connect(db_file)
+    rng = random.Random(7)
+    start = datetime.datetime(2024, 1, 1)
+
+    def rows():
+        for i in range(n_rows):
+            when = (start + datetime.timedelta(seconds=i * 30)).strftime("%Y-%m-%d %H:%M:%S")
+            user_type = rng.choice(['hostel', 'hostel', 'staff', 'normal'])
+            sid = rng.randint(1, 5000) if user_type != 'normal' else None
+            guest = 'Guest' if user_type == 'normal' else None
+            meal = rng.choice(['Breakfast', 'Lunch', 'Dinner'])
+            mode = rng.choice(['Cash', 'UPI', 'Account'])
+            details = json.dumps({'user_type': user_type, 'student_id': sid, 'guest_name': guest, 'meal_type': meal})
+            yield (f"{i:020d}", when, 1, 40, details, mode, user_type, sid, guest, meal)
+
+    conn.executemany("""INSERT INTO bills (bill_no, date, operator_id, amount, details, payment_mode,
+                                           user_type, student_id, guest_name, meal_type)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows())
+    conn.commit()
+    conn.close()
+
+
+def legacy_export(db_file):
+    """The pre-streaming export body (whole CSV built in one string)."""
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute("SELECT * FROM bills ORDER BY date DESC")
+    rows = c.fetchall()
+    output = "\ufeffBill No,Date,Time,Name,Student ID,Meal Type,Amount,Mode,User Type\n"
+    for row in rows:
+        d = json.loads(row['details'])
+        name = str(d.get('guest_name', 'N/A')).replace(',', ' ')
+        meal = str(d.get('meal_type', '-')).replace(',', ' ')
+        date_part, time_part = row['date'].split(' ')
+        output += (f"\t{row['bill_no']},{date_part},{time_part},{name},{d.get('student_id', '-')},{meal},"
+                   f"{row['amount']},{row['payment_mode']},{d.get('user_type', '-')}\n")
+    conn.close()
+    return len(output.encode('utf-8'))
+
+
+def streaming_export(db_file):
+    os.environ['DB_PATH'] = db_file
+    import app
+    size = 0
+    with app.app.test_client() as client:
+        res = client.get('/api/export', buffered=False)
+        for chunk in res.response:
+            size += len(chunk)
+        res.close()
+    return size
+
+
+def run_one(mode, db_file):
+    start = time.perf_counter()
+    size = {'legacy': legacy_export, 'streaming': streaming_export}[mode](db_file)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'mode': mode, 'seconds': elapsed, 'bytes': size, 'peak_rss_mb': peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--modes', default='legacy,streaming')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_one(args.run, args.db)
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix='canteen_bench_')
+    db_file = os.path.join(tmpdir, 'export.db')
+    try:
+        print(f"Seeding {args.rows} bills...")
+        seed(db_file, args.rows)
+        print(f"{'mode':>10} | {'seconds':>8} {'MB out':>8} {'peak RSS MB':>12}")
+        for mode in args.modes.split(','):
+            out = subprocess.run([sys.executable, __file__, '--run', mode, '--db', db_file],
+                                 env=dict(os.environ, DB_MMAP_SIZE='0'),
+                                 check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            print(f"{mode:>10} | {result['seconds']:>8.2f} {result['bytes'] / 1e6:>8.1f} {result['peak_rss_mb']:>12.1f}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Render/transmit benchmark for print_service receipts.
+
+Compares the old per-call receipt layout (a p.set()/p.text() sequence, one
+device write per call) with ReceiptTemplate (precompiled command bytes, one
+write per receipt). Both run against escpos' Dummy printer; transmit time
+is modelled by a Dummy whose every write costs --write-latency-ms, roughly
+the per-transfer overhead of a USB bulk write through pyusb/libusb.
+
+Also checks that both paths produce byte-identical receipts.
+
+Usage: python bench/bench_receipt.py [--receipts 2000] [--write-latency-ms 0.5]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from escpos.printer import Dummy
+
+os.environ.setdefault('PRINT_SPOOL_PATH', ':memory:')
+from print_service import ReceiptTemplate
+
+
+class LatencyPrinter(Dummy):
+    """Dummy that sleeps on every write, standing in for a USB round trip."""
+
+    def __init__(self, latency, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+        self.writes = 0
+
+    def _raw(self, msg):
+        self.writes += 1
+        if self.latency:
+            time.sleep(self.latency)
+        super()._raw(msg)
+
+
+def legacy_render(p, data):
+    """The receipt layout as print_bill issued it before ReceiptTemplate."""
+    p.hw('INIT')
+    p.set(align='center')
+    p.set(bold=True, double_height=True, double_width=True)
+    p.text("GATE Central Canteen\n")
+    p.set(bold=False, double_height=False, double_width=False, align='center')
+    p.text("--------------------------------\n")
+    p.set(align='left')
+    sys_date = data.get('date', 'N/A')
+    date_short = sys_date[:10] if len(sys_date) >= 10 else sys_date
+    bill_short = str(data.get('bill_no', 'N/A'))
+    if len(bill_short) > 6: bill_short = bill_short[-6:]
+    p.text(f"Bill: {bill_short}  Dt: {date_short}\n")
+    if 'customer' in data:
+        c = data['customer']
+        c_name = c.get('name', 'Guest')[:15]
+        c_id = c.get('id')
+        if c_id:
+            p.text(f"ID: {c_id}  Nm: {c_name}\n")
+        else:
+            p.text(f"Name: {c_name}\n")
+    p.set(font='b')
+    p.text("------------------------------------------\n")
+    cust_type = ''
+    if 'customer' in data and 'type' in data['customer']:
+        cust_type = data['customer']['type'].lower()
+    for item in data.get('items', []):
+        p.text(f"Item: {item.get('name', 'Item')}\n")
+        if cust_type not in ['hostel', 'staff']:
+            p.text(f"Price: {float(item.get('price', 0)):.2f}\n")
+        p.text("\n")
+    p.text("------------------------------------------\n")
+    p.set(font='a')
+    if cust_type not in ['hostel', 'staff']:
+        p.set(align='right', bold=True)
+        p.text(f"Total: Rs. {data.get('total', 0)}\n")
+        p.set(bold=False)
+    p.text("\n\n")
+    p.cut()
+
+
+def sample_receipts(n):
+    kinds = [
+        {'name': 'Walk-in Guest', 'type': 'normal'},
+        {'name': 'Hostel Student', 'type': 'hostel', 'id': 1042},
+        {'name': 'Office Staff', 'type': 'staff', 'id': 7},
+    ]
+    for i in range(n):
+        yield {
+            'bill_no': f"{1700000000000 + i}",
+            'date': '18/10/26',
+            'customer': kinds[i % 3],
+            'items': [{'name': ['Breakfast', 'Lunch', 'Dinner'][i % 3], 'qty': 1, 'price': 40}],
+            'total': 40,
+        }
+
+
+def run(receipts, send, latency):
+    render = 0.0
+    transmit = 0.0
+    writes = 0
+    outputs = []
+    for data in receipts:
+        # Fresh printer per receipt, as print_bill opened one per job (and escpos tracks codepage state per printer)
+        p = LatencyPrinter(latency, profile="TM-T88V")
+        render_s, transmit_s = send(p, data)
+        render += render_s
+        transmit += transmit_s
+        writes += p.writes
+        outputs.append(p.output)
+    return render, transmit, writes, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--receipts', type=int, default=2000)
+    parser.add_argument('--write-latency-ms', type=float, default=0.5)
+    args = parser.parse_args()
+
+    receipts = list(sample_receipts(args.receipts))
+    latency = args.write_latency_ms / 1000
+    template = ReceiptTemplate()
+
+    def send_legacy(p, data):
+        # Render and transmit are interleaved: time the same sequence without latency for the render share
+        scratch = LatencyPrinter(0, profile="TM-T88V")
+        start = time.perf_counter()
+        legacy_render(scratch, data)
+        render_s = time.perf_counter() - start
+        start = time.perf_counter()
+        legacy_render(p, data)
+        return render_s, max(0.0, time.perf_counter() - start - render_s)
+
+    def send_template(p, data):
+        start = time.perf_counter()
+        buf = template.render(data)
+        render_s = time.perf_counter() - start
+        start = time.perf_counter()
+        p._raw(buf)
+        return render_s, time.perf_counter() - start
+
+    results = {}
+    for name, send in (('call-sequence', send_legacy), ('template', send_template)):
+        results[name] = run(receipts, send, latency)
+
+    same = results['call-sequence'][3] == results['template'][3]
+    print(f"{args.receipts} receipts, {args.write_latency_ms} ms per device write, identical bytes: {same}")
+    print(f"{'path':>14} | {'render us':>9} {'transmit us':>11} {'total us':>9} {'writes':>6}")
+    for name, (render, transmit, writes, _) in results.items():
+        n = args.receipts
+        print(f"{name:>14} | {render / n * 1e6:>9.1f} {transmit / n * 1e6:>11.1f} "
+              f"{(render + transmit) / n * 1e6:>9.1f} {writes / n:>6.1f}")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark for the operator roster (GET /api/students).
+
+Compares the old per-student meal lookup (N+1 queries) with the single
+joined query in app.query_roster. Each size runs against a fresh temporary
+database; nothing touches canteen.db.
+
+Usage: python bench/bench_roster.py [--sizes 500,5000,50000] [--repeat 5]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_roster(c, today):
+    """The pre-optimisation GET /api/students loop, kept for comparison."""
+    c.execute("SELECT * FROM students")
+    rows = c.fetchall()
+    students = []
+    for row in rows:
+        s_data = dict(row)
+        c.execute("SELECT breakfast, lunch, dinner FROM meals WHERE student_id=? AND date=?", (s_data['id'], today))
+        meal_row = c.fetchone()
+        s_data['breakfast_count'] = meal_row['breakfast'] if meal_row else 0
+        s_data['lunch_count'] = meal_row['lunch'] if meal_row else 0
+        s_data['dinner_count'] = meal_row['dinner'] if meal_row else 0
+        s_data['remaining_amount'] = s_data.get('remaining_amount') or 0
+        students.append(s_data)
+    return students
+
+
+def seed(conn, n_students, days=30):
+    """N students, each eating on roughly 60% of the last `days` days."""
+    c = conn.cursor()
+    c.executemany("INSERT INTO students (id, name, regd_no, dept, phone) VALUES (?, ?, ?, ?, ?)",
+                  ((i, f"Student {i}", f"REG{i:06d}", 'CSE', '9000000000') for i in range(1, n_students + 1)))
+    today = datetime.date.today()
+    rng = random.Random(n_students)
+
+    def meal_rows():
+        for d in range(days):
+            date_str = (today - datetime.timedelta(days=d)).isoformat()
+            for sid in range(1, n_students + 1):
+                if rng.random() < 0.6:
+                    yield (sid, date_str, rng.randint(0, 1), rng.randint(0, 1), rng.randint(0, 1))
+
+    c.executemany("INSERT INTO meals (student_id, date, breakfast, lunch, dinner) VALUES (?, ?, ?, ?, ?)", meal_rows())
+    # Give the legacy path its best case: an index for its per-student lookup.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_meals_student_date ON meals(student_id, date)")
+    conn.commit()
+
+
+def measure(conn, fn, today, repeat):
+    counter = {'n': 0}
+
+    def trace(_sql):
+        counter['n'] += 1
+
+    conn.set_trace_callback(trace)
+    timings = []
+    result = None
+    for _ in range(repeat):
+        counter['n'] = 0
+        start = time.perf_counter()
+        result = fn(conn.cursor(), today)
+        timings.append(time.perf_counter() - start)
+    conn.set_trace_callback(None)
+    timings.sort()
+    return counter['n'], timings[len(timings) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='500,5000,50000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--days', type=int, default=30, help='days of meal history to seed')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='canteen_bench_')
+    os.environ['DB_PATH'] = os.path.join(tmpdir, 'roster.db')
+    import app
+    import db
+
+    today = datetime.date.today().isoformat()
+    print(f"{'students':>9} | {'legacy queries':>14} {'legacy ms':>10} | {'joined queries':>14} {'joined ms':>10} | speedup")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        db_file = os.path.join(tmpdir, f"roster_{size}.db")
+        db.DB_FILE = db_file
+        app.init_db()
+        conn = app.get_db()
+        seed(conn, size, args.days)
+
+        l_queries, l_time, l_rows = measure(conn, legacy_roster, today, args.repeat)
+        j_queries, j_time, j_rows = measure(conn, app.query_roster, today, args.repeat)
+        conn.close()
+        assert l_rows == j_rows, "joined roster differs from legacy roster"
+
+        print(f"{size:>9} | {l_queries:>14} {l_time * 1000:>10.1f} | {j_queries:>14} {j_time * 1000:>10.1f} | {l_time / j_time:.1f}x")
+
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Write stalls while snapshots.take_snapshot copies a large database.
+
+Grows a copy of a dataset (bench/generate_dataset.py, or a fresh schema)
+to --size-mb with a filler table, then keeps a billing-style writer
+committing every --interval-ms (BEGIN IMMEDIATE, insert a bill, bump
+stats_state, COMMIT) and records how long each write waited:
+
+  before  - writer alone
+  during  - while a snapshot runs in another process (copy + integrity check)
+  after   - the seconds right after, when the WAL held back by the snapshot
+            gets checkpointed
+
+Usage: python bench/bench_snapshot.py [--db DATASET] [--size-mb 1024] [--pages 256]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from bench_create_bill import REPO_DIR, prepare_db
+
+sys.path.insert(0, REPO_DIR)
+
+
+def grow(db_file, size_mb):
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_filler (id INTEGER PRIMARY KEY, payload BLOB)")
+    while os.path.getsize(db_file) < size_mb * 1024 * 1024:
+        conn.execute("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 20000) "
+                     "INSERT INTO bench_filler (payload) SELECT randomblob(3000) FROM n")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+class Writer(threading.Thread):
+    def __init__(self, db_file, interval):
+        super().__init__(daemon=True)
+        from db import open_connection
+        self.conn = open_connection(db_file)
+        self.conn.isolation_level = None
+        self.interval = interval
+        self.samples = []  # (time, seconds waited for BEGIN IMMEDIATE .. COMMIT)
+        self.stop = threading.Event()
+
+    def run(self):
+        c = self.conn
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("INSERT INTO bills (bill_no, date, amount, payment_mode, user_type, meal_type) "
+                      "VALUES (?, datetime('now'), 40, 'Cash', 'normal', 'Lunch')", (f"bench{start!r}",))
+            c.execute("UPDATE stats_state SET version = version + 1 WHERE id = 1")
+            c.execute("COMMIT")
+            self.samples.append((start, time.perf_counter() - start))
+            time.sleep(self.interval)
+
+
+def summarize(samples):
+    waits = sorted(w for _, w in samples)
+    if not waits:
+        return {'writes': 0}
+    return {
+        'writes': len(waits),
+        'p50_ms': waits[len(waits) // 2] * 1000,
+        'p99_ms': waits[int(len(waits) * 0.99)] * 1000,
+        'max_ms': waits[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='dataset to start from (copied, never modified)')
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--pages', type=int, default=256, help='SNAPSHOT_PAGES_PER_STEP')
+    parser.add_argument('--interval-ms', type=float, default=5)
+    parser.add_argument('--settle', type=float, default=5, help='seconds measured before and after')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='canteen_snap_')
+    try:
+        db_file = os.path.join(tmpdir, 'canteen.db')
+        if args.db:
+            shutil.copy(args.db, db_file)
+        else:
+            prepare_db(REPO_DIR, db_file, 2000)
+        print(f"Growing database to {args.size_mb} MB...")
+        grow(db_file, args.size_mb)
+        size = os.path.getsize(db_file)
+
+        writer = Writer(db_file, args.interval_ms / 1000)
+        writer.start()
+        time.sleep(args.settle)
+        snap_start = time.perf_counter()
+        env = dict(os.environ, SNAPSHOT_DIR=os.path.join(tmpdir, 'snapshots'), SNAPSHOT_PAGES_PER_STEP=str(args.pages))
+        out = subprocess.run([sys.executable, '-c', f"import json, snapshots; print(json.dumps(snapshots.take_snapshot({db_file!r})))"],
+                             cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True).stdout
+        snap_end = time.perf_counter()
+        time.sleep(args.settle)
+        writer.stop.set()
+        writer.join()
+        result = json.loads(out.strip().splitlines()[-1])
+
+        phases = {
+            'before': [s for s in writer.samples if s[0] < snap_start],
+            'during': [s for s in writer.samples if snap_start <= s[0] < snap_end],
+            'after': [s for s in writer.samples if s[0] >= snap_end],
+        }
+        print(f"database {size / 1e6:.0f} MB, {args.pages} pages/step, snapshot copy {result['copy_seconds']:.1f}s "
+              f"+ integrity check {result['check_seconds']:.1f}s")
+        print(f"{'phase':>7} | {'writes':>6} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7}")
+        for name, samples in phases.items():
+            r = summarize(samples)
+            if r['writes']:
+                print(f"{name:>7} | {r['writes']:>6} {r['p50_ms']:>7.2f} {r['p99_ms']:>7.2f} {r['max_ms']:>7.2f}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
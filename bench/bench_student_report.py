@@ -0,0 +1,136 @@
+"""GET /api/reports/student/<id> latency for a student with a long history.
+
+Builds a fresh database, gives one student --days of history (daily meals,
+an Account transaction per meal, a couple of Cash bills a day and a monthly
+fee payment), serves it with gunicorn and times the report request:
+
+  first page - what the report modal fetches when it opens
+  all pages  - following next_cursor / meals_next_cursor to the end
+               (a single request on trees without paging)
+
+Pass --baseline with a checkout of an older revision to time it on the
+same data; each tree initialises its own copy of the schema.
+
+Usage: python bench/bench_student_report.py [--days 3650] [--baseline DIR]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import time
+
+import requests
+
+from bench_create_bill import REPO_DIR, prepare_db, start_gunicorn
+from load_test import percentile
+
+STUDENT_ID = 1
+
+
+def seed_history(db_file, days):
+    rng = random.Random(days)
+    conn = sqlite3.connect(db_file)
+    today = datetime.date.today()
+    meals = []
+    bills = []
+    transactions = []
+    for d in range(days):
+        day = today - datetime.timedelta(days=d)
+        eaten = [rng.random() < 0.8 for _ in range(3)]
+        meals.append((STUDENT_ID, day.isoformat(), *map(int, eaten)))
+        for meal, hour, ate in zip(('Breakfast', 'Lunch', 'Dinner'), (8, 13, 20), eaten):
+            stamp = f"{day} {hour:02d}:{rng.randint(0, 59):02d}:00"
+            if ate:
+                transactions.append((STUDENT_ID, 40, stamp, 'Account', 'Food', meal))
+            if rng.random() < 0.7:
+                bills.append((f"HIST{d}{meal[0]}", stamp, 30, 'Cash', 'hostel', STUDENT_ID, meal))
+        if day.day == 1:
+            transactions.append((STUDENT_ID, 3000, f"{day} 10:00:00", 'UPI', 'Payment', 'Monthly fee'))
+    conn.executemany("INSERT INTO meals (student_id, date, breakfast, lunch, dinner) VALUES (?, ?, ?, ?, ?)", meals)
+    conn.executemany("INSERT INTO bills (bill_no, date, amount, payment_mode, user_type, student_id, meal_type) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", bills)
+    conn.executemany("INSERT INTO student_transactions (student_id, amount, date, mode, type, remarks) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", transactions)
+    conn.commit()
+    conn.close()
+    return len(meals), len(bills) + len(transactions)
+
+
+def fetch_all(session, base):
+    """Every page of the report; returns (requests made, bytes received)."""
+    url = f"{base}/api/reports/student/{STUDENT_ID}"
+    res = session.get(url)
+    data = res.json()
+    calls, size = 1, len(res.content)
+    for key, param, cursor_key in (('transactions', 'cursor', 'next_cursor'),
+                                   ('meals', 'meals_cursor', 'meals_next_cursor')):
+        cursor = data.get(cursor_key)
+        while cursor:
+            res = session.get(url, params={param: cursor})
+            calls, size = calls + 1, size + len(res.content)
+            cursor = res.json()[cursor_key]
+    return calls, size
+
+
+def run(app_dir, days, repeats):
+    tmpdir = tempfile.mkdtemp(prefix='canteen_report_')
+    try:
+        db_file = os.path.join(tmpdir, 'report.db')
+        prepare_db(app_dir, db_file, 100)
+        meal_days, money_rows = seed_history(db_file, days)
+        proc, base = start_gunicorn(app_dir, db_file, 1, {'SNAPSHOT_INTERVAL_HOURS': '0'})
+        try:
+            session = requests.Session()
+            url = f"{base}/api/reports/student/{STUDENT_ID}"
+            session.get(url)  # warm the page cache
+            first = []
+            first_bytes = 0
+            for _ in range(repeats):
+                start = time.perf_counter()
+                res = session.get(url)
+                first.append(time.perf_counter() - start)
+                first_bytes = len(res.content)
+            start = time.perf_counter()
+            calls, total_bytes = fetch_all(session, base)
+            everything = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    first.sort()
+    return {
+        'meal_days': meal_days,
+        'money_rows': money_rows,
+        'first_p50_ms': percentile(first, 50) * 1000,
+        'first_p95_ms': percentile(first, 95) * 1000,
+        'first_kb': first_bytes / 1024,
+        'all_ms': everything * 1000,
+        'all_requests': calls,
+        'all_kb': total_bytes / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=3650, help='days of history for the student')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--baseline', help='checkout of an older revision to compare against')
+    args = parser.parse_args()
+
+    print(f"one student, {args.days} days of history")
+    print(f"{'tree':>8} | {'first p50 ms':>12} {'first p95 ms':>12} {'first KB':>8} | "
+          f"{'all ms':>8} {'requests':>8} {'all KB':>8}")
+    trees = [('baseline', args.baseline)] if args.baseline else []
+    for name, app_dir in trees + [('current', REPO_DIR)]:
+        r = run(app_dir, args.days, args.repeats)
+        print(f"{name:>8} | {r['first_p50_ms']:>12.1f} {r['first_p95_ms']:>12.1f} {r['first_kb']:>8.0f} | "
+              f"{r['all_ms']:>8.0f} {r['all_requests']:>8} {r['all_kb']:>8.0f}  "
+              f"({r['meal_days']} meal days, {r['money_rows']} money rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Query-plan regression check for every SQL statement app.py issues.
+
+Drives each API route through the Flask test client against a temporary
+database, records every statement via the sqlite3 trace callback, then runs
+EXPLAIN QUERY PLAN on each one. Exits non-zero if a statement full-scans one
+of the ever-growing tables (meals, bills, ledgers, tombstones), unless it is
+listed in ALLOWED_SCANS with a reason.
+
+Usage: python bench/check_query_plans.py [-v]
+(also run by archive/test_query_plans.py)
+"""
+import os
+import re
+import sys
+import shutil
+import argparse
+import tempfile
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tables that grow without bound; a SCAN of any of these is a regression.
+LARGE_TABLES = {'meals', 'bills', 'student_transactions', 'staff_transactions', 'sync_tombstones', 'monthly_meals', 'bill_keys'}
+
+# (SQL fragment, table, reason) for scans that are the point of the query.
+ALLOWED_SCANS = [
+    # Full export (/api/export) reads every bill by design.
+    ("FROM bills ORDER BY date DESC", 'bills', 'full export reads every bill'),
+]
+
+SQL_KEYWORDS = {'WHERE', 'ON', 'JOIN', 'LEFT', 'INNER', 'GROUP', 'ORDER', 'LIMIT', 'SET', 'VALUES', 'AS', 'USING'}
+
+
+def exercise(client, today):
+    """Hit every route with enough data for each branch to run."""
+    client.post('/api/login', json={'username': 'admin', 'password': 'admin123', 'role': 'admin'})
+    client.post('/api/login', json={'username': 'operator', 'password': 'pass123'})
+    for i in (1, 2, 3):
+        client.post('/api/students', json={'name': f"Student {i}", 'regd_no': f"R{i}", 'dept': 'CSE'})
+    client.put('/api/students', json={'id': 3, 'name': 'Student 3', 'regd_no': 'R3', 'dept': 'ECE'})
+    client.post('/api/staff', json={'name': 'Staff 1', 'dept': 'Office'})
+    client.put('/api/staff', json={'id': 1, 'name': 'Staff 1', 'dept': 'Admin'})
+    client.post('/api/operators', json={'username': 'op2', 'password': 'x'})
+
+    for meal in ('Breakfast', 'Lunch', 'Dinner'):
+        client.post('/api/bill', json={'user_type': 'hostel', 'student_id': '1', 'meal_type': meal,
+                                       'amount': 40, 'payment_mode': 'Account', 'operator_id': 1})
+    res = client.post('/api/bill', json={'user_type': 'hostel', 'student_id': '2', 'meal_type': 'Lunch',
+                                         'amount': 40, 'payment_mode': 'Cash', 'operator_id': 1})
+    client.post('/api/bill', json={'user_type': 'staff', 'student_id': '1', 'meal_type': 'Lunch',
+                                   'amount': 40, 'payment_mode': 'Account', 'operator_id': 1})
+    for _ in range(2):  # second one is a replay
+        client.post('/api/bill', json={'user_type': 'normal', 'guest_name': 'Guest', 'meal_type': 'Lunch',
+                                       'amount': 50, 'payment_mode': 'Cash', 'operator_id': 1},
+                    headers={'Idempotency-Key': 'plan-check'})
+    client.post('/api/bill/batch', json=[
+        {'user_type': 'hostel', 'student_id': '3', 'meal_type': 'Dinner', 'amount': 40, 'payment_mode': 'Account', 'operator_id': 1},
+        {'user_type': 'normal', 'guest_name': 'Guest', 'meal_type': 'Dinner', 'amount': 50, 'payment_mode': 'Cash', 'operator_id': 1},
+    ])
+    client.get(f"/bill-view/{res.json['bill_no']}")
+    client.post('/api/students/pay', json={'student_id': 1, 'amount': 20, 'mode': 'Cash'})
+
+    client.get('/api/students')
+    client.get('/api/students?since=0')
+    client.get('/api/students?since=1')
+    client.get('/api/staff')
+    client.get('/api/staff?since=1')
+    client.get('/api/operators')
+    client.get('/api/reports/meals')
+    client.get('/api/reports/student/1')
+    client.get(f"/api/reports/student/1?start_date={today}&end_date={today}")
+    client.get('/api/reports/staff/1')
+    client.get(f"/api/reports/monthly?month={today[5:7]}&year={today[:4]}")
+    client.get(f"/api/reports/monthly?start_date={today}&end_date={today}")
+    client.get(f"/api/reports/monthly?start_date={today[:8]}01&end_date={today}")
+    client.get('/api/export?type=daily')
+    client.get('/api/export')
+
+    client.delete(f"/api/meals?student_id=1&date={today}&type=lunch")
+    client.delete(f"/api/meals?student_id=2&date={today}&type=lunch")
+    client.post('/api/students/reset', json={'student_id': 2})
+    client.delete('/api/students?id=3')
+    client.delete('/api/staff?id=1')
+    client.delete('/api/operators?id=3')
+
+
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+def scanned_tables(conn, sql):
+    aliases = table_aliases(sql)
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+    scans = []
+    for detail in plan:
+        m = re.match(r'SCAN (\w+)', detail)
+        if m and aliases.get(m.group(1).lower()) in LARGE_TABLES:
+            scans.append(aliases[m.group(1).lower()])
+    return plan, scans
+
+
+def is_allowed(sql, table):
+    return any(fragment in sql and table == t for fragment, t, _ in ALLOWED_SCANS)
+
+
+def collect_statements(db_file):
+    """Every distinct SELECT/UPDATE/DELETE/INSERT app.py runs against a fresh db_file."""
+    import db
+    import app
+
+    statements = []
+    open_connection = db.open_connection
+
+    def traced_connection(path):
+        conn = open_connection(path)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    db_file_before = db.DB_FILE
+    db.DB_FILE = db_file
+    db.open_connection = traced_connection
+    try:
+        app.init_db()
+        statements.clear()
+        exercise(app.app.test_client(), datetime.date.today().isoformat())
+    finally:
+        db.open_connection = open_connection
+        db.get_pool().close_all()
+        db.DB_FILE = db_file_before
+    return [sql for sql in dict.fromkeys(statements) if re.match(r'\s*(SELECT|UPDATE|DELETE|INSERT)', sql, re.I)]
+
+
+def check_statement(conn, sql):
+    """Plan of sql, and the large tables it full-scans that ALLOWED_SCANS does not excuse."""
+    plan, scans = scanned_tables(conn, sql)
+    return plan, [t for t in scans if not is_allowed(sql, t)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the plan of every statement')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='canteen_plans_')
+    db_file = os.path.join(tmpdir, 'plans.db')
+    os.environ['DB_PATH'] = db_file
+    import db
+    statements = collect_statements(db_file)
+
+    conn = db.open_connection(db_file)
+    failures = 0
+    for sql in statements:
+        plan, bad = check_statement(conn, sql)
+        if bad or args.verbose:
+            print(('FAIL ' if bad else 'ok   ') + ' '.join(sql.split()))
+            for detail in plan:
+                print(f"       {detail}")
+        failures += bool(bad)
+    conn.close()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(f"{len(statements)} statements checked, {failures} full scan(s) of large tables")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Generate a realistic canteen database for benchmarks and load tests.
+
+Creates the schema with app.init_db(), then fills it with hostel students,
+staff and N months of day-by-day canteen activity ending today:
+
+  - students eat breakfast/lunch/dinner most days, mostly on Account
+    (bill + meals row + Food transaction + growing remaining_amount), and
+    settle the previous month's dues early in each month (Payment rows)
+  - staff eat lunch on most days on Account and pay at month end
+  - walk-in guests pay Cash/UPI
+
+Derived tables (daily_stats and anything else init_db builds from bills)
+are rebuilt by running init_db's own migrations at the end, so the
+dataset looks like a live database that grew over time. The same --seed
+always produces the same data (dates are relative to --end-date).
+
+Usage: python bench/generate_dataset.py --db /tmp/canteen_bench.db [--students 2000] [--months 3]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEAL_PRICES = {'Breakfast': 20, 'Lunch': 40, 'Dinner': 40}
+MEAL_TIMES = {'Breakfast': (7, 9), 'Lunch': (12, 14), 'Dinner': (19, 21)}
+MEAL_ODDS = {'Breakfast': 0.75, 'Lunch': 0.9, 'Dinner': 0.85}
+DEPTS = ['CSE', 'ECE', 'EEE', 'MECH', 'CIVIL', 'MBA']
+
+
+def init_schema(db_file, app_dir=REPO_DIR):
+    subprocess.run([sys.executable, '-c', 'import app; app.init_db()'], cwd=app_dir,
+                   env=dict(os.environ, DB_PATH=db_file), check=True, stdout=subprocess.DEVNULL)
+
+
+def generate(db_file, students=2000, staff=50, months=3, guests_per_day=150, seed=42, end_date=None):
+    """Fill an empty database at db_file; returns row counts per table."""
+    rng = random.Random(seed)
+    end = end_date or datetime.date.today()
+    start = (end.replace(day=1) - datetime.timedelta(days=1)).replace(day=1) if months > 1 else end.replace(day=1)
+    for _ in range(months - 2):
+        start = (start - datetime.timedelta(days=1)).replace(day=1)
+
+    init_schema(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    conn.executemany("INSERT INTO students (id, name, regd_no, dept, phone) VALUES (?, ?, ?, ?, ?)",
+                     ((i, f"Student {i}", f"REG{i:06d}", rng.choice(DEPTS), f"9{rng.randrange(10**9):09d}")
+                      for i in range(1, students + 1)))
+    conn.executemany("INSERT INTO staff (id, name, dept, created_at) VALUES (?, ?, ?, ?)",
+                     ((i, f"Staff {i}", 'Office', f"{start} 09:00:00") for i in range(1, staff + 1)))
+
+    debt = [0.0] * (students + 1)
+    paid = [0.0] * (students + 1)
+    staff_debt = [0.0] * (staff + 1)
+    seq = 0
+
+    def stamp(day, hours):
+        return f"{day} {rng.randint(*hours):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+
+    def bill(when, user_type, sid, guest, meal, amount, mode):
+        nonlocal seq
+        seq += 1
+        details = json.dumps({'user_type': user_type, 'student_id': sid, 'guest_name': guest, 'meal_type': meal})
+        return (when.replace('-', '').replace(' ', '').replace(':', '') + f"{seq:06d}", when, 2, amount, details,
+                mode, user_type, sid, guest, meal)
+
+    day = start
+    while day <= end:
+        bills, meals, s_tx, st_tx = [], [], [], []
+        for sid in range(1, students + 1):
+            flags = {}
+            for meal, odds in MEAL_ODDS.items():
+                flags[meal] = rng.random() < odds
+                if not flags[meal]:
+                    continue
+                when = stamp(day, MEAL_TIMES[meal])
+                mode = 'Account' if rng.random() < 0.9 else 'Cash'
+                bills.append(bill(when, 'hostel', sid, None, meal, MEAL_PRICES[meal], mode))
+                if mode == 'Account':
+                    s_tx.append((sid, MEAL_PRICES[meal], when, 'Account', 'Food', f"Meal: {meal}"))
+                    debt[sid] += MEAL_PRICES[meal]
+            if any(flags.values()):
+                meals.append((sid, day.isoformat(), *(int(flags[m]) for m in MEAL_PRICES),
+                              *(MEAL_PRICES[m] if flags[m] else None for m in MEAL_PRICES)))
+            # Dues are settled in the first week of the month
+            if day.day == 1 + sid % 7 and debt[sid] > 0:
+                s_tx.append((sid, debt[sid], stamp(day, (10, 17)), rng.choice(['Cash', 'UPI']), 'Payment', 'Fee Payment'))
+                paid[sid] += debt[sid]
+                debt[sid] = 0.0
+
+        for st_id in range(1, staff + 1):
+            if day.weekday() < 6 and rng.random() < 0.7:
+                when = stamp(day, MEAL_TIMES['Lunch'])
+                bills.append(bill(when, 'staff', st_id, None, 'Lunch', MEAL_PRICES['Lunch'], 'Account'))
+                st_tx.append((st_id, MEAL_PRICES['Lunch'], when, 'Account', 'Food', 'Meal: Lunch'))
+                staff_debt[st_id] += MEAL_PRICES['Lunch']
+            last_of_month = (day + datetime.timedelta(days=1)).day == 1
+            if last_of_month and staff_debt[st_id] > 0:
+                st_tx.append((st_id, staff_debt[st_id], stamp(day, (16, 18)), 'Cash', 'Payment', 'Monthly settlement'))
+                staff_debt[st_id] = 0.0
+
+        for _ in range(guests_per_day):
+            meal = rng.choice(list(MEAL_PRICES))
+            bills.append(bill(stamp(day, MEAL_TIMES[meal]), 'normal', None, 'Guest', meal, 50, rng.choice(['Cash', 'UPI'])))
+
+        bills.sort(key=lambda b: b[1])
+        conn.executemany("""INSERT INTO bills (bill_no, date, operator_id, amount, details, payment_mode,
+                                               user_type, student_id, guest_name, meal_type)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", bills)
+        conn.executemany("""INSERT INTO meals (student_id, date, breakfast, lunch, dinner,
+                                               breakfast_price, lunch_price, dinner_price)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", meals)
+        conn.executemany("INSERT INTO student_transactions (student_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, ?, ?)",
+                         sorted(s_tx, key=lambda t: t[2]))
+        conn.executemany("INSERT INTO staff_transactions (staff_id, amount, date, mode, type, remarks) VALUES (?, ?, ?, ?, ?, ?)",
+                         sorted(st_tx, key=lambda t: t[2]))
+        day += datetime.timedelta(days=1)
+
+    conn.executemany("""UPDATE students SET remaining_amount = ?, amount_paid = ?,
+                            payment_status = CASE WHEN ? <= 0 THEN 'Paid' WHEN ? > 0 THEN 'Partial' ELSE 'Unpaid' END
+                        WHERE id = ?""",
+                     ((debt[i], paid[i], debt[i], paid[i], i) for i in range(1, students + 1)))
+    # Derived tables are rebuilt from the data by init_db's migrations
+    conn.execute("DROP TABLE IF EXISTS daily_stats")
+    conn.commit()
+    conn.close()
+    init_schema(db_file)
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ('students', 'staff', 'bills', 'meals', 'student_transactions', 'staff_transactions', 'daily_stats')}
+    conn.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='database file to create (must not exist)')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--staff', type=int, default=50)
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--guests-per-day', type=int, default=150)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat, help='last day of data (default: today)')
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        print(f"{args.db} already exists")
+        sys.exit(1)
+    start = time.perf_counter()
+    counts = generate(args.db, args.students, args.staff, args.months, args.guests_per_day, args.seed, args.end_date)
+    print(f"Generated {args.db} in {time.perf_counter() - start:.1f}s ({os.path.getsize(args.db) / 1e6:.0f} MB)")
+    for table, n in counts.items():
+        print(f"  {table:<22} {n:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Mixed-traffic load test for the canteen API under gunicorn.
+
+Serves a copy of a generated dataset (bench/generate_dataset.py) with
+gunicorn and drives a weighted mix of requests from concurrent clients for
+a fixed time, then prints throughput and p50/p95/p99 latency per endpoint.
+Every run works on a fresh copy of the dataset, so runs are comparable.
+
+Results are written as JSON (with the git revision of --app-dir) so runs
+against different commits can be compared:
+
+    python bench/generate_dataset.py --db /tmp/canteen_bench.db
+    python bench/load_test.py --db /tmp/canteen_bench.db --json before.json
+    ... change things ...
+    python bench/load_test.py --db /tmp/canteen_bench.db --json after.json
+    python bench/load_test.py --compare before.json after.json
+
+Usage: python bench/load_test.py --db DATASET [--workers 4] [--concurrency 16] [--duration 30]
+"""
+import os
+import json
+import math
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+
+import requests
+
+from bench_create_bill import REPO_DIR, start_gunicorn
+from generate_dataset import init_schema
+
+# name -> weight; roughly what a day at the counter looks like
+DEFAULT_MIX = 'bill=50,meals=15,roster=15,student_report=12,monthly_report=4,export_daily=4'
+
+
+def endpoint_requests(dataset, rng):
+    """name -> function(session, base) issuing one request of that kind."""
+    n_students, n_staff = dataset['students'], dataset['staff']
+    today = datetime.date.today()
+
+    def bill(s, base):
+        kind = rng.random()
+        meal = rng.choice(['Breakfast', 'Lunch', 'Dinner'])
+        if kind < 0.75:
+            payload = {'user_type': 'hostel', 'student_id': str(rng.randint(1, n_students)), 'meal_type': meal,
+                       'amount': 40, 'payment_mode': 'Account' if rng.random() < 0.9 else 'Cash', 'operator_id': 2}
+        elif kind < 0.85:
+            payload = {'user_type': 'staff', 'student_id': str(rng.randint(1, n_staff)), 'meal_type': meal,
+                       'amount': 40, 'payment_mode': 'Account', 'operator_id': 2}
+        else:
+            payload = {'user_type': 'normal', 'guest_name': 'Guest', 'meal_type': meal,
+                       'amount': 50, 'payment_mode': 'Cash', 'operator_id': 2}
+        return s.post(base + '/api/bill', json=payload)
+
+    def student_report(s, base):
+        return s.get(f"{base}/api/reports/student/{rng.randint(1, n_students)}")
+
+    return {
+        'bill': bill,
+        'meals': lambda s, base: s.get(base + '/api/reports/meals'),
+        'roster': lambda s, base: s.get(base + '/api/students?since=0'),
+        'roster_delta': lambda s, base: s.get(base + '/api/students?since=1'),
+        'staff': lambda s, base: s.get(base + '/api/staff'),
+        'student_report': student_report,
+        'staff_report': lambda s, base: s.get(f"{base}/api/reports/staff/{rng.randint(1, n_staff)}"),
+        'monthly_report': lambda s, base: s.get(f"{base}/api/reports/monthly?month={today.month:02d}&year={today.year}"),
+        'export_daily': lambda s, base: s.get(base + '/api/export?type=daily'),
+        'export_full': lambda s, base: s.get(base + '/api/export'),
+    }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def drive(base, mix, dataset, concurrency, duration, seed):
+    samples = {name: [] for name in mix}
+    errors = {name: 0 for name in mix}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(i):
+        rng = random.Random(seed * 1000 + i)
+        calls = endpoint_requests(dataset, rng)
+        names, weights = list(mix), list(mix.values())
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                res = calls[name](session, base)
+                ok = res.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[name].append(elapsed)
+                errors[name] += not ok
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    results = {}
+    for name, values in samples.items():
+        values.sort()
+        results[name] = {
+            'requests': len(values),
+            'errors': errors[name],
+            'rps': len(values) / wall,
+            'p50_ms': percentile(values, 50) * 1000 if values else None,
+            'p95_ms': percentile(values, 95) * 1000 if values else None,
+            'p99_ms': percentile(values, 99) * 1000 if values else None,
+            'max_ms': values[-1] * 1000 if values else None,
+        }
+    total = sum(r['requests'] for r in results.values())
+    results['ALL'] = {'requests': total, 'errors': sum(errors.values()), 'rps': total / wall}
+    return results
+
+
+def dataset_info(db_file):
+    conn = sqlite3.connect(db_file)
+    info = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+            for t in ('students', 'staff', 'bills', 'meals', 'student_transactions')}
+    conn.close()
+    return info
+
+
+def git_revision(app_dir):
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=app_dir, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=app_dir,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except OSError:
+        return None
+
+
+def print_results(results):
+    print(f"{'endpoint':>16} | {'reqs':>6} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, r in results.items():
+        if name == 'ALL':
+            continue
+        if not r['requests']:
+            print(f"{name:>16} | {0:>6}")
+            continue
+        print(f"{name:>16} | {r['requests']:>6} {r['errors']:>4} {r['rps']:>7.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+    total = results['ALL']
+    print(f"{'ALL':>16} | {total['requests']:>6} {total['errors']:>4} {total['rps']:>7.1f}")
+
+
+def compare(before_file, after_file):
+    with open(before_file) as f:
+        before = json.load(f)
+    with open(after_file) as f:
+        after = json.load(f)
+    print(f"{before_file} ({before.get('revision')}) -> {after_file} ({after.get('revision')})")
+    keys = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+    print(f"{'endpoint':>16} | " + ' '.join(f"{key + ' before/after':>24}" for key in keys))
+    for name, a in after['results'].items():
+        b = before['results'].get(name)
+        if not b or name == 'ALL' or not a['requests'] or not b['requests']:
+            continue
+        cells = [f"{b[key]:>8.1f} {a[key]:>8.1f} {(a[key] / b[key] - 1) * 100:>+5.0f}%" for key in keys]
+        print(f"{name:>16} | " + ' '.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='dataset from bench/generate_dataset.py (copied, never modified)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"endpoint=weight list (default {DEFAULT_MIX})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--app-dir', default=REPO_DIR)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra environment for gunicorn')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.db:
+        parser.error('--db is required (create one with bench/generate_dataset.py)')
+
+    mix = parse_mix(args.mix)
+    unknown = set(mix) - set(endpoint_requests({'students': 1, 'staff': 1}, random.Random()))
+    if unknown:
+        parser.error(f"unknown endpoint(s) in --mix: {', '.join(sorted(unknown))}")
+
+    tmpdir = tempfile.mkdtemp(prefix='canteen_load_')
+    db_file = os.path.join(tmpdir, 'load.db')
+    try:
+        shutil.copy(args.db, db_file)
+        # Let the checkout under test migrate the dataset to its own schema
+        init_schema(db_file, args.app_dir)
+        dataset = dataset_info(db_file)
+        extra_env = dict(kv.split('=', 1) for kv in args.env)
+        proc, base = start_gunicorn(args.app_dir, db_file, args.workers, extra_env)
+        try:
+            print(f"{args.workers} workers, {args.concurrency} clients, {args.duration:.0f}s, mix {args.mix}")
+            results = drive(base, mix, dataset, args.concurrency, args.duration, args.seed)
+        finally:
+            proc.terminate()
+            proc.wait()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'revision': git_revision(args.app_dir),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'params': {k: getattr(args, k) for k in ('workers', 'concurrency', 'duration', 'mix', 'seed', 'env')},
+                'dataset': dataset,
+                'results': results,
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
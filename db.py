@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import threading
+from flask import g, has_app_context
+import metrics
+import slow_queries
+
+# Railway Persistent Storage Logic
+if os.environ.get('DB_PATH'):
+    DB_FILE = os.environ.get('DB_PATH')
+elif os.path.exists('/app/data'):
+    DB_FILE = '/app/data/canteen.db'
+else:
+    DB_FILE = 'canteen.db'
+
+print(f"Using Database File: {DB_FILE}")
+
+# --- Connection Tuning (applied once per connection, at open) ---
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # idle connections kept per worker; 0 disables pooling
+JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')  # FULL also fsyncs the WAL on every commit
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Cursor class for every pooled connection: the slow-query timer wraps the metrics counter
+_cursor_classes = [cls for enabled, cls in ((slow_queries.ENABLED, slow_queries.ProfilingCursor),
+                                            (metrics.ENABLED, metrics.MetricsCursor)) if enabled]
+CURSOR_FACTORY = type('Cursor', tuple(_cursor_classes), {}) if _cursor_classes else None
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    Handlers keep calling conn.close() as before; the real close only
+    happens when the pool is full or the connection is unusable.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.checked_out = False
+        self.identity = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def discard(self):
+        sqlite3.Connection.close(self)
+
+    if CURSOR_FACTORY is not None:
+        # Route every statement through the instrumented cursor (conn.execute does not call cursor())
+        def cursor(self, factory=CURSOR_FACTORY):
+            return super().cursor(factory)
+
+        def execute(self, sql, parameters=()):
+            return self.cursor().execute(sql, parameters)
+
+        def executemany(self, sql, parameters):
+            return self.cursor().executemany(sql, parameters)
+
+def open_connection(db_file):
+    conn = sqlite3.connect(db_file, factory=PooledConnection, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    return conn
+
+def file_identity(path):
+    """(device, inode) of path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+class ConnectionPool:
+    """LIFO pool of open connections for one database file in one process.
+
+    Connections are created lazily and never shared across a fork: a
+    gunicorn worker that inherits a pool from the master starts empty.
+    Each connection remembers which file it opened; if the path has since
+    been deleted or replaced (a reset or restore), it is dropped rather
+    than handed out, so requests never read an unlinked database.
+    """
+
+    def __init__(self, db_file, size):
+        self.db_file = db_file
+        self.size = size
+        self.pid = os.getpid()
+        self.identity = None
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        conn = None
+        stale = []
+        identity = file_identity(self.db_file)
+        with self._lock:
+            if self.pid != os.getpid():
+                # Forked: the inherited connections belong to the parent
+                self._idle = []
+                self.pid = os.getpid()
+            if identity != self.identity:
+                stale, self._idle = self._idle, []
+                self.identity = identity
+            if self._idle:
+                conn = self._idle.pop()
+        for old in stale:
+            old.discard()
+        if conn is None:
+            conn = open_connection(self.db_file)
+            conn.pool = self
+            # The file may only exist now that sqlite created it
+            conn.identity = file_identity(self.db_file)
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        try:
+            # Never hand out a connection mid-transaction or with per-request pragmas
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute("PRAGMA foreign_keys = 0")
+        except sqlite3.Error:
+            conn.discard()
+            return
+        with self._lock:
+            if (self.pid == os.getpid() and len(self._idle) < self.size
+                    and conn.identity == self.identity and conn.identity is not None):
+                self._idle.append(conn)
+                return
+        conn.discard()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_file != DB_FILE:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DB_FILE, POOL_SIZE)
+        return _pool
+
+# --- Database Helper ---
+def get_db():
+    """Connection for the current request, reused from this worker's pool.
+
+    Inside a request every call returns the same connection; it goes back
+    to the pool on conn.close() or, at the latest, in release_db().
+    """
+    if not has_app_context():
+        return get_pool().acquire()
+    conn = g.get('_db_conn')
+    if conn is None or not conn.checked_out:
+        conn = get_pool().acquire()
+        g._db_conn = conn
+    return conn
+
+def release_db(exc=None):
+    """Flask teardown hook: return the request's connection to the pool."""
+    conn = g.pop('_db_conn', None)
+    if conn is not None:
+        conn.close()
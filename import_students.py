@@ -0,0 +1,129 @@
+import os
+import io
+import csv
+import sys
+import time
+import hashlib
+import argparse
+import openpyxl
+
+# Header names seen in the hostel name lists, mapped to student fields
+HEADER_ALIASES = {
+    'name': 'name',
+    'student name': 'name',
+    'regd no': 'regd_no',
+    'regd_no': 'regd_no',
+    'registration no': 'regd_no',
+    'regestration no': 'regd_no',
+    'dept': 'dept',
+    'department': 'dept',
+    'course': 'dept',
+    'cource': 'dept',
+    'phone': 'phone',
+    'contact no': 'phone',
+    'mobile': 'phone',
+}
+
+# Layout of 'Name List for Canteen e-Recipts.xlsx' when headers are not recognised:
+# Student ID, Name, Cource, Regestration No, Contact No
+DEFAULT_COLUMNS = {'name': 1, 'dept': 2, 'regd_no': 3, 'phone': 4}
+
+def cell_text(value):
+    if value is None:
+        return ''
+    # Excel hands numeric ids/phones back as floats (9876543210.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def iter_raw_rows(stream, filename):
+    """Yield raw row tuples from an .xlsx (read-only, streaming) or .csv file."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        wb = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+    elif ext == '.csv':
+        yield from csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    else:
+        raise ValueError(f"Unsupported file type: {ext or filename}")
+
+def read_student_rows(stream, filename):
+    """Normalized student dicts (name, regd_no, dept, phone) from an upload or file.
+
+    dept and phone are only included when the file has that column, so an
+    upsert leaves the stored values alone otherwise. Rows without a name are
+    skipped; a missing regd_no gets TEMP-<hash of name, dept and phone>.
+    """
+    rows = iter_raw_rows(stream, filename)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = {}
+    for i, title in enumerate(header):
+        field = HEADER_ALIASES.get(cell_text(title).lower())
+        if field and field not in columns:
+            columns[field] = i
+    if 'name' not in columns:
+        columns = DEFAULT_COLUMNS
+
+    def pick(row, field):
+        i = columns.get(field)
+        return cell_text(row[i]) if i is not None and i < len(row) else ''
+
+    for row in rows:
+        name = pick(row, 'name')
+        if not name:
+            continue
+        regd_no = pick(row, 'regd_no')
+        if not regd_no:
+            # Same student, same placeholder in every file: a re-import updates them, never another list's row
+            key = '|'.join((name, pick(row, 'dept'), pick(row, 'phone')))
+            regd_no = 'TEMP-' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+        student = {'name': name, 'regd_no': regd_no}
+        if 'dept' in columns:
+            student['dept'] = pick(row, 'dept') or 'General'
+        if 'phone' in columns:
+            student['phone'] = pick(row, 'phone')
+        yield student
+
+def main():
+    parser = argparse.ArgumentParser(description="Import hostel students from an .xlsx or .csv name list.")
+    parser.add_argument('file')
+    parser.add_argument('--mode', choices=['upsert', 'insert'], default='upsert',
+                        help="upsert updates students whose regd_no already exists; insert leaves them alone")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"File not found: {args.file}")
+        sys.exit(1)
+
+    from app import init_db, import_student_rows
+    from db import get_db
+    init_db()
+
+    start = time.perf_counter()
+
+    def show_progress(stats):
+        done = stats['added'] + stats['updated']
+        print(f"\r{done} students written ({done / (time.perf_counter() - start):.0f}/s)", end='', flush=True)
+
+    conn = get_db()
+    try:
+        with open(args.file, 'rb') as f:
+            stats = import_student_rows(conn, read_student_rows(f, args.file), args.mode,
+                                        chunk_size=args.chunk_size, progress=show_progress)
+    finally:
+        conn.close()
+
+    print(f"\nImport Complete in {time.perf_counter() - start:.1f}s!")
+    print(f"Added: {stats['added']}")
+    print(f"Updated: {stats['updated']}")
+    print(f"Skipped (existing): {stats['skipped']}")
+    print(f"Duplicates in file: {stats['duplicates']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+import json
+import datetime
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# --- Lock Files ---
+# One holder at a time across every process: an OS lock on an open file
+# (flock, or msvcrt byte-range locking on Windows). The OS drops it when the
+# holder exits however that happens, so a lock file left on a volume across
+# a restart never looks held, and there is no stale-lock takeover to race.
+# The file itself stays in place and only records who holds it, for status.
+
+# msvcrt blocks reads of the locked range, so lock a byte well past the info
+WIN_LOCK_OFFSET = 1 << 20
+
+_held = set()   # lock files this process holds
+
+def _try_lock(f):
+    try:
+        if os.name == 'nt':
+            f.seek(WIN_LOCK_OFFSET)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _unlock(f):
+    if os.name == 'nt':
+        f.seek(WIN_LOCK_OFFSET)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def acquire_lock(path, **info):
+    """Take the lock at path; returns the open lock file, or None if it is held elsewhere.
+
+    info is written into the file with this pid and the start time. Keep the
+    returned file until done, then pass it to release_lock().
+    """
+    f = open(path, 'a+')   # never truncates the current holder's info
+    if not _try_lock(f):
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    json.dump(dict(info, pid=os.getpid(), started_at=datetime.datetime.now().isoformat(timespec='seconds')), f)
+    f.flush()
+    _held.add(f)
+    return f
+
+def release_lock(f):
+    if f is None or f.closed:
+        return
+    _held.discard(f)
+    try:
+        _unlock(f)
+    finally:
+        f.close()
+
+def lock_holder(path):
+    """Info written by whoever holds the lock at path, or None if nobody does.
+
+    A holder that has not finished writing its info yet gives {}.
+    """
+    try:
+        f = open(path)
+    except FileNotFoundError:
+        return None
+    with f:
+        if _try_lock(f):
+            _unlock(f)
+            return None
+        f.seek(0)
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+def _after_fork():
+    # The child shares the parent's open file description: closing its copy
+    # leaves the parent's lock in place (flock is only dropped by the last
+    # close), where keeping it would hold the lock for the child's lifetime.
+    for f in _held:
+        f.close()
+    _held.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
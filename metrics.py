@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import threading
+from flask import request, g
+from locks import acquire_lock, release_lock, lock_holder
+
+# --- Request / SQL Metrics (served at /api/metrics in Prometheus text format) ---
+# Each thread counts into its own ThreadStats, so the request path never
+# takes a lock; a scrape sums every thread's counters. Every worker process
+# also writes its totals to METRICS_DIR every METRICS_FLUSH_SECONDS, and a
+# scrape adds up all the files there, so whichever worker answers it reports
+# the whole server. A worker holds a lock on its file for as long as it
+# runs; once it exits, the next scrape folds its file into retired.json, so
+# totals never go backwards when gunicorn recycles workers. Clear the
+# directory when deploying, as counters then start again from zero anyway.
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+METRICS_DIR = os.environ.get('METRICS_DIR', 'worker_metrics')
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+RETIRED_NAME = 'retired.json'
+FOLD_LOCK_NAME = 'fold.lock'
+FOLD_LOCK_WAIT_SECONDS = 2
+
+class ThreadStats:
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.statements = 0  # SQL statements / rows fetched by the current request
+        self.rows = 0
+        self.requests = {}   # (route, method, status) -> count
+        self.latency = {}    # (route, method) -> [bucket counts..., sum]
+        self.sql = {}        # (route, method) -> [statements, rows]
+
+    def merge(self, other):
+        # list() snapshots each dict in one step, so a thread writing meanwhile cannot break the loop
+        for key, n in list(other.requests.items()):
+            self.requests[key] = self.requests.get(key, 0) + n
+        for key, values in list(other.latency.items()):
+            mine = self.latency.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for i, v in enumerate(values):
+                mine[i] += v
+        for key, (statements, rows) in list(other.sql.items()):
+            mine = self.sql.setdefault(key, [0, 0])
+            mine[0] += statements
+            mine[1] += rows
+
+_local = threading.local()
+_registry = []
+_retired = ThreadStats()  # counts from threads that have exited
+_registry_lock = threading.Lock()
+
+def _prune_dead():
+    # Call with _registry_lock held
+    for stats in [s for s in _registry if not s.thread.is_alive()]:
+        _retired.merge(stats)
+        _registry.remove(stats)
+
+def thread_stats():
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        stats = _local.stats = ThreadStats()
+        with _registry_lock:
+            # The dev server starts a thread per request: fold finished ones away
+            if len(_registry) > 256:
+                _prune_dead()
+            _registry.append(stats)
+    return stats
+
+class MetricsCursor(sqlite3.Cursor):
+    """Cursor that counts statements executed and rows fetched for the current thread."""
+
+    def execute(self, *args, **kwargs):
+        thread_stats().statements += 1
+        return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        thread_stats().statements += 1
+        return super().executemany(*args, **kwargs)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            thread_stats().rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        thread_stats().rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        thread_stats().rows += len(rows)
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        thread_stats().rows += 1
+        return row
+
+def start_request():
+    stats = thread_stats()
+    stats.statements = 0
+    stats.rows = 0
+    g._metrics_start = time.perf_counter()
+
+def finish_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    method = request.method
+    status = response.status_code
+
+    def record():
+        # Runs when the response is closed, so streamed bodies (export, SSE) are included
+        stats = thread_stats()
+        elapsed = time.perf_counter() - start
+        key = (route, method, status)
+        stats.requests[key] = stats.requests.get(key, 0) + 1
+        buckets = stats.latency.get((route, method))
+        if buckets is None:
+            buckets = stats.latency[(route, method)] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                buckets[i] += 1
+        buckets[-2] += 1  # +Inf
+        buckets[-1] += elapsed
+        sql = stats.sql.get((route, method))
+        if sql is None:
+            sql = stats.sql[(route, method)] = [0, 0]
+        sql[0] += stats.statements
+        sql[1] += stats.rows
+
+    response.call_on_close(record)
+    return response
+
+def snapshot():
+    """All threads' counters summed into one ThreadStats."""
+    total = ThreadStats()
+    with _registry_lock:
+        _prune_dead()
+        total.merge(_retired)
+        for stats in list(_registry):
+            total.merge(stats)
+    return total
+
+# --- Sharing Between Workers ---
+def encode(stats):
+    return {'requests': [[list(key), n] for key, n in stats.requests.items()],
+            'latency': [[list(key), values] for key, values in stats.latency.items()],
+            'sql': [[list(key), values] for key, values in stats.sql.items()]}
+
+def decode(data):
+    stats = ThreadStats()
+    stats.requests = {tuple(key): n for key, n in data['requests']}
+    stats.latency = {tuple(key): values for key, values in data['latency']}
+    stats.sql = {tuple(key): values for key, values in data['sql']}
+    return stats
+
+def write_json(path, data):
+    partial = path + '.part'
+    with open(partial, 'w') as f:
+        json.dump(data, f)
+    os.replace(partial, path)
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+_process = {'token': None, 'lock': None, 'thread': None}
+_flush_lock = threading.Lock()
+
+def flush():
+    """Write this process's counters to its file in METRICS_DIR."""
+    with _flush_lock:
+        if _process['token'] is None:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            token = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+            # Held until the process exits: a free lock marks a file whose worker is gone
+            _process['lock'] = acquire_lock(os.path.join(METRICS_DIR, token + '.lock'))
+            _process['token'] = token
+        write_json(os.path.join(METRICS_DIR, _process['token'] + '.json'), encode(snapshot()))
+
+def fold_exited():
+    """Merge the files of exited workers into retired.json; call with the fold lock held.
+
+    retired.json lists the workers it already holds, so a fold interrupted
+    before it removed their files never counts them twice.
+    """
+    retired_path = os.path.join(METRICS_DIR, RETIRED_NAME)
+    retired = read_json(retired_path) or {'folded': [], 'stats': encode(ThreadStats())}
+    total = decode(retired['stats'])
+    exited = []
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json') or name == RETIRED_NAME:
+            continue
+        token = name[:-len('.json')]
+        if lock_holder(os.path.join(METRICS_DIR, token + '.lock')) is not None:
+            continue
+        exited.append(token)
+        data = read_json(os.path.join(METRICS_DIR, name))
+        if data and token not in retired['folded']:
+            total.merge(decode(data))
+    if not exited:
+        return
+    write_json(retired_path, {'folded': exited, 'stats': encode(total)})
+    for token in exited:
+        for ext in ('.json', '.lock'):
+            try:
+                os.remove(os.path.join(METRICS_DIR, token + ext))
+            except OSError:
+                pass
+
+def collect():
+    """Counters of every worker, running or exited, summed."""
+    if not ENABLED:
+        return snapshot()
+    flush()
+    # Taken for reading too: mid-fold, a worker is in both retired.json and its own file
+    deadline = time.monotonic() + FOLD_LOCK_WAIT_SECONDS
+    guard = acquire_lock(os.path.join(METRICS_DIR, FOLD_LOCK_NAME))
+    while guard is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+        guard = acquire_lock(os.path.join(METRICS_DIR, FOLD_LOCK_NAME))
+    try:
+        if guard is not None:
+            fold_exited()
+        retired = read_json(os.path.join(METRICS_DIR, RETIRED_NAME)) or {'folded': [], 'stats': None}
+        total = decode(retired['stats']) if retired['stats'] else ThreadStats()
+        for name in os.listdir(METRICS_DIR):
+            token = name[:-len('.json')]
+            if name.endswith('.json') and name != RETIRED_NAME and token not in retired['folded']:
+                data = read_json(os.path.join(METRICS_DIR, name))
+                if data:
+                    total.merge(decode(data))
+        return total
+    finally:
+        release_lock(guard)
+
+def flusher():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            print(f"Metrics Flush Error: {e}")
+
+def start_flusher():
+    if _process['thread'] is None or not _process['thread'].is_alive():
+        _process['thread'] = threading.Thread(target=flusher, name='metrics-flush', daemon=True)
+        _process['thread'].start()
+
+def flush_at_exit():
+    # A worker's last requests still count once it is recycled
+    if _process['token'] is not None or snapshot().requests:
+        try:
+            flush()
+        except Exception as e:
+            print(f"Metrics Flush Error: {e}")
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus():
+    stats = collect()
+    lines = []
+
+    def labels(**kv):
+        return '{' + ','.join(f'{k}="{label_value(v)}"' for k, v in kv.items()) + '}'
+
+    lines.append('# HELP canteen_http_requests_total Requests handled, by route, method and status.')
+    lines.append('# TYPE canteen_http_requests_total counter')
+    for (route, method, status), n in sorted(stats.requests.items()):
+        lines.append(f"canteen_http_requests_total{labels(route=route, method=method, status=status)} {n}")
+
+    lines.append('# HELP canteen_http_request_duration_seconds Request latency, including streamed bodies.')
+    lines.append('# TYPE canteen_http_request_duration_seconds histogram')
+    for (route, method), buckets in sorted(stats.latency.items()):
+        for bound, n in zip(LATENCY_BUCKETS, buckets):
+            lines.append(f"canteen_http_request_duration_seconds_bucket{labels(route=route, method=method, le=bound)} {n}")
+        lines.append(f"canteen_http_request_duration_seconds_bucket{labels(route=route, method=method, le='+Inf')} {buckets[-2]}")
+        lines.append(f"canteen_http_request_duration_seconds_sum{labels(route=route, method=method)} {buckets[-1]:.6f}")
+        lines.append(f"canteen_http_request_duration_seconds_count{labels(route=route, method=method)} {buckets[-2]}")
+
+    lines.append('# HELP canteen_sql_statements_total SQL statements executed while serving each route.')
+    lines.append('# TYPE canteen_sql_statements_total counter')
+    for (route, method), (statements, _) in sorted(stats.sql.items()):
+        lines.append(f"canteen_sql_statements_total{labels(route=route, method=method)} {statements}")
+
+    lines.append('# HELP canteen_sql_rows_fetched_total Rows fetched from SQLite while serving each route.')
+    lines.append('# TYPE canteen_sql_rows_fetched_total counter')
+    for (route, method), (_, rows) in sorted(stats.sql.items()):
+        lines.append(f"canteen_sql_rows_fetched_total{labels(route=route, method=method)} {rows}")
+    return '\n'.join(lines) + '\n'
+
+def init_app(app):
+    if not ENABLED:
+        return
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    start_flusher()
+    atexit.register(flush_at_exit)
+
+    def after_fork():
+        # A forked worker starts with no counters and a file of its own; the
+        # parent's lock file was already closed in the child by locks.py
+        global _local, _retired, _registry_lock, _flush_lock
+        _local = threading.local()
+        _retired = ThreadStats()
+        _registry_lock = threading.Lock()
+        _flush_lock = threading.Lock()
+        del _registry[:]
+        _process.update(token=None, lock=None, thread=None)
+        start_flusher()
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=after_fork)
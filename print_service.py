@@ -6,6 +6,11 @@ if os.name == 'nt' and hasattr(os, 'add_dll_directory'):
     except Exception:
         pass
 
+import json
+import time
+import uuid
+import sqlite3
+import threading
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from escpos.printer import Usb, Dummy
@@ -17,119 +22,437 @@ PRINTER_VID = 0x0471  # USB\VID_0471&PID_0055&REV_0100
 PRINTER_PID = 0x0055
 PRINTER_EP_OUT = 0x02 # Detected via debug_endpoints.py
 
+# PRINTER_MODE=dummy prints to the console instead of USB (development / testing)
+PRINTER_MODE = os.environ.get('PRINTER_MODE', 'usb').lower()
+
+# --- Spool ---
+# Jobs are written here before /print answers, and survive restarts.
+SPOOL_FILE = os.environ.get('PRINT_SPOOL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'print_spool.db'))
+RETRY_BASE_SECONDS = 2    # First retry delay; doubles per failed attempt
+RETRY_MAX_SECONDS = 60    # Backoff cap, so a replugged printer is picked up within a minute
+SPOOL_RETENTION_DAYS = 7  # Printed jobs older than this are purged (and can be printed again)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-def get_printer():
-    """Attempt to connect to USB printer. Fallback to Dummy if failed."""
-    try:
-        # Explicitly set the OUT endpoint to 0x02 as detected
-        p = Usb(PRINTER_VID, PRINTER_PID, out_ep=PRINTER_EP_OUT, profile="TM-T88V")
-        return p, "USB"
-    except Exception as e:
-        # Catching generic Exception covers usb.core.NoBackendError and others
-        print(f"printer_error: Could not connect to USB printer ({PRINTER_VID:04x}:{PRINTER_PID:04x}). Using Dummy. Error: {e}")
-        return Dummy(), "DUMMY"
+def open_usb_printer():
+    # Explicitly set the OUT endpoint to 0x02 as detected
+    p = Usb(PRINTER_VID, PRINTER_PID, out_ep=PRINTER_EP_OUT, profile="TM-T88V")
+    p.open()  # python-escpos opens lazily; fail here rather than mid-receipt
+    return p
 
-@app.route('/status', methods=['GET'])
-def status():
-    """Health check endpoint."""
-    return jsonify({"status": "running", "service": "Canteen Print Service"})
+class PrinterConnection:
+    """One long-lived printer handle, reopened only after a failure.
 
-@app.route('/print', methods=['POST'])
-def print_bill():
-    data = request.json
-    if not data:
-        return jsonify({"status": "error", "message": "No JSON payload provided"}), 400
+    A missing printer is an error here (not a silent Dummy fallback) so the
+    spool keeps the job and retries it once the printer is back.
+    """
+    def __init__(self, factory=open_usb_printer, mode="USB"):
+        self.factory = factory
+        self.mode = mode
+        self.printer = None
 
-    try:
-        p, mode = get_printer()
-        
-        # --- RECEIPT LAYOUT ---
-        # Initialize
+    def get(self):
+        if self.printer is None:
+            self.printer = self.factory()
+        return self.printer
+
+    def reset(self):
+        if self.printer is not None:
+            try:
+                self.printer.close()
+            except Exception:
+                pass
+        self.printer = None
+
+if PRINTER_MODE == 'dummy':
+    printer = PrinterConnection(Dummy, "DUMMY")
+else:
+    printer = PrinterConnection()
+
+class ReceiptTemplate:
+    """Receipt layout compiled to ESC/POS bytes once.
+
+    Every formatting command (header, separators, font and alignment
+    switches, cut) is captured from a Dummy printer at startup; render()
+    only encodes the per-bill fields and joins the pieces into one buffer,
+    which send_ticket() sends to the printer in a single write.
+    """
+    def __init__(self, profile="TM-T88V"):
+        self.profile = profile
+        # One Dummy for all static pieces, so the codepage is selected once (in the header), as on a real run
+        self.compiler = Dummy(profile=profile)
+        self.header = self.capture(self.write_header)
+        self.items_start = self.capture(lambda p: (p.set(font='b'), p.text("------------------------------------------\n")))
+        self.items_end = self.capture(lambda p: (p.text("------------------------------------------\n"), p.set(font='a')))
+        self.total_start = self.capture(lambda p: p.set(align='right', bold=True))
+        self.total_end = self.capture(lambda p: p.set(bold=False))
+        self.footer = self.capture(lambda p: (p.text("\n\n"), p.cut()))  # Minimum for cutter, then cut
+
+    def capture(self, draw):
+        self.compiler.clear()
+        draw(self.compiler)
+        return self.compiler.output
+
+    def write_header(self, p):
         p.hw('INIT')
         p.set(align='center')
-        
-        # Header (Compacted)
         p.set(bold=True, double_height=True, double_width=True)
         p.text("GATE Central Canteen\n")
         p.set(bold=False, double_height=False, double_width=False, align='center')
         p.text("--------------------------------\n")
-        
-        # Bill Info (Compacted)
         p.set(align='left')
-        # Combined Bill No and Date
+
+    def encode(self, txt):
+        if txt.isascii():
+            return txt.encode('ascii')
+        # Non-ASCII names need escpos' codepage switching, starting from the state INIT leaves
+        p = Dummy(profile=self.profile)
+        p.text(txt)
+        return p.output
+
+    def render(self, data):
         # Bill: 123456  Dt: 2026-01-03
         sys_date = data.get('date', 'N/A')
         date_short = sys_date[:10] if len(sys_date) >= 10 else sys_date
         bill_short = str(data.get('bill_no', 'N/A'))
         if len(bill_short) > 6: bill_short = bill_short[-6:]
-        
-        p.text(f"Bill: {bill_short}  Dt: {date_short}\n")
-        
+
+        lines = [f"Bill: {bill_short}  Dt: {date_short}\n"]
         if 'customer' in data:
             c = data['customer']
             c_name = c.get('name', 'Guest')[:15]
             c_id = c.get('id')
             if c_id:
-                p.text(f"ID: {c_id}  Nm: {c_name}\n")
+                lines.append(f"ID: {c_id}  Nm: {c_name}\n")
             else:
-                p.text(f"Name: {c_name}\n")
-
-        # Items (Small Font)
-        p.set(font='b') 
-        p.text("------------------------------------------\n")
-        
-        # Items Body (Multi-line)
-        items = data.get('items', [])
-        
+                lines.append(f"Name: {c_name}\n")
+        out = [self.header, self.encode(''.join(lines)), self.items_start]
+
         cust_type = ''
         if 'customer' in data and 'type' in data['customer']:
-             cust_type = data['customer']['type'].lower()
-
-        for item in items:
-            name = item.get('name', 'Item')
-            price = item.get('price', 0)
-            
-            p.text(f"Item: {name}\n")
-            
-            # Show Price only for normal customers
-            if cust_type not in ['hostel', 'staff']:
-                 p.text(f"Price: {float(price):.2f}\n")
-            
-            p.text("\n") # Spacing between items
-            
-        p.text("------------------------------------------\n")
-        p.set(font='a') # Reset to normal
-        
-        # Total
-        if cust_type not in ['hostel', 'staff']:
-            total = data.get('total', 0)
-            p.set(align='right', bold=True)
-            p.text(f"Total: Rs. {total}\n")
-            p.set(bold=False)
-            
-        p.text("\n\n") # Minimum for cutter
-        
-        # Cut
-        p.cut()
-        
-        # If dummy, output to console for verification
-        if mode == "DUMMY":
-            print("--- VIRTUAL RECEIPT START ---")
-            print(p.output.decode('utf-8', errors='ignore'))
-            print("--- VIRTUAL RECEIPT END ---")
+            cust_type = data['customer']['type'].lower()
+        # Prices are shown only for normal customers
+        show_prices = cust_type not in ['hostel', 'staff']
+
+        lines = []
+        for item in data.get('items', []):
+            lines.append(f"Item: {item.get('name', 'Item')}\n")
+            if show_prices:
+                lines.append(f"Price: {float(item.get('price', 0)):.2f}\n")
+            lines.append("\n")  # Spacing between items
+        out.append(self.encode(''.join(lines)))
+        out.append(self.items_end)
+
+        if show_prices:
+            out += [self.total_start, self.encode(f"Total: Rs. {data.get('total', 0)}\n"), self.total_end]
+        out.append(self.footer)
+        return b''.join(out)
+
+receipt_template = ReceiptTemplate()
+
+def render_ticket(payload):
+    """ESC/POS bytes for a spooled JSON payload; raises ValueError if it is not a printable receipt."""
+    try:
+        data = json.loads(payload) if isinstance(payload, str) else payload
+        if not isinstance(data, dict):
+            raise ValueError("payload is not a JSON object")
+        return receipt_template.render(data)
+    except ValueError:
+        raise
+    except Exception as e:
+        # Wrong types in the payload (e.g. a non-numeric price), not a printer problem
+        raise ValueError(f"{type(e).__name__}: {e}") from e
+
+def send_ticket(ticket):
+    """Send rendered receipt bytes to the shared printer in a single write; raises if it cannot be printed."""
+    p = printer.get()
+    p._raw(ticket)
+
+    # If dummy, output to console for verification
+    if isinstance(p, Dummy):
+        print("--- VIRTUAL RECEIPT START ---")
+        print(p.output.decode('utf-8', errors='ignore'))
+        print("--- VIRTUAL RECEIPT END ---")
+        p.clear()
+
+def print_receipt(data):
+    send_ticket(render_ticket(data))
+
+# --- Print Spool ---
+class PrintSpool:
+    """SQLite-backed job table: persisted before ack, retried until printed.
+
+    bill_no is unique, so a bill re-sent by the browser (double click,
+    retried fetch) is printed once. Statuses: queued -> printing -> done,
+    or back to queued with a later next_attempt after a printer failure,
+    however long the printer stays away. Only a payload that cannot be
+    rendered ends as error, until it is retried by hand.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        with self.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS print_jobs (
+                    id TEXT PRIMARY KEY,
+                    bill_no TEXT UNIQUE,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_print_jobs_due ON print_jobs (status, next_attempt)")
+            # A job caught mid-print by a crash or restart is printed again
+            conn.execute("UPDATE print_jobs SET status = 'queued' WHERE status = 'printing'")
+        conn.close()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = FULL")
+        return conn
+
+    def run(self, sql, params=()):
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    cur = conn.execute(sql, params)
+                    return cur.fetchall(), cur.rowcount
+            finally:
+                conn.close()
+
+    def submit(self, data):
+        """Spool a receipt; returns (job, created). A known bill_no returns its existing job."""
+        now = time.time()
+        bill_no = data.get('bill_no')
+        bill_no = str(bill_no) if bill_no not in (None, '') else None
+        job_id = uuid.uuid4().hex
+        _, created = self.run("""INSERT OR IGNORE INTO print_jobs (id, bill_no, payload, status, next_attempt, created_at, updated_at)
+                                 VALUES (?, ?, ?, 'queued', ?, ?, ?)""",
+                              (job_id, bill_no, json.dumps(data), now, now, now))
+        if not created:
+            return self.find_bill(bill_no), False
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        rows, _ = self.run("SELECT * FROM print_jobs WHERE id = ?", (job_id,))
+        return job_dict(rows[0]) if rows else None
+
+    def find_bill(self, bill_no):
+        rows, _ = self.run("SELECT * FROM print_jobs WHERE bill_no = ?", (bill_no,))
+        return job_dict(rows[0]) if rows else None
+
+    def list(self, status=None, limit=100):
+        if status:
+            rows, _ = self.run("SELECT * FROM print_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit))
         else:
-            p.close()
+            rows, _ = self.run("SELECT * FROM print_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [job_dict(r) for r in rows]
+
+    def claim_due(self):
+        """Oldest queued job whose backoff has expired, marked printing; None if nothing is due."""
+        with self.lock:
+            conn = self.connect()
+            try:
+                with conn:
+                    row = conn.execute("""SELECT * FROM print_jobs WHERE status = 'queued' AND next_attempt <= ?
+                                          ORDER BY created_at LIMIT 1""", (time.time(),)).fetchone()
+                    if row is not None:
+                        conn.execute("UPDATE print_jobs SET status = 'printing', updated_at = ? WHERE id = ?",
+                                     (time.time(), row['id']))
+                return row
+            finally:
+                conn.close()
+
+    def pending(self):
+        rows, _ = self.run("SELECT COUNT(*) FROM print_jobs WHERE status = 'queued'")
+        return rows[0][0]
+
+    def next_due_in(self):
+        rows, _ = self.run("SELECT MIN(next_attempt) FROM print_jobs WHERE status = 'queued'")
+        if rows[0][0] is None:
+            return None
+        return max(0, rows[0][0] - time.time())
+
+    def mark_done(self, job_id):
+        self.run("UPDATE print_jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def mark_error(self, job_id, attempts, error):
+        """Give up on a job: it stays in the spool as error, and is not retried on its own."""
+        self.run("""UPDATE print_jobs SET status = 'error', attempts = ?, last_error = ?, updated_at = ?
+                    WHERE id = ? AND status = 'printing'""",
+                 (attempts, error, time.time(), job_id))
 
-        return jsonify({"status": "success", "message": "Printed successfully", "mode": mode})
+    def mark_failed(self, job_id, attempts, error):
+        delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        self.run("""UPDATE print_jobs SET status = 'queued', attempts = ?, next_attempt = ?, last_error = ?, updated_at = ?
+                    WHERE id = ? AND status = 'printing'""",
+                 (attempts, time.time() + delay, error, time.time(), job_id))
+        return delay
 
+    def requeue(self, job_id):
+        """Print a job again now (reprint of a done or error job, or skip the remaining backoff)."""
+        _, count = self.run("""UPDATE print_jobs SET status = 'queued', attempts = 0, next_attempt = ?, updated_at = ?
+                               WHERE id = ? AND status != 'printing'""", (time.time(), time.time(), job_id))
+        return count > 0
+
+    def purge(self, job_id=None, status=None, older_than=None):
+        """Delete one job, or all jobs matching status / last updated before older_than. Jobs being printed are kept."""
+        clauses, params = ["status != 'printing'"], []
+        if job_id:
+            clauses.append("id = ?")
+            params.append(job_id)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if older_than is not None:
+            clauses.append("updated_at < ?")
+            params.append(older_than)
+        _, count = self.run(f"DELETE FROM print_jobs WHERE {' AND '.join(clauses)}", params)
+        return count
+
+def job_dict(row):
+    job = dict(row)
+    job.pop('payload', None)
+    return job
+
+spool = PrintSpool(SPOOL_FILE)
+wakeup = threading.Event()
+worker_lock = threading.Lock()
+worker_thread = None
+
+def process_job(job):
+    """Print one claimed job; on a printer failure reschedule it with backoff."""
+    attempts = job['attempts'] + 1
+    # Rendered before the printer is touched: a bad payload fails the same way every time
+    try:
+        ticket = render_ticket(job['payload'])
+    except ValueError as e:
+        spool.mark_error(job['id'], attempts, f"Bad receipt: {e}")
+        print(f"Receipt for bill {job['bill_no']} cannot be printed: {e}")
+        return
+    try:
+        try:
+            send_ticket(ticket)
+        except Exception as e:
+            # Handle may have gone stale (printer power cycled): reopen once before giving up
+            print(f"Print failed, reconnecting: {e}")
+            printer.reset()
+            send_ticket(ticket)
+        spool.mark_done(job['id'])
     except Exception as e:
-        print(f"Print failed: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        printer.reset()
+        delay = spool.mark_failed(job['id'], attempts, str(e))
+        print(f"Print of bill {job['bill_no']} failed (attempt {attempts}), retrying in {delay}s: {e}")
+
+def print_worker():
+    last_cleanup = 0
+    while True:
+        try:
+            if time.time() - last_cleanup > 3600:
+                spool.purge(status='done', older_than=time.time() - SPOOL_RETENTION_DAYS * 86400)
+                last_cleanup = time.time()
+            job = spool.claim_due()
+            if job is not None:
+                process_job(job)
+                continue
+            wait = spool.next_due_in()
+        except Exception as e:
+            # Spool unreadable (disk full, locked): back off rather than spin
+            print(f"Print spool error: {e}")
+            wait = RETRY_MAX_SECONDS
+        wakeup.wait(wait)
+        wakeup.clear()
+
+def ensure_worker():
+    # Started with the service (see __main__); the routes restart it if it died
+    global worker_thread
+    with worker_lock:
+        if worker_thread is None or not worker_thread.is_alive():
+            worker_thread = threading.Thread(target=print_worker, name="print-worker", daemon=True)
+            worker_thread.start()
+
+@app.route('/status', methods=['GET'])
+def status():
+    """Health check endpoint."""
+    ensure_worker()
+    return jsonify({"status": "running", "service": "Canteen Print Service",
+                    "printer": printer.mode, "pending": spool.pending()})
+
+@app.route('/print', methods=['POST'])
+def print_bill():
+    data = request.json
+    if not data:
+        return jsonify({"status": "error", "message": "No JSON payload provided"}), 400
+    try:
+        render_ticket(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Bad receipt: {e}"}), 400
+
+    try:
+        job, created = spool.submit(data)
+    except sqlite3.Error as e:
+        print(f"Print spool error: {e}")
+        return jsonify({"status": "error", "message": f"Could not spool receipt: {e}"}), 500
+
+    ensure_worker()
+    wakeup.set()
+    if not created:
+        return jsonify({"status": "duplicate", "message": "Receipt for this bill already spooled", "job_id": job['id'], "job": job}), 200
+    return jsonify({"status": "queued", "message": "Receipt queued for printing", "job_id": job['id']}), 202
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    status = request.args.get('status')
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify(spool.list(status=status, limit=limit))
+
+@app.route('/jobs', methods=['DELETE'])
+def purge_jobs():
+    # Default: clear printed jobs. ?status=queued drops pending receipts; ?older_than_hours=N limits by age.
+    status = request.args.get('status', 'done')
+    if status == 'all':
+        status = None
+    hours = request.args.get('older_than_hours', type=float)
+    older_than = time.time() - hours * 3600 if hours is not None else None
+    deleted = spool.purge(status=status, older_than=older_than)
+    return jsonify({"status": "success", "deleted": deleted})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = spool.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    if not spool.purge(job_id=job_id):
+        return jsonify({"status": "error", "message": "Unknown job or job is printing"}), 404
+    return jsonify({"status": "success", "deleted": 1})
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    if not spool.requeue(job_id):
+        return jsonify({"status": "error", "message": "Unknown job or job is printing"}), 404
+    ensure_worker()
+    wakeup.set()
+    return jsonify({"status": "queued", "job_id": job_id})
 
 if __name__ == '__main__':
     print("Starting Print Service on port 5001...")
     print("Ensure USB Printer is connected.")
+    debug = True
+    # The debug reloader runs this block in a watcher process too: only the
+    # serving process (WERKZEUG_RUN_MAIN) may claim the USB printer
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ensure_worker()
     # Threaded=True to handle multiple requests if needed, though usually sequential
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    app.run(host='0.0.0.0', port=5001, debug=debug)
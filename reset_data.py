@@ -34,8 +34,26 @@ def reset_data():
         c.execute("UPDATE students SET amount_paid = 0, remaining_amount = 0")
         print(f"Reset balances for {c.rowcount} students.")
 
-        # 6. Delete "sqlite_sequence" for these tables to reset ID counters (Optional)
-        tables = ['bills', 'meals', 'student_transactions', 'staff_transactions']
+        # 6. Clear the rollups and idempotency keys built from the deleted rows
+        #    (tables only exist once the app has migrated this database)
+        c.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        existing = {row[0] for row in c.fetchall()}
+        for t in ['daily_stats', 'monthly_meals', 'bill_keys']:
+            if t in existing:
+                c.execute(f"DELETE FROM {t}")
+                print(f"Cleared {t} ({c.rowcount} rows).")
+        if 'stats_state' in existing:
+            # Live stats in running workers recompute on the next version
+            c.execute("UPDATE stats_state SET version = version + 1 WHERE id = 1")
+
+        # 7. Balances and meal flags changed for everyone: make delta-sync clients refetch them
+        if 'sync_state' in existing:
+            c.execute("UPDATE sync_state SET version = version + 1 WHERE id = 1")
+            c.execute("UPDATE students SET row_version = (SELECT version FROM sync_state WHERE id = 1)")
+            c.execute("UPDATE staff SET row_version = (SELECT version FROM sync_state WHERE id = 1)")
+
+        # 8. Delete "sqlite_sequence" for these tables to reset ID counters (Optional)
+        tables = ['bills', 'meals', 'student_transactions', 'staff_transactions', 'bill_keys']
         for t in tables:
             c.execute("DELETE FROM sqlite_sequence WHERE name=?", (t,))
             
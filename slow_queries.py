@@ -0,0 +1,156 @@
+import os
+import time
+import sqlite3
+import datetime
+import itertools
+import threading
+from collections import deque
+from flask import has_request_context, request
+
+# --- Slow Query Log (opt-in) ---
+# SLOW_QUERY_MS=<n> times every statement run through get_db() connections
+# (execute plus the fetches that drain it) and records those slower than n ms
+# with their parameter shape and EXPLAIN QUERY PLAN. Viewable at
+# /api/admin/slow-queries. Unset (the default) adds no overhead.
+THRESHOLD_MS = float(os.environ['SLOW_QUERY_MS']) if os.environ.get('SLOW_QUERY_MS') else None
+ENABLED = THRESHOLD_MS is not None
+TOP_N = int(os.environ.get('SLOW_QUERY_TOP', 50))
+
+_lock = threading.Lock()
+_recent = deque(maxlen=TOP_N)  # latest slow executions, newest last
+_top = {}                      # sql -> worst execution seen, at most TOP_N statements
+_plans = {}                    # sql -> EXPLAIN QUERY PLAN lines
+
+def param_shape(params):
+    """Types of the bound parameters, without their values."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    return [type(v).__name__ for v in params]
+
+def explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')):
+        return None
+    try:
+        # Plain cursor: must not be profiled itself
+        cur = sqlite3.Cursor(conn)
+        cur.execute('EXPLAIN QUERY PLAN ' + sql, params if params is not None else ())
+        return [row[3] for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        return [f"EXPLAIN failed: {e}"]
+
+def record(conn, sql, params, elapsed_ms, many=False):
+    """Log one slow execution; returns its entry (updated in place while the statement keeps fetching)."""
+    sql = ' '.join(sql.split())
+    with _lock:
+        plan = _plans.get(sql)
+    if plan is None:
+        plan = explain(conn, sql, params[0] if many and params else params)
+    entry = {
+        'sql': sql,
+        'ms': round(elapsed_ms, 3),
+        'params': param_shape(params[0] if many and params else params),
+        'executemany': many,
+        'route': f"{request.method} {request.url_rule.rule}" if has_request_context() and request.url_rule else None,
+        'at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'plan': plan,
+    }
+    with _lock:
+        _plans[sql] = plan
+        _recent.append(entry)
+        worst = _top.get(sql)
+        if worst is not None:
+            entry['count'] = worst['count'] + 1
+            if worst['ms'] >= entry['ms']:
+                worst['count'] = entry['count']
+                return entry
+        else:
+            entry['count'] = 1
+        _top[sql] = entry
+        if len(_top) > TOP_N:
+            evicted = min(_top, key=lambda s: _top[s]['ms'])
+            del _top[evicted]
+            _plans.pop(evicted, None)
+    return entry
+
+def report():
+    with _lock:
+        top = sorted(_top.values(), key=lambda e: e['ms'], reverse=True)
+        return {
+            'threshold_ms': THRESHOLD_MS,
+            'top': [dict(e) for e in top],
+            'recent': [dict(e) for e in reversed(_recent)],
+        }
+
+def reset():
+    with _lock:
+        _recent.clear()
+        _top.clear()
+        _plans.clear()
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that times each statement across execute() and the fetches that drain it."""
+
+    def begin(self, sql, params, many):
+        self._profile = [sql, params, many, 0.0, None]  # sql, params, many, elapsed s, logged entry
+
+    def charge(self, started):
+        prof = getattr(self, '_profile', None)
+        if prof is None:
+            return
+        prof[3] += time.perf_counter() - started
+        ms = prof[3] * 1000
+        if ms < THRESHOLD_MS:
+            return
+        if prof[4] is None:
+            prof[4] = record(self.connection, prof[0], prof[1], ms, prof[2])
+        else:
+            prof[4]['ms'] = round(ms, 3)
+
+    def execute(self, sql, parameters=None):
+        self.begin(sql, parameters, False)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters) if parameters is not None else super().execute(sql)
+        finally:
+            self.charge(started)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Parameter rows may be a generator: peek at the first for the shape, stream the rest
+        rows = iter(seq_of_parameters)
+        first = next(rows, None)
+        self.begin(sql, [first] if first is not None else [], True)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, itertools.chain([first], rows) if first is not None else [])
+        finally:
+            self.charge(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self.charge(started)
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(*args, **kwargs)
+        finally:
+            self.charge(started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self.charge(started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self.charge(started)
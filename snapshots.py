@@ -0,0 +1,216 @@
+import os
+import re
+import time
+import sqlite3
+import datetime
+import threading
+from locks import acquire_lock, release_lock, lock_holder
+
+# --- Database Snapshots ---
+# Consistent copies of the live database made with SQLite's online backup
+# API, a few pages per step. The copy reads from one WAL snapshot held open
+# for the whole run, so it never restarts when bills are committed meanwhile
+# and never takes a lock a writer waits on. Each snapshot is integrity
+# checked before it gets its final name; only the newest SNAPSHOT_KEEP are
+# kept. Workers coordinate through a lock file, so the scheduler running in
+# each gunicorn worker takes one snapshot per interval between them. The
+# scheduler starts with the app, but a database with no snapshots yet only
+# gets its first one SNAPSHOT_FIRST_DELAY_MINUTES later, never at boot.
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')  # default: snapshots/ next to the database
+SNAPSHOT_KEEP = int(os.environ.get('SNAPSHOT_KEEP', 14))
+SNAPSHOT_INTERVAL_HOURS = float(os.environ.get('SNAPSHOT_INTERVAL_HOURS', 24))  # 0 disables the scheduler
+SNAPSHOT_PAGES_PER_STEP = int(os.environ.get('SNAPSHOT_PAGES_PER_STEP', 256))    # 1 MB at 4 KB pages
+SNAPSHOT_STEP_SLEEP_MS = float(os.environ.get('SNAPSHOT_STEP_SLEEP_MS', 1))     # eases I/O between steps
+SNAPSHOT_FIRST_DELAY_MINUTES = float(os.environ.get('SNAPSHOT_FIRST_DELAY_MINUTES', 10))
+SCHEDULER_CHECK_SECONDS = 60
+
+SNAPSHOT_NAME = re.compile(r'canteen_\d{8}_\d{6}\.db')
+LOCK_NAME = 'snapshot.lock'
+
+class SnapshotRunning(Exception):
+    pass
+
+def snapshot_dir(db_file):
+    return SNAPSHOT_DIR or os.path.join(os.path.dirname(os.path.abspath(db_file)), 'snapshots')
+
+def copy_database(db_file, path, pages=SNAPSHOT_PAGES_PER_STEP, sleep_ms=SNAPSHOT_STEP_SLEEP_MS):
+    """Online backup of db_file into path, `pages` per step; returns the page count."""
+    src = sqlite3.connect(db_file)
+    dst = sqlite3.connect(path)
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0].lower() != 'wal':
+            # Outside WAL the read below would hold off every writer for the whole copy
+            raise RuntimeError('Snapshots need the database in WAL mode (DB_JOURNAL_MODE=WAL)')
+        # Pin one read snapshot: steps then copy a single consistent version
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        total = [0]
+
+        def progress(status, remaining, page_count):
+            total[0] = page_count
+            if remaining and sleep_ms:
+                time.sleep(sleep_ms / 1000)
+
+        src.backup(dst, pages=pages, progress=progress)
+        src.rollback()
+        # A standalone file: no -wal / -shm companions needed to open it
+        dst.execute("PRAGMA journal_mode = DELETE")
+        return total[0]
+    finally:
+        dst.close()
+        src.close()
+
+def check_integrity(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return rows == ['ok'], rows
+
+def list_snapshots(db_file):
+    """Completed snapshots, newest first."""
+    directory = snapshot_dir(db_file)
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if SNAPSHOT_NAME.fullmatch(name):
+            stat = os.stat(os.path.join(directory, name))
+            snapshots.append({
+                'name': name,
+                'bytes': stat.st_size,
+                'created_at': datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
+            })
+    return snapshots
+
+def rotate(db_file, keep=SNAPSHOT_KEEP):
+    """Delete all but the newest `keep` snapshots; returns the names removed."""
+    directory = snapshot_dir(db_file)
+    removed = [s['name'] for s in list_snapshots(db_file)[keep:]]
+    for name in removed:
+        os.remove(os.path.join(directory, name))
+    return removed
+
+def take_snapshot(db_file, only_if_due=False):
+    """Copy, check, name and rotate one snapshot; returns its details.
+
+    Raises SnapshotRunning if another process is taking one right now.
+    With only_if_due, returns None instead when another worker took one
+    while this one waited for the lock.
+    """
+    directory = snapshot_dir(db_file)
+    os.makedirs(directory, exist_ok=True)
+    lock = acquire_lock(os.path.join(directory, LOCK_NAME))
+    if lock is None:
+        holder = lock_holder(os.path.join(directory, LOCK_NAME)) or {}
+        raise SnapshotRunning(f"A snapshot is already being taken (pid {holder.get('pid')}, "
+                              f"since {holder.get('started_at')})")
+    try:
+        if only_if_due and not snapshot_due(db_file):
+            return None
+        for name in os.listdir(directory):
+            if name.endswith('.part'):
+                os.remove(os.path.join(directory, name))  # from an interrupted run
+
+        name = datetime.datetime.now().strftime("canteen_%Y%m%d_%H%M%S.db")
+        path = os.path.join(directory, name)
+        partial = path + '.part'
+        started = time.perf_counter()
+        pages = copy_database(db_file, partial)
+        copied = time.perf_counter()
+        ok, problems = check_integrity(partial)
+        if not ok:
+            os.remove(partial)
+            raise RuntimeError(f"Snapshot failed integrity check: {'; '.join(problems[:5])}")
+        os.replace(partial, path)
+        result = {
+            'name': name,
+            'pages': pages,
+            'bytes': os.path.getsize(path),
+            'copy_seconds': round(copied - started, 3),
+            'check_seconds': round(time.perf_counter() - copied, 3),
+            'rotated': rotate(db_file),
+        }
+        print(f"Snapshot written: {name} ({result['bytes']} bytes, {result['copy_seconds']}s)")
+        return result
+    finally:
+        release_lock(lock)
+
+def snapshot_status(db_file):
+    snapshots = list_snapshots(db_file)
+    error = _state['last_error']
+    if error and snapshots and snapshots[0]['created_at'] > _state['last_error_at']:
+        error = None  # a worker has taken one since
+    return {
+        'snapshots': snapshots,
+        'running': lock_holder(os.path.join(snapshot_dir(db_file), LOCK_NAME)),
+        'keep': SNAPSHOT_KEEP,
+        'interval_hours': SNAPSHOT_INTERVAL_HOURS,
+        'last_error': error,
+    }
+
+_state = {'thread': None, 'started_at': time.time(), 'last_error': None, 'last_error_at': None}
+_state_lock = threading.Lock()
+
+def run_snapshot(db_file, only_if_due=False):
+    try:
+        take_snapshot(db_file, only_if_due)
+        _state['last_error'] = None
+        return
+    except SnapshotRunning as e:
+        print(f"Snapshot Skipped: {e}")
+        error = f"Skipped: {e}"
+    except Exception as e:
+        print(f"Snapshot Error: {e}")
+        error = str(e)
+    _state['last_error'] = error
+    _state['last_error_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+
+def run_in_background(db_file):
+    thread = threading.Thread(target=run_snapshot, args=(db_file,), name='db-snapshot', daemon=True)
+    thread.start()
+    return thread
+
+def snapshot_due(db_file):
+    snapshots = list_snapshots(db_file)
+    if not snapshots:
+        # First one: a while after startup, not on the first request after a deploy
+        return time.time() - _state['started_at'] >= SNAPSHOT_FIRST_DELAY_MINUTES * 60
+    newest = os.path.getmtime(os.path.join(snapshot_dir(db_file), snapshots[0]['name']))
+    return time.time() - newest >= SNAPSHOT_INTERVAL_HOURS * 3600
+
+def scheduler(get_db_file):
+    while True:
+        time.sleep(SCHEDULER_CHECK_SECONDS)
+        try:
+            db_file = get_db_file()
+            if snapshot_due(db_file):
+                # Checked again under the lock: another worker may have just taken it
+                run_snapshot(db_file, only_if_due=True)
+        except Exception as e:
+            print(f"Snapshot Scheduler Error: {e}")
+
+def start_scheduler(get_db_file):
+    with _state_lock:
+        if _state['thread'] is None or not _state['thread'].is_alive():
+            _state['started_at'] = time.time()
+            _state['thread'] = threading.Thread(target=scheduler, args=(get_db_file,),
+                                                name='snapshot-scheduler', daemon=True)
+            _state['thread'].start()
+
+def init_app(app, get_db_file):
+    """Start the snapshot scheduler now, and again in every forked worker."""
+    if SNAPSHOT_INTERVAL_HOURS <= 0:
+        return
+    start_scheduler(get_db_file)
+
+    def after_fork():
+        # Threads do not survive a fork, and the lock may have been held mid-fork
+        global _state_lock
+        _state_lock = threading.Lock()
+        _state['thread'] = None
+        start_scheduler(get_db_file)
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=after_fork)
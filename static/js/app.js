@@ -277,25 +277,37 @@ window.exportCSV = function (type) {
 }
 
 window.updateExcel = async function () {
+    const btn = document.querySelector('button[onclick="updateExcel()"]');
+    const originalText = btn.textContent;
+    btn.disabled = true;
     try {
-        const btn = document.querySelector('button[onclick="updateExcel()"]');
-        const originalText = btn.textContent;
-        btn.textContent = "Updating...";
-        btn.disabled = true;
-
+        btn.textContent = "Starting backup...";
         const res = await fetch('/api/backup/excel', { method: 'POST' });
         const data = await res.json();
+        // 409: one is already running, so follow that one instead
+        let job = data.job;
+        if (!job) throw new Error(data.message);
+
+        // The backup runs in the background; poll until it is written
+        while (job.status === 'running') {
+            const pct = job.rows_total ? Math.floor(job.rows_done * 100 / job.rows_total) : 0;
+            btn.textContent = `Backing up... ${pct}%`;
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const poll = await fetch(`/api/backup/excel/${job.id}`, { cache: 'no-store' });
+            job = await poll.json();
+            if (!poll.ok) throw new Error(job.message);
+        }
 
-        if (data.status === 'success') {
-            alert("Success: " + data.message);
+        if (job.status === 'done') {
+            window.location.href = `/api/backup/excel/${job.id}/download`;
         } else {
-            alert("Error: " + data.message);
+            alert("Error: " + job.error);
         }
-        btn.textContent = originalText;
-        btn.disabled = false;
     } catch (e) {
-        alert("Network Error: " + e);
+        alert("Backup Error: " + e.message);
     }
+    btn.textContent = originalText;
+    btn.disabled = false;
 }
 
 async function loadStudents() {
@@ -351,30 +363,101 @@ async function loadOperators() {
     } catch (e) { console.error("Load Operators Fault", e); }
 }
 
+// Live stats pushed by the server (/api/stream/stats); fetching is only the fallback
+let statsStream = null;
+let statsStreamLive = false;
+
+function startStatsStream(onStats) {
+    if (!window.EventSource || statsStream) return;
+    statsStream = new EventSource('/api/stream/stats');
+    statsStream.onmessage = (e) => {
+        statsStreamLive = true;
+        onStats(JSON.parse(e.data));
+    };
+    // EventSource reconnects by itself; until then the callers fetch as before.
+    // With the stream turned off on the server (204) it stays closed and they keep polling.
+    statsStream.onerror = () => { statsStreamLive = false; };
+}
+
 async function loadReports() {
+    startStatsStream(renderReports);
+    if (statsStreamLive) return;
     try {
         const res = await fetch('/api/reports/meals');
-        const stats = await res.json();
-        const div = document.getElementById('admin-meal-stats');
-        if (div) {
-            let html = '<ul>';
-            for (const [meal, count] of Object.entries(stats)) {
-                if (meal === 'revenue') continue;
-                html += `<li><strong>${meal}:</strong> ${count}</li>`;
-            }
-            html += '</ul>';
-            if (stats.revenue !== undefined) {
-                html += `<div style="margin-top: 10px; border-top: 1px solid #ddd; padding-top: 5px;">
-                            <strong>Total Collection:</strong> <span style="color: green; font-weight: bold; font-size: 1.1em;">₹${stats.revenue}</span>
-                         </div>`;
-            }
-            div.innerHTML = html;
-        }
+        renderReports(await res.json());
     } catch (e) { console.error("Load Reports Fault", e); }
 }
 
+function renderReports(stats) {
+    const div = document.getElementById('admin-meal-stats');
+    if (div) {
+        let html = '<ul>';
+        for (const [meal, count] of Object.entries(stats)) {
+            if (meal === 'revenue') continue;
+            html += `<li><strong>${meal}:</strong> ${count}</li>`;
+        }
+        html += '</ul>';
+        if (stats.revenue !== undefined) {
+            html += `<div style="margin-top: 10px; border-top: 1px solid #ddd; padding-top: 5px;">
+                        <strong>Total Collection:</strong> <span style="color: green; font-weight: bold; font-size: 1.1em;">₹${stats.revenue}</span>
+                     </div>`;
+        }
+        div.innerHTML = html;
+    }
+}
+
 // --- Student Report Logic ---
 
+// Filter and cursors of the open report, for "Load more"
+let reportPaging = null;
+
+function reportMealRow(m, studentId) {
+    const mealBtn = (meal) => m[meal] ? `Yes <button onclick="window.deleteMeal(${studentId}, '${m.date}', '${meal}')" class="danger-btn" style="padding: 0 4px; font-size: 0.7em;">&times;</button>` : '-';
+    return `
+        <tr>
+            <td>${formatDate(m.date)}</td>
+            <td>${mealBtn('breakfast')}</td>
+            <td>${mealBtn('lunch')}</td>
+            <td>${mealBtn('dinner')}</td>
+        </tr>
+    `;
+}
+
+function reportMoneyRow(t, studentId) {
+    // For Payment: Date | - | Fee Payment | Amount | Mode
+    const isPay = t.type === 'Payment';
+    const canDelete = t.id !== undefined;
+    return `
+        <tr style="background-color: ${isPay ? '#e8f8f5' : 'inherit'}">
+            <td>${formatDate(t.date)}</td>
+            <td>${t.type === 'Food' ? '#' : ''}</td>
+            <td>${t.item}</td>
+            <td style="color: ${t.color}; font-weight: bold;">₹${t.amount}</td>
+            <td>${t.mode}</td>
+            <td>
+                ${canDelete ? `<button onclick="window.deleteTransaction(${t.id}, ${studentId})" class="danger-btn" style="padding: 2px 8px; font-size: 0.8em;">&times;</button>` : ''}
+            </td>
+        </tr>
+    `;
+}
+
+// Append rows to a report list, then a "Load more" row while there are more pages
+function appendReportRows(tbodyId, rowsHtml, nextCursor, list, colspan) {
+    const tbody = document.getElementById(tbodyId);
+    const more = tbody.querySelector('.load-more-row');
+    if (more) more.remove();
+    tbody.insertAdjacentHTML('beforeend', rowsHtml);
+    if (nextCursor) {
+        tbody.insertAdjacentHTML('beforeend', `
+            <tr class="load-more-row">
+                <td colspan="${colspan}" style="text-align: center;">
+                    <button onclick="window.loadMoreReport('${list}')" class="secondary-btn" style="padding: 4px 12px; font-size: 0.85em;">Load more</button>
+                </td>
+            </tr>
+        `);
+    }
+}
+
 window.viewStudentReport = async function (id, month = '', year = '', startDate = '', endDate = '') {
     // Store ID for filtering
     if (id) document.getElementById('report-student-id').value = id;
@@ -412,6 +495,12 @@ window.viewStudentReport = async function (id, month = '', year = '', startDate
             return;
         }
         const std = data.student;
+        reportPaging = {
+            studentId: std.id,
+            params: params,
+            cursor: data.next_cursor,
+            mealsCursor: data.meals_next_cursor
+        };
 
         // Populate Meta
         document.getElementById('report-meta').innerHTML = `
@@ -430,54 +519,24 @@ window.viewStudentReport = async function (id, month = '', year = '', startDate
             `;
         }
 
-        // Populate Meals
+        // Populate Meals (first page)
         const mealTbody = document.getElementById('report-meals-list');
         mealTbody.innerHTML = '';
         if (data.meals.length === 0) {
             mealTbody.innerHTML = '<tr><td colspan="4">No meals recorded.</td></tr>';
         } else {
-            data.meals.forEach(m => {
-                const bBtn = m.breakfast ? `Yes <button onclick="window.deleteMeal(${std.id}, '${m.date}', 'breakfast')" class="danger-btn" style="padding: 0 4px; font-size: 0.7em;">&times;</button>` : '-';
-                const lBtn = m.lunch ? `Yes <button onclick="window.deleteMeal(${std.id}, '${m.date}', 'lunch')" class="danger-btn" style="padding: 0 4px; font-size: 0.7em;">&times;</button>` : '-';
-                const dBtn = m.dinner ? `Yes <button onclick="window.deleteMeal(${std.id}, '${m.date}', 'dinner')" class="danger-btn" style="padding: 0 4px; font-size: 0.7em;">&times;</button>` : '-';
-
-                mealTbody.innerHTML += `
-                    <tr>
-                        <td>${formatDate(m.date)}</td>
-                        <td>${bBtn}</td>
-                        <td>${lBtn}</td>
-                        <td>${dBtn}</td>
-                    </tr>
-                `;
-            });
+            appendReportRows('report-meals-list', data.meals.map(m => reportMealRow(m, std.id)).join(''),
+                data.meals_next_cursor, 'meals', 4);
         }
 
-        // Populate Money
+        // Populate Money (first page)
         const moneyTbody = document.getElementById('report-money-list');
         moneyTbody.innerHTML = '';
         if (data.transactions.length === 0) {
             moneyTbody.innerHTML = '<tr><td colspan="6">No transactions found.</td></tr>';
         } else {
-            // Header needs update to support mixed types? 
-            // Current header: Date | Bill No | Item | Amount | Mode
-            // For Payment: Date | - | Fee Payment | Amount | Mode
-            data.transactions.forEach(t => {
-                const isPay = t.type === 'Payment';
-                const canDelete = t.id !== undefined;
-
-                moneyTbody.innerHTML += `
-                    <tr style="background-color: ${isPay ? '#e8f8f5' : 'inherit'}">
-                        <td>${formatDate(t.date)}</td>
-                        <td>${t.type === 'Food' ? '#' : ''}</td>
-                        <td>${t.item}</td>
-                        <td style="color: ${t.color}; font-weight: bold;">₹${t.amount}</td>
-                        <td>${t.mode}</td>
-                        <td>
-                            ${canDelete ? `<button onclick="window.deleteTransaction(${t.id}, ${id})" class="danger-btn" style="padding: 2px 8px; font-size: 0.8em;">&times;</button>` : ''}
-                        </td>
-                    </tr>
-                `;
-            });
+            appendReportRows('report-money-list', data.transactions.map(t => reportMoneyRow(t, id)).join(''),
+                data.next_cursor, 'transactions', 6);
         }
 
         // Show Modal
@@ -490,6 +549,40 @@ window.viewStudentReport = async function (id, month = '', year = '', startDate
     }
 }
 
+// Next page of meals or transactions for the open report
+window.loadMoreReport = async function (list) {
+    const paging = reportPaging;
+    if (!paging) return;
+    const isMeals = list === 'meals';
+    const cursor = isMeals ? paging.mealsCursor : paging.cursor;
+    if (!cursor) return;
+
+    const params = paging.params.concat([`${isMeals ? 'meals_cursor' : 'cursor'}=${encodeURIComponent(cursor)}`]);
+    try {
+        const res = await fetch(`/api/reports/student/${paging.studentId}?${params.join('&')}`);
+        const data = await res.json();
+        if (!res.ok) {
+            alert("Error: " + (data.error || "Failed to load report"));
+            return;
+        }
+        // The report was closed or reopened for someone else meanwhile
+        if (paging !== reportPaging) return;
+
+        if (isMeals) {
+            paging.mealsCursor = data.meals_next_cursor;
+            appendReportRows('report-meals-list', data.meals.map(m => reportMealRow(m, paging.studentId)).join(''),
+                data.meals_next_cursor, 'meals', 4);
+        } else {
+            paging.cursor = data.next_cursor;
+            appendReportRows('report-money-list', data.transactions.map(t => reportMoneyRow(t, paging.studentId)).join(''),
+                data.next_cursor, 'transactions', 6);
+        }
+    } catch (e) {
+        console.error(e);
+        alert("Report Error: " + e.message);
+    }
+}
+
 // Open Filter Modal
 window.openFilterModal = function () {
     document.getElementById('filter-modal').classList.remove('hidden');
@@ -659,7 +752,10 @@ function initOperator() {
         document.getElementById('op-username-display').textContent = opName;
     }
 
+    startStatsStream(renderLiveStats);
     loadOperatorData();
+    // Cheap in steady state: the server only returns what changed
+    setInterval(loadOperatorData, 30000);
 
     // Event Listeners for search
     const searchInput = document.getElementById('bill-student-search');
@@ -775,6 +871,31 @@ function recalculateHostelTotal() {
     document.getElementById('bill-amount').value = total;
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    // randomUUID needs a secure context; plain-http LAN counters fall back to this
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2) + Math.random().toString(36).slice(2);
+}
+
+// POST one bill, retrying network errors and 5xx responses with the same
+// Idempotency-Key: the server returns the original bill_no for a repeat.
+async function postBill(bill, attempts = 3) {
+    const key = newIdempotencyKey();
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const res = await fetch('/api/bill', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+                body: JSON.stringify(bill)
+            });
+            if (res.status < 500 || attempt >= attempts) return await res.json();
+        } catch (err) {
+            if (attempt >= attempts) throw err;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+    }
+}
+
 window.generateBill = async function () {
     const userType = document.querySelector('input[name="userType"]:checked').value;
     // For manual types, amount is total; for hostel, amount is calculated per meal.
@@ -836,22 +957,16 @@ window.generateBill = async function () {
                 else if (meal === 'Dinner') amount = 40;
             }
 
-            // 1. Create Bill in Backend
-            const res = await fetch('/api/bill', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    user_type: userType,
-                    student_id: studentId,
-                    guest_name: guestName,
-                    meal_type: meal,
-                    amount: amount,
-                    payment_mode: mode,
-                    operator_id: currentOperatorId
-                })
+            // 1. Create Bill in Backend (retried with the same key, so a blip never bills twice)
+            const data = await postBill({
+                user_type: userType,
+                student_id: studentId,
+                guest_name: guestName,
+                meal_type: meal,
+                amount: amount,
+                payment_mode: mode,
+                operator_id: currentOperatorId
             });
-
-            const data = await res.json();
             if (data.status !== 'success') {
                 alert(`Error creating bill for ${meal}: ${data.message}`);
                 continue;
@@ -916,15 +1031,37 @@ window.generateBill = async function () {
     } catch (e) { console.error(e); alert("Network Error during billing"); }
 }
 
+// Roster cache for delta sync: only rows changed since the last version are fetched
+const operatorRoster = {
+    students: new Map(), studentVersion: 0, date: null,
+    staff: new Map(), staffVersion: 0
+};
+
+function applyRosterDelta(map, rows, deleted, full) {
+    if (full) map.clear();
+    (deleted || []).forEach(id => map.delete(id));
+    (rows || []).forEach(row => map.set(row.id, row));
+    return full || rows.length > 0 || (deleted || []).length > 0;
+}
+
 async function loadOperatorData() {
     try {
-        // Load Students
-        const res = await fetch('/api/students');
-        const data = await res.json();
+        // Load Students (delta since last known version)
+        const res = await fetch(`/api/students?since=${operatorRoster.studentVersion}`, { cache: 'no-store' });
+        let data = await res.json();
+        // Meal flags are per-day: start over when the server date rolls
+        if (operatorRoster.date && data.date !== operatorRoster.date) {
+            const resFull = await fetch('/api/students?since=0', { cache: 'no-store' });
+            data = await resFull.json();
+        }
+        const studentsChanged = applyRosterDelta(operatorRoster.students, data.students, data.deleted, data.full);
+        operatorRoster.studentVersion = data.version;
+        operatorRoster.date = data.date;
+
         const datalist = document.getElementById('student-list');
-        if (datalist) {
+        if (datalist && studentsChanged) {
             datalist.innerHTML = '';
-            data.forEach(s => {
+            operatorRoster.students.forEach(s => {
                 const opt = document.createElement('option');
                 // Improved format: Name (Regd: X) [ID: Y]
                 const regdStr = s.regd_no ? `Regd: ${s.regd_no}` : 'No Regd';
@@ -934,16 +1071,21 @@ async function loadOperatorData() {
         }
 
         // Load Staff (New)
-        const resStaff = await fetch('/api/staff');
+        const resStaff = await fetch(`/api/staff?since=${operatorRoster.staffVersion}`, { cache: 'no-store' });
         const staffData = await resStaff.json();
+        const staffChanged = applyRosterDelta(operatorRoster.staff, staffData.staff, staffData.deleted, staffData.full);
+        operatorRoster.staffVersion = staffData.version;
+
         const staffList = document.getElementById('staff-list');
-        if (staffList) {
+        if (staffList && staffChanged) {
             staffList.innerHTML = '';
-            staffData.forEach(s => {
-                const opt = document.createElement('option');
-                opt.value = `${s.name} (${s.dept || 'Staff'}) [ID: ${s.id}]`;
-                staffList.appendChild(opt);
-            });
+            [...operatorRoster.staff.values()]
+                .sort((a, b) => a.name.localeCompare(b.name))
+                .forEach(s => {
+                    const opt = document.createElement('option');
+                    opt.value = `${s.name} (${s.dept || 'Staff'}) [ID: ${s.id}]`;
+                    staffList.appendChild(opt);
+                });
         }
         loadLiveStats();
     } catch (e) { console.error("Load Op Data Error", e); }
@@ -961,26 +1103,31 @@ function handleStudentSearch(e) {
 }
 
 async function loadLiveStats() {
+    // Streamed stats are already current
+    if (statsStreamLive) return;
     try {
         const res = await fetch('/api/reports/meals');
-        const stats = await res.json();
-        const div = document.getElementById('op-meal-stats');
-        if (div) {
-            let html = '';
-            for (const [meal, count] of Object.entries(stats)) {
-                if (meal === 'revenue') continue;
-                html += `<div>${meal}: ${count}</div>`;
-            }
-            if (stats.revenue !== undefined) {
-                html += `<div style="margin-top: 10px; border-top: 1px solid #ccc; padding-top: 5px; font-weight: bold;">
-                            Total: <span style="color: #2ecc71;">₹${stats.revenue}</span>
-                          </div>`;
-            }
-            div.innerHTML = html || 'No meals served.';
-        }
+        renderLiveStats(await res.json());
     } catch (e) { console.error("Stats Error", e); }
 }
 
+function renderLiveStats(stats) {
+    const div = document.getElementById('op-meal-stats');
+    if (div) {
+        let html = '';
+        for (const [meal, count] of Object.entries(stats)) {
+            if (meal === 'revenue') continue;
+            html += `<div>${meal}: ${count}</div>`;
+        }
+        if (stats.revenue !== undefined) {
+            html += `<div style="margin-top: 10px; border-top: 1px solid #ccc; padding-top: 5px; font-weight: bold;">
+                        Total: <span style="color: #2ecc71;">₹${stats.revenue}</span>
+                      </div>`;
+        }
+        div.innerHTML = html || 'No meals served.';
+    }
+}
+
 window.selectOption = function (inputId, value, btnElement) {
     // defined global to be accessible from onclick
     document.getElementById(inputId).value = value;